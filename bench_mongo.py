@@ -0,0 +1,145 @@
+"""
+Benchmark for the MongoDB pool split in storage.MongoStorage, run against a local replica set.
+
+Seeds a throwaway database, then measures `cfg_get` latency (the lookup every
+message makes for its prefix) while `mr` counts, searches and stats rebuild
+reads run alongside it. It runs once with one shared pool and once with a
+separate analytics pool reading from secondaries, and prints latency
+percentiles and per-pool checkout waits for both.
+
+Start a local replica set, e.g.:
+    mkdir -p /tmp/rs0-0 /tmp/rs0-1
+    mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0-0 --fork --logpath /tmp/rs0-0.log
+    mongod --replSet rs0 --port 27018 --dbpath /tmp/rs0-1 --fork --logpath /tmp/rs0-1.log
+    mongosh --port 27017 --eval 'rs.initiate({_id: "rs0", members: [{_id: 0, host: "localhost:27017"}, {_id: 1, host: "localhost:27018"}]})'
+Then:
+    python bench_mongo.py "mongodb://localhost:27017,localhost:27018/?replicaSet=rs0"
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, UTC
+from typing import List
+
+from storage import MongoStorage
+
+DB_NAME = "ladynight_bench"
+WORDS = ["spam", "raid", "slur", "nsfw", "alt", "scam", "flood", "ping", "ad", "evasion"]
+
+
+def _time(dt: datetime) -> str:
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+async def seed(store: MongoStorage, guilds: List[int], records: int):
+    """`records` warns, verifies and jails per guild, spread over the last year."""
+    now = datetime.now(UTC)
+    for gid in guilds:
+        await store.cfg_set(gid, "prefix", "ln.")
+        warns, verifies, jails = [], [], []
+        for _ in range(records):
+            at = now - timedelta(seconds=random.randint(0, 365 * 86400))
+            user, mod = str(random.randint(1, records // 4 + 1)), str(random.randint(1, 20))
+            reason = " ".join(random.choices(WORDS, k=3))
+            warns.append({"guild_id": gid, "user_id": user, "mod_id": mod, "reason": reason, "time": _time(at)})
+            verifies.append({"guild_id": gid, "user_id": user, "mod_id": mod, "reason": "ok", "time": _time(at), "wait_seconds": random.uniform(10, 3600)})
+            jails.append({
+                "guild_id": gid, "user_id": user, "jailer": mod, "reason": reason, "roles": "[]",
+                "jailed_at": _time(at), "freed_at": _time(at + timedelta(hours=random.randint(1, 72))),
+                "free_by": mod, "free_reason": "served", "expires_at": None
+            })
+        for kind, docs in (("warn", warns), ("verify", verifies), ("jail", jails)):
+            for i in range(0, len(docs), 1000):
+                await store.insert_records(kind, docs[i:i + 1000])
+
+
+async def interactive(store: MongoStorage, guilds: List[int], stop: asyncio.Event, latencies: List[float]):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await store.cfg_get(random.choice(guilds), "prefix")
+        latencies.append(time.perf_counter() - started)
+
+
+async def analytical(store: MongoStorage, guilds: List[int], stop: asyncio.Event, passes: List[int]):
+    since = _time(datetime.now(UTC) - timedelta(days=30))
+    while not stop.is_set():
+        gid = random.choice(guilds)
+        await store.count_by_mod("warn", gid, "time", "mod_id", since)
+        await store.search_records(gid, random.sample(WORDS, 2), limit=10)
+        # '~' sorts after every timestamp: the whole history, like a stats rebuild
+        await store.guild_activity(gid, "~")
+        passes[0] += 1
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f}ms"
+
+
+async def run_mode(args, name: str, analytics_pool_size: int, guilds: List[int]):
+    store = MongoStorage(
+        args.uri, db_name=DB_NAME, pool_size=args.pool_size, analytics_pool_size=analytics_pool_size,
+        max_staleness=args.max_staleness, compressors=args.compressors, analytics_compressors=args.analytics_compressors
+    )
+    try:
+        # Warm up connections so the first checkouts don't count connection setup
+        await asyncio.gather(*(store.cfg_get(gid, "prefix") for gid in guilds))
+        stop = asyncio.Event()
+        latencies: List[float] = []
+        passes = [0]
+        workers = [asyncio.create_task(interactive(store, guilds, stop, latencies)) for _ in range(args.interactive)]
+        workers += [asyncio.create_task(analytical(store, guilds, stop, passes)) for _ in range(args.analytical)]
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*workers)
+
+        q = statistics.quantiles(latencies, n=100)
+        print(f"\n== {name} ==")
+        print(f"cfg_get: {len(latencies) / args.seconds:.0f} ops/s • p50 {_ms(q[49])} • p99 {_ms(q[98])} • max {_ms(max(latencies))}")
+        print(f"analytical passes: {passes[0]}")
+        for pool, stats in store.pool_stats().items():
+            print(
+                f"pool {pool}: checkout wait p50 {stats['wait_p50_ms']:.2f}ms • p99 {stats['wait_p99_ms']:.2f}ms • "
+                f"max {stats['wait_max_ms']:.2f}ms • {stats['checkouts']} checkouts • {stats['failed']} failed • {stats['open']} open"
+            )
+    finally:
+        await store.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("uri", help="replica set connection string")
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--records", type=int, default=20000, help="records of each kind per guild")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--interactive", type=int, default=50, help="concurrent cfg_get loops")
+    parser.add_argument("--analytical", type=int, default=8, help="concurrent report loops")
+    parser.add_argument("--pool-size", type=int, default=20, help="interactive (or shared) pool size")
+    parser.add_argument("--analytics-pool-size", type=int, default=5)
+    parser.add_argument("--max-staleness", type=int, default=90)
+    parser.add_argument("--compressors", default="")
+    parser.add_argument("--analytics-compressors", default="zlib")
+    parser.add_argument("--no-seed", action="store_true", help=f"reuse the data already in {DB_NAME}")
+    parser.add_argument("--keep", action="store_true", help=f"don't drop {DB_NAME} afterwards")
+    args = parser.parse_args()
+
+    guilds = list(range(1, args.guilds + 1))
+    admin = MongoStorage(args.uri, db_name=DB_NAME, analytics_pool_size=0)
+    try:
+        if not args.no_seed:
+            await admin.mongo_client.drop_database(DB_NAME)
+            await admin.setup()
+            print(f"Seeding {args.guilds} guilds x {args.records} records of each kind...")
+            await seed(admin, guilds, args.records)
+
+        await run_mode(args, "shared pool (primary reads)", 0, guilds)
+        await run_mode(args, "separate analytics pool (secondary reads)", args.analytics_pool_size, guilds)
+    finally:
+        if not args.keep:
+            await admin.mongo_client.drop_database(DB_NAME)
+        await admin.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1 @@
+"""Bot extensions, loaded from settings.EXTENSIONS and reloadable with `ln.reload`."""
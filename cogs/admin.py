@@ -0,0 +1,126 @@
+"""Bot owner tools: live extension reload, startup timing and event loop profiling."""
+
+import discord
+from discord.ext import commands
+from datetime import datetime, UTC
+import importlib
+import io
+import time
+
+import helpers
+from profiling import sample_profile
+from settings import LOOP_SLOW_MS, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS
+
+
+class Admin(commands.Cog):
+    """Commands that act on the whole bot process rather than one guild, so they are owner-only."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    # ====== RELOAD ======
+
+    @commands.command(name="reload")
+    @commands.is_owner()
+    async def reload(self, ctx: commands.Context, extension: str = None):
+        """
+        Swap in new code without reconnecting. Caches, pending confirmations, leases
+        and scheduled jail releases live on the bot and are kept.
+        Usage: ln.reload (helpers + every extension) / ln.reload <extension>
+        """
+        lines = []
+        if extension:
+            names = [extension if extension.startswith("cogs.") else f"cogs.{extension}"]
+        else:
+            names = list(self.bot.extensions)
+            # Shared helpers first, so the extensions below import the new versions
+            started = time.monotonic()
+            try:
+                importlib.reload(helpers)
+            except Exception as e:
+                return await ctx.reply(f"❌ helpers: {type(e).__name__}: {e}\nNo extension was reloaded.")
+            lines.append(f"✅ helpers ({(time.monotonic() - started) * 1000:.0f}ms)")
+
+        for name in names:
+            started = time.monotonic()
+            try:
+                if name in self.bot.extensions:
+                    # On failure discord.py keeps the previously loaded version running
+                    await self.bot.reload_extension(name)
+                else:
+                    await self.bot.load_extension(name)
+            except commands.ExtensionError as e:
+                lines.append(f"❌ {name}: {e.__cause__ or e}")
+                continue
+            lines.append(f"✅ {name} ({(time.monotonic() - started) * 1000:.0f}ms)")
+
+        await ctx.reply("🔄 Reload\n" + "\n".join(lines))
+
+    # ====== PROFILING ======
+
+    @commands.group(name="profile", invoke_without_command=True)
+    @commands.is_owner()
+    async def profile(self, ctx: commands.Context):
+        """Startup phase timings, database pool waits, event loop lag and recent slow callbacks. Usage: ln.profile [slow | sample <seconds>]"""
+        embed = discord.Embed(title="🩺 Event Loop", color=discord.Color.blurple())
+        timings = ctx.bot.startup_timings
+        if timings:
+            embed.add_field(name="Startup", value="\n".join(f"{phase}: {seconds:.2f}s" for phase, seconds in timings.items()), inline=False)
+
+        pools = ctx.bot.store.pool_stats()
+        if pools:
+            lines = [
+                f"**{name}** wait p50 / p99 / max {p['wait_p50_ms']:.1f} / {p['wait_p99_ms']:.1f} / {p['wait_max_ms']:.1f} ms • "
+                f"{p['in_use']}/{p['open']} in use • {p['checkouts']} checkouts • {p['failed']} failed"
+                for name, p in pools.items()
+            ]
+            embed.add_field(name="Database pools", value="\n".join(lines), inline=False)
+
+        mon = ctx.bot.loop_monitor
+        if mon is None:
+            embed.add_field(name="Loop monitor", value="Off. Start the bot with `LOOP_MONITOR=1` to enable it. `ln.profile sample` works either way.", inline=False)
+            return await ctx.reply(embed=embed)
+
+        embed.add_field(name="Lag p50 / p99 / max", value=f"{mon.lag_percentile(50) * 1000:.1f} / {mon.lag_percentile(99) * 1000:.1f} / {mon.max_lag * 1000:.1f} ms", inline=False)
+        embed.add_field(name="Slow callbacks", value=f"{mon.slow_count} over {LOOP_SLOW_MS}ms", inline=True)
+        recent = list(mon.slow_callbacks)[-5:]
+        if recent:
+            lines = [f"`{e.at.strftime('%H:%M:%S')}` **{e.duration * 1000:.0f}ms** {e.label}" for e in reversed(recent)]
+            embed.add_field(name="Most recent", value="\n".join(lines), inline=False)
+        await ctx.reply(embed=embed)
+
+    @profile.command(name="slow")
+    @commands.is_owner()
+    async def profile_slow(self, ctx: commands.Context):
+        """Attach the stacks of the recent slow callbacks."""
+        mon = ctx.bot.loop_monitor
+        if mon is None or not mon.slow_callbacks:
+            return await ctx.reply("✅ No slow callbacks recorded.")
+        text = "\n\n".join(
+            f"{e.at.strftime('%Y-%m-%d %H:%M:%S')}  {e.duration * 1000:.0f}ms  {e.label}\n{''.join(e.stack)}"
+            for e in reversed(mon.slow_callbacks)
+        )
+        await ctx.reply(file=discord.File(io.BytesIO(text.encode()), filename="slow-callbacks.txt"))
+
+    @profile.command(name="sample")
+    @commands.is_owner()
+    async def profile_sample(self, ctx: commands.Context, seconds: int = PROFILE_DEFAULT_SECONDS):
+        """Sample every thread's stack for a while and attach folded stacks (flamegraph.pl / speedscope)."""
+        if ctx.bot.profiling:
+            return await ctx.reply("⏳ A profile is already running.")
+        seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+        ctx.bot.profiling = True
+        try:
+            await ctx.reply(f"🔬 Sampling for {seconds}s...")
+            folded, samples = await sample_profile(seconds)
+        finally:
+            ctx.bot.profiling = False
+        filename = f"profile-{datetime.now(UTC).strftime('%Y%m%d-%H%M%S')}.folded"
+        await ctx.reply(
+            f"🔬 {samples} samples over {seconds}s. Open in https://www.speedscope.app or run `flamegraph.pl {filename} > flame.svg`.",
+            file=discord.File(io.BytesIO(folded.encode()), filename=filename)
+        )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Admin(bot))
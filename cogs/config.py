@@ -0,0 +1,71 @@
+"""Guild configuration commands (prefix, roles, channels, record sharing)."""
+
+import discord
+from discord.ext import commands
+
+from helpers import cfg_set, cfg_get
+from settings import DEFAULT_PREFIX
+
+
+class Config(commands.Cog):
+    """Per-guild settings stored through bot.store."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        """Initializes default config and prefix on join."""
+        print(f"Joined new guild: {guild.name} ({guild.id}). Setting default prefix.")
+        # Set default prefix
+        await cfg_set(self.bot, guild.id, "prefix", DEFAULT_PREFIX)
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def setprefix(self, ctx: commands.Context, prefix: str):
+        """Sets the custom command prefix for this server."""
+        await cfg_set(ctx.bot, ctx.guild.id, "prefix", prefix)
+        await ctx.reply(f"✅ Command prefix set to: `{prefix}`")
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def setrole(self, ctx: commands.Context, key: str, role: discord.Role):
+        await cfg_set(ctx.bot, ctx.guild.id, key, str(role.id))
+        await ctx.reply(f"✅ Role `{key}` set as {role.mention}")
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def setchannel(self, ctx: commands.Context, key: str, ch: discord.TextChannel):
+        await cfg_set(ctx.bot, ctx.guild.id, key, str(ch.id))
+        await ctx.reply(f"✅ Channel `{key}` set as {ch.mention}")
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def sharerecords(self, ctx: commands.Context, mode: str = None):
+        """
+        Opt in to cross-server history: this server's records become visible to other
+        sharing servers (`r global`, join alerts) and theirs to this one. Usage: ln.sharerecords on|off
+        """
+        mode = (mode or "").lower()
+        if mode not in ("on", "off"):
+            current = await cfg_get(ctx.bot, ctx.guild.id, "share_records") or "off"
+            return await ctx.reply(f"📘 Record sharing is **{current}**. Usage: `{ctx.prefix}sharerecords on|off`")
+        await cfg_set(ctx.bot, ctx.guild.id, "share_records", mode)
+        # Every cached summary was built from the old set of sharing servers
+        ctx.bot.user_summaries.clear()
+        await ctx.reply(f"✅ Record sharing turned **{mode}**.")
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def showconfig(self, ctx: commands.Context):
+        keys=["prefix","to_verify","normie","prisoner","mod","jail_notice","announce","log-channel","share_records","AUTO_ANNOUNCE_CHANNEL_ID"]
+        txt=""
+        for k in keys:
+            v=await cfg_get(ctx.bot, ctx.guild.id, k)
+            txt+=f"**{k}** → {v}\n"
+
+        await ctx.reply(f"⚙️ Config for {ctx.guild.name}\n{txt}")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Config(bot))
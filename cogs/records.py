@@ -0,0 +1,465 @@
+"""Record views and edits: `r` (warn / all / search), `d` and `e`."""
+
+import discord
+from discord.ext import commands
+from datetime import datetime, timedelta, UTC
+from typing import Optional, List
+
+from helpers import get_prefix, get_deleted_count, increment_deleted_count, fetch_raw_record, confirm_action, records_changed, sharing_guilds, user_summary, cfg_get
+from settings import DEFAULT_PREFIX, RECORD_ICONS, RECORD_PAGE_SIZE, RECORD_PAGE_CHARS, SEARCH_PAGE_SIZE, SEARCH_MAX_SINCE_DAYS
+from storage import search_terms, StorageUnavailable
+
+
+async def render_record_pages(bot: commands.Bot, gid: int, member: discord.Member) -> List[discord.Embed]:
+    """Builds every `r all` page for a user, rewrites the serial-number map and caches the pages."""
+    uid = str(member.id)
+    generation = bot.record_views.generation
+
+    records = []
+    
+    # Fetch all record types
+    # Record ids come back from storage as opaque strings
+    
+    # Warnings
+    for doc in await bot.store.list_records("warn", gid, uid):
+        records.append({
+            "type": "warn",
+            "mod": doc.get('mod_id'),
+            "reason": doc.get('reason'),
+            "time": doc.get('time'),
+            "rowid": doc.get('_id')
+        })
+
+    # Verifications
+    for doc in await bot.store.list_records("verify", gid, uid):
+        records.append({
+            "type": "verify",
+            "mod": doc.get('mod_id'),
+            "reason": doc.get('reason'),
+            "time": doc.get('time'),
+            "rowid": doc.get('_id')
+        })
+
+    # Jail/Free
+    for doc in await bot.store.list_records("jail", gid, uid):
+        # Jail record
+        if doc.get("jailed_at"):
+            records.append({
+                "type": "jail",
+                "mod": doc.get('jailer'),
+                "reason": doc.get('reason'),
+                "time": doc.get('jailed_at'),
+                "rowid": doc.get('_id')
+            })
+        # Free record (uses the same _id as the jail record)
+        if doc.get("freed_at"):
+            records.append({
+                "type": "free",
+                "mod": doc.get('free_by'),
+                "reason": doc.get('free_reason'),
+                "time": doc.get('freed_at'),
+                "rowid": doc.get('_id')
+            })
+
+    if not records:
+        await bot.store.clear_record_map(gid, uid)
+        return []
+
+    # Sort by time (time is stored as a comparable string)
+    try:
+        records.sort(key=lambda x: x["time"]) 
+    except Exception as e:
+        print(f"Sorting error: {e}") 
+        
+    # 2. Build pages and populate the all_records table
+    pages_lines: List[List[str]] = [[]]
+    page_chars = 0
+    map_documents = []
+    for i, r in enumerate(records, start=1):
+        # Prepare mapping for the temp collection
+        map_documents.append({
+            "id": i, 
+            "action_type": r['type'], 
+            "record_rowid": r['rowid'] # Storage record id string
+        })
+
+        # Build display line
+        emoji = RECORD_ICONS.get(r["type"], "📁")
+        mod_mention = f"<@{r['mod']}>" if r["mod"] else "Unknown"
+        reason = r["reason"] or "No reason"
+        
+        # Display cleanup for edited reasons
+        if reason.startswith("` E ` "):
+            reason = reason[6:] + " **(E)**"
+            
+        line = (
+            f"`{i:02d}.` {emoji} **{r['type'].title()}** — {r['time']}\n"
+            f" Reason: {reason}\n Moderator: {mod_mention}\n"
+        )
+        # Start a new page when this one is full (by count or by embed size)
+        if pages_lines[-1] and (len(pages_lines[-1]) >= RECORD_PAGE_SIZE or page_chars + len(line) > RECORD_PAGE_CHARS):
+            pages_lines.append([])
+            page_chars = 0
+        pages_lines[-1].append(line)
+        page_chars += len(line) + 1
+        
+    # Replace this user's map in one go
+    await bot.store.replace_record_map(gid, uid, map_documents)
+    
+    # Get deleted counter
+    deleted_count = await get_deleted_count(bot, gid, uid)
+
+    pages = []
+    for number, lines in enumerate(pages_lines, start=1):
+        desc = "\n".join(lines)
+        embed = discord.Embed(
+            title=f"🗃️ Criminal Record – All Actions",
+            description=f"**User:** {member.mention}\n\n{desc}",
+            color=discord.Color.blurple()
+        )
+        embed.set_footer(text=f"Page {number}/{len(pages_lines)} • Deleted actions count: {deleted_count}")
+        pages.append(embed)
+
+    bot.record_views.put(gid, uid, pages, generation)
+    return pages
+
+
+def parse_since(token: str) -> Optional[str]:
+    """
+    Parses a `since` filter: week / month / year, a day count like 90d,
+    or a date (YYYY-MM-DD). Returns the stored time string format, or None.
+    Raises ValueError for a day count over SEARCH_MAX_SINCE_DAYS.
+    """
+    now = datetime.now(UTC)
+    token = token.lower()
+    periods = {"week": 7, "month": 30, "year": 365}
+    if token in periods:
+        return (now - timedelta(days=periods[token])).strftime('%Y-%m-%d %H:%M:%S')
+    if token.endswith("d") and token[:-1].isdigit():
+        # Length first: huge numbers overflow timedelta (or int parsing itself)
+        if len(token) > len(str(SEARCH_MAX_SINCE_DAYS)) + 1 or int(token[:-1]) > SEARCH_MAX_SINCE_DAYS:
+            raise ValueError(f"since {token} is too far back")
+        return (now - timedelta(days=int(token[:-1]))).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        return datetime.strptime(token, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def history_lines(bot: commands.Bot, summary: dict, gids) -> List[str]:
+    """One line per guild of a cross-guild summary, e.g. '**Guild** — ⚠️ 2 • ⚔️ 1 (jailed now) • last 2025-01-01'."""
+    lines = []
+    for gid in gids:
+        counts = summary["guilds"][gid]
+        guild = bot.get_guild(gid)
+        parts = [f"{RECORD_ICONS[kind]} {counts[kind]}" for kind in ("warn", "jail", "verify") if counts[kind]]
+        if counts["jailed_now"]:
+            parts.append("🔒 jailed now")
+        lines.append(f"**{guild.name if guild else gid}** — {' • '.join(parts)} • last {(counts['last'] or '?')[:10]}")
+    return lines
+
+
+class Records(commands.Cog):
+    """Moderation history lookups and corrections."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @commands.group(name="r",invoke_without_command=True)
+    async def record(self, ctx): 
+        prefix = await get_prefix(ctx.bot, ctx.message)
+        await ctx.reply(f"Use: `{prefix}r warn` / `jail` / `free` / `verify` / `all` / `search` / `global`")
+
+    @record.command(name="warn")
+    async def record_warn(self, ctx: commands.Context, member: discord.Member):
+        """View a user's warning records. Usage: ln.r warn @user"""
+        gid = ctx.guild.id
+        uid = str(member.id)
+
+        # Fetch all warnings, ordered by time
+        rows = await self.bot.store.list_records("warn", gid, uid, sort_field="time")
+
+        if not rows:
+            return await ctx.reply(f"No warning records found for {member.mention}.")
+
+        lines = []
+        for i, doc in enumerate(rows, start=1):
+            mod_id = doc.get("mod_id")
+            reason = doc.get("reason")
+            time_str = doc.get("time") 
+
+            edited_marker = ""
+            # The new edit format is "` E ` reason"
+            if reason and reason.startswith("` E ` "):
+                edited_marker = " **(E)**"
+                reason = reason[6:] 
+
+            lines.append(
+                f"`{i:02d}.` **{RECORD_ICONS['warn']} Warn**{edited_marker}\n"
+                f"**• Time:** {time_str}\n"
+                f"**• Moderator:** <@{mod_id}>\n"
+                f"**• Reason:** {reason or 'No reason provided.'}\n"
+                f"— — — — — — — — — — — — — — —"
+            )
+
+        description = "\n".join(lines)
+
+        embed = discord.Embed(
+            title=f"⚠️ Warning Record for {member.name}",
+            description=description,
+            color=discord.Color.orange()
+        )
+        await ctx.reply(embed=embed)
+
+    @record.command(name="all")
+    async def urecord_all(self, ctx: commands.Context, member: discord.Member = None, page: int = 1):
+        """View a user's complete record, and prepare map for deletion: ln.r all @user [page]"""
+        if not member:
+            prefix = await get_prefix(ctx.bot, ctx.message)
+            return await ctx.reply(f"📘 Usage: `{prefix}r all @user [page]`")
+
+        gid = ctx.guild.id
+        uid = str(member.id)
+
+        # Repeat views are served from the rendered page cache (no DB round trips)
+        embed = self.bot.record_views.get(gid, uid, page)
+        if embed is None:
+            pages = await render_record_pages(self.bot, gid, member)
+            if not pages:
+                return await ctx.reply(f"No records found for {member.mention}.")
+            embed = pages[min(max(page, 1), len(pages)) - 1]
+        await ctx.reply(embed=embed)
+
+    @record.command(name="search")
+    @commands.has_permissions(kick_members=True)
+    async def record_search(self, ctx: commands.Context, *, query: str = None):
+        """Search record reasons in this server. Usage: ln.r search <terms> [since] [page:N]"""
+        usage = f"🔎 Usage: `{ctx.prefix}r search <terms> [week|month|year|90d|YYYY-MM-DD] [page:N]`"
+        if not query:
+            return await ctx.reply(usage)
+
+        # Trailing `page:N` and `since` tokens are options, everything else is search terms
+        tokens = query.split()
+        page = 1
+        if tokens and tokens[-1].lower().startswith("page:") and tokens[-1][5:].isdigit():
+            page = max(1, int(tokens.pop()[5:]))
+        try:
+            since = parse_since(tokens[-1]) if len(tokens) > 1 else None
+        except ValueError:
+            return await ctx.reply(f"❌ `since` can go back at most {SEARCH_MAX_SINCE_DAYS} days.\n{usage}")
+        since_token = tokens.pop() if since else ""
+
+        terms = search_terms(" ".join(tokens))
+        if not terms:
+            return await ctx.reply(usage)
+
+        gid = ctx.guild.id
+        offset = (page - 1) * SEARCH_PAGE_SIZE
+        # One extra row tells us whether there is a next page without counting every match
+        hits = await self.bot.store.search_records(gid, terms, since=since, limit=SEARCH_PAGE_SIZE + 1, offset=offset)
+        has_next = len(hits) > SEARCH_PAGE_SIZE
+        hits = hits[:SEARCH_PAGE_SIZE]
+
+        if not hits:
+            return await ctx.reply(f"No records matching **{' '.join(terms)}**" + (" on that page." if page > 1 else "."))
+
+        lines = []
+        for i, doc in enumerate(hits, start=offset + 1):
+            kind = doc["kind"]
+            if kind == "jail":
+                mod, time_str = doc.get("jailer"), doc.get("jailed_at")
+                reason = doc.get("reason") or "No reason"
+                if doc.get("free_reason"):
+                    reason += f" *(freed: {doc.get('free_reason')})*"
+            else:
+                mod, time_str = doc.get("mod_id"), doc.get("time")
+                reason = doc.get("reason") or "No reason"
+            reason = reason.replace("` E ` ", "")
+
+            lines.append(
+                f"`{i:02d}.` {RECORD_ICONS.get(kind, '📁')} **{kind.title()}** — {time_str}\n"
+                f" User: <@{doc.get('user_id')}> • Moderator: <@{mod}>\n"
+                f" Reason: {reason}\n"
+            )
+
+        embed = discord.Embed(
+            title=f"🔎 Record Search – {' '.join(terms)}",
+            description="\n".join(lines),
+            color=discord.Color.blurple()
+        )
+        footer = f"Page {page}"
+        if since:
+            footer += f" • Since {since[:10]}"
+        if has_next:
+            footer += f" • Next: {ctx.prefix}r search {' '.join(tokens + [since_token] if since else tokens)} page:{page + 1}"
+        embed.set_footer(text=footer)
+        await ctx.reply(embed=embed)
+
+    @record.command(name="global")
+    @commands.has_permissions(kick_members=True)
+    async def record_global(self, ctx: commands.Context, user: discord.User = None):
+        """A user's records in every server that shares records. Usage: ln.r global @user"""
+        if user is None:
+            return await ctx.reply(f"📘 Usage: `{ctx.prefix}r global @user`")
+        # Reciprocal: only servers that share their own records can look at others'
+        if ctx.guild.id not in await sharing_guilds(ctx.bot):
+            return await ctx.reply(f"🔒 This server does not share its records. An admin can opt in with `{ctx.prefix}sharerecords on`.")
+
+        summary = await user_summary(ctx.bot, user.id)
+        if not summary["total"]:
+            return await ctx.reply(f"✅ {user.mention} has no records in any sharing server.")
+
+        embed = discord.Embed(
+            title=f"🌐 Network history: {user}",
+            description="\n".join(history_lines(ctx.bot, summary, summary["guilds"])),
+            color=discord.Color.blurple()
+        )
+        recent = []
+        for doc in summary["recent"]:
+            guild = ctx.bot.get_guild(int(doc["guild_id"]))
+            recent.append(f"{RECORD_ICONS.get(doc['kind'], '•')} `{(doc.get('time') or '?')[:10]}` **{guild.name if guild else doc['guild_id']}** — {doc.get('reason') or 'No reason'}")
+        embed.add_field(name="Most recent", value="\n".join(recent)[:1024], inline=False)
+        embed.set_footer(text=f"{summary['total']} records in {len(summary['guilds'])} servers")
+        await ctx.reply(embed=embed)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        """Posts a joining member's records from other sharing servers to the log channel."""
+        gid = member.guild.id
+        if member.bot:
+            return
+        try:
+            if gid not in await sharing_guilds(self.bot):
+                return
+            summary = await user_summary(self.bot, member.id)
+        except StorageUnavailable:
+            return
+        others = [g for g in summary["guilds"] if g != gid]
+        if not others:
+            return
+
+        log_ch = await cfg_get(self.bot, gid, "log-channel")
+        channel = member.guild.get_channel(int(log_ch)) if log_ch and log_ch.isdigit() else None
+        if not channel:
+            return
+        embed = discord.Embed(
+            title="🌐 Joining member has records elsewhere",
+            description=f"{member.mention} ({member.id})\n" + "\n".join(history_lines(self.bot, summary, others)),
+            color=discord.Color.orange(),
+            timestamp=datetime.now(UTC)
+        )
+        prefix = await cfg_get(self.bot, gid, "prefix") or DEFAULT_PREFIX
+        embed.set_footer(text=f"Details: {prefix}r global {member.id}")
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException:
+            pass
+
+    @commands.command(name="d") 
+    @commands.has_permissions(administrator=True)
+    async def delete_record(self, ctx: commands.Context, number: int, member: discord.Member):
+        """Delete a record entry using the ln.r all serial number. Usage: ln.d <number> @member"""
+        gid = ctx.guild.id
+        uid = str(member.id)
+
+        # 1. Lookup the record details from the temporary map
+        target_doc = await self.bot.store.get_record_map_entry(gid, uid, number)
+
+        if not target_doc:
+            return await ctx.reply("❌ Invalid record number, or please run `ln.r all @user` **first**.")
+
+        record_type = target_doc['action_type']
+        record_id = target_doc['record_rowid']
+
+        if record_type == "free":
+             return await ctx.reply("❌ Cannot delete **free** actions directly. Delete the corresponding **jail** record (same ID) if it is the correct action to remove.")
+
+        # 2. Only source record kinds can be deleted
+        if record_type not in ("warn", "verify", "jail"):
+            return await ctx.reply(f"❌ Cannot delete record type: **{record_type}**.")
+
+        # 3. Fetch the raw record details for the confirmation embed
+        # Note: Using the base type 'jail' for 'jail' action
+        record_details = await fetch_raw_record(self.bot, gid, record_id, record_type)
+        if not record_details:
+             return await ctx.reply("❌ Error fetching source record data.")
+
+        # 4. Confirmation Check
+        if not await confirm_action(ctx, "delete", number, member, record_details):
+            return
+
+        # 5. If confirmed, delete the record from its original source collection
+        deleted = await self.bot.store.delete_record(record_type, gid, record_id)
+
+        if not deleted:
+            return await ctx.reply("❌ Error: Could not delete the record from the database.")
+
+        # 6. Increment the deleted counter
+        await increment_deleted_count(self.bot, gid, uid)
+        records_changed(self.bot, gid, uid)
+        self.bot.mod_stats.mark_stale(gid)
+
+        # 7. Cleanup the map and confirm
+        await self.bot.store.clear_record_map(gid, uid) # Reset entire map table
+
+        await ctx.reply(f"✅ Record #{number} (Type: **{record_type}**) deleted for {member.mention}. Map reset.")
+
+    @commands.command(name="e")
+    @commands.has_permissions(administrator=True)
+    async def edit_record(self, ctx: commands.Context, number: int, member: discord.Member, *, new_reason: str):
+        """Edit a record entry using the ln.r all serial number, prefixing the reason with '` E ` '. Usage: ln.e <number> @member <new_reason>"""
+        gid = ctx.guild.id
+        uid = str(member.id)
+
+        # 1. Map to source record kinds and determine field names
+        source_map = {
+            "warn": {"kind": "warn", "field": "reason"},
+            "jail": {"kind": "jail", "field": "reason"}, 
+            "free": {"kind": "jail", "field": "free_reason"}, 
+            "verify": {"kind": "verify", "field": "reason"},
+        }
+
+        # 2. Lookup the record details from the temporary map
+        target_doc = await self.bot.store.get_record_map_entry(gid, uid, number)
+
+        if not target_doc:
+            return await ctx.reply("❌ Invalid record number. Please run `ln.r all @user` first.")
+
+        record_type = target_doc['action_type']
+        record_id = target_doc['record_rowid']
+
+        if record_type not in source_map:
+            return await ctx.reply(f"❌ Cannot edit record type: **{record_type}**.")
+
+        source = source_map[record_type]
+
+        # 3. Fetch the raw record details for the confirmation embed
+        # Use the base type 'jail' for both 'jail' and 'free'
+        base_type = 'jail' if record_type in ['jail', 'free'] else record_type
+        record_details = await fetch_raw_record(self.bot, gid, record_id, base_type)
+        if not record_details:
+            return await ctx.reply("❌ Error fetching source record data.")
+
+        # 4. Confirmation Check
+        if not await confirm_action(ctx, "edit", number, member, record_details, new_reason):
+            return
+
+        # 5. Apply the requested prefix '` E ` ' to the new reason
+        final_reason = f"` E ` {new_reason}"
+
+        # 6. Perform the UPDATE operation
+        updated = await self.bot.store.update_record(source["kind"], gid, record_id, {source["field"]: final_reason})
+
+        if not updated:
+            return await ctx.reply("❌ Error: Could not update the record reason.")
+
+        # 7. Cleanup the map and confirm
+        await self.bot.store.clear_record_map(gid, uid)
+        records_changed(self.bot, gid, uid)
+
+        await ctx.reply(f"✅ Record #{number} (Type: **{record_type}**) reason edited for {member.mention}.\n"
+                        f"**New Reason:** {new_reason}")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Records(bot))
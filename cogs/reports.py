@@ -0,0 +1,228 @@
+"""Moderator activity reports (`mr`), guild health stats (`stats`) and the optional automatic weekly report."""
+
+import discord
+from discord.ext import commands, tasks
+from datetime import datetime, timedelta, UTC
+
+from helpers import get_prefix, format_duration
+from settings import AUTO_REPORT_CHANNEL_ID, STATS_REFRESH_INTERVAL
+from storage import StorageUnavailable
+
+HOUR_BARS = "▁▂▃▄▅▆▇█"
+# Tied to the report channel: only processes that can see it contend for the lease
+WEEKLY_REPORT_LEASE = f"weekly_report:{AUTO_REPORT_CHANNEL_ID}"
+
+
+class Reports(commands.Cog):
+    """Per-moderator action counts and guild moderation stats."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        if AUTO_REPORT_CHANNEL_ID:
+            self.auto_weekly_report.start()
+        self.stats_refresh.start()
+
+    async def cog_unload(self):
+        self.auto_weekly_report.cancel()
+        self.stats_refresh.cancel()
+
+    # ====== GUILD STATS ======
+
+    @commands.command(name="stats")
+    @commands.has_permissions(kick_members=True)
+    async def stats(self, ctx: commands.Context):
+        """Repeat offenders, warn → jail escalation, jail durations and busiest hours. Usage: ln.stats"""
+        stats = self.bot.mod_stats.get(ctx.guild.id)
+        if stats is None:
+            # Only until the background job has built this guild once
+            await ctx.reply("⏳ Building stats for this server for the first time...")
+            stats = await self.bot.mod_stats.refresh(ctx.guild.id, only_if_needed=True)
+
+        def pct(rate):
+            return f"{rate * 100:.1f}%" if rate is not None else "—"
+
+        totals = stats.totals
+        median = stats.median_jail_seconds
+        embed = discord.Embed(title=f"📈 Moderation Stats – {ctx.guild.name}", color=discord.Color.purple())
+        embed.add_field(
+            name="Actions",
+            value=f"⚠️ {totals['warn']} warns • 🔒 {totals['jail']} jails • ✅ {totals['free']} frees • ✅ {totals['verify']} verifies",
+            inline=False
+        )
+        embed.add_field(name="Repeat offenders", value=f"{pct(stats.repeat_offender_rate)}\n{stats.repeat_offenders} of {len(stats.offences)} users", inline=True)
+        embed.add_field(name="Warn → jail", value=f"{pct(stats.escalation_rate)}\n{len(stats.escalated)} of {len(stats.warned)} warned users", inline=True)
+        embed.add_field(
+            name="Median jail",
+            value=f"{format_duration(median) if median is not None else '—'}\n{len(stats.jail_durations)} closed • {len(stats.open_jails)} open",
+            inline=True
+        )
+
+        peak = max(stats.by_hour)
+        bars = "".join(HOUR_BARS[h * (len(HOUR_BARS) - 1) // peak] if peak else HOUR_BARS[0] for h in stats.by_hour)
+        busiest = sorted(range(24), key=lambda h: stats.by_hour[h], reverse=True)[:3] if peak else []
+        embed.add_field(
+            name="Actions by hour (UTC)",
+            value=f"`{bars}`\n`00    06    12    18   23`" + (f"\nBusiest: {', '.join(f'{h:02d}:00' for h in busiest)}" if busiest else ""),
+            inline=False
+        )
+        embed.set_footer(text="Updated live • rebuilt from history every few hours")
+        await ctx.reply(embed=embed)
+
+    @tasks.loop(seconds=STATS_REFRESH_INTERVAL)
+    async def stats_refresh(self):
+        """Builds or rebuilds the stats of each guild that needs it, one guild at a time."""
+        for guild in list(self.bot.guilds):
+            if not self.bot.mod_stats.needs_refresh(guild.id):
+                continue
+            try:
+                await self.bot.mod_stats.refresh(guild.id, only_if_needed=True)
+            except StorageUnavailable:
+                return
+            except Exception as e:
+                print(f"❌ Stats refresh failed for {guild.id}: {e}")
+
+    @stats_refresh.before_loop
+    async def before_stats_refresh(self):
+        await self.bot.wait_until_ready()
+
+    # ====== MODREPORT COMMAND (Placeholder - requires substantial async rewrite) ======
+    # The ModReport logic is complex and relies on aggregating data over a time period,
+    # which requires MongoDB aggregation pipelines or multiple async queries.
+    # This section provides a basic structure but the full implementation is outside the scope of
+    # a typical single response, so it uses simpler queries.
+
+    @commands.command(name="mr")
+    @commands.has_permissions(administrator=True)
+    async def modreport(self, ctx: commands.Context, period: str = "week"):
+        """Generate a Mods Performance Report (week, month, or year)."""
+        gid = ctx.guild.id
+        now = datetime.now(UTC)
+
+        if period == "week":
+            start = now - timedelta(days=7); title_period = "Weekly"
+        elif period == "month":
+            start = now - timedelta(days=30); title_period = "Monthly"
+        elif period == "year":
+            start = now - timedelta(days=365); title_period = "Yearly"
+        else:
+            return await ctx.reply("❌ Use: `ln.mr week` / `month` / `year`")
+
+        # Time must be converted to string format for comparison with stored data
+        start_time_str = start.strftime('%Y-%m-%d %H:%M:%S')
+
+        async def get_mod_ids_by_time(kind, time_col, mod_col):
+            """Fetches per-moderator action counts within the period."""
+            return await self.bot.store.count_by_mod(kind, gid, time_col, mod_col, start_time_str)
+
+        # Get counts for all action types
+        warn_counts = await get_mod_ids_by_time("warn", "time", "mod_id")
+        verify_counts = await get_mod_ids_by_time("verify", "time", "mod_id")
+
+        # Jail and Free are in the same collection but different fields
+        jail_counts = await get_mod_ids_by_time("jail", "jailed_at", "jailer")
+        free_counts = await get_mod_ids_by_time("jail", "freed_at", "free_by")
+
+        # Bans / kicks done outside the bot, attributed from the audit log
+        external_counts = await self.bot.store.count_mod_actions(gid, start_time_str)
+
+        all_mods_ids = set(warn_counts.keys()) | set(verify_counts.keys()) | set(jail_counts.keys()) | set(free_counts.keys()) | set(external_counts.keys())
+
+        if not all_mods_ids:
+            return await ctx.reply(f"No moderator actions in the last {title_period.lower()}.")
+
+        total_j = sum(jail_counts.values()); total_f = sum(free_counts.values())
+        total_v = sum(verify_counts.values()); total_w = sum(warn_counts.values())
+        total_all = total_j + total_f + total_v + total_w
+
+        data = []
+        for mid in all_mods_ids:
+            j = jail_counts.get(mid, 0)
+            f = free_counts.get(mid, 0)
+            v = verify_counts.get(mid, 0)
+            w = warn_counts.get(mid, 0)
+            b = external_counts.get(mid, {}).get("ban", 0)
+            k = external_counts.get(mid, {}).get("kick", 0)
+
+            mod = ctx.guild.get_member(int(mid))
+            name = mod.mention if mod else f"Unknown({mid})"
+
+            jp = (j / total_j * 100) if total_j else 0
+            fp = (f / total_f * 100) if total_f else 0
+            vp = (v / total_v * 100) if total_v else 0
+            wp = (w / total_w * 100) if total_w else 0
+            tot = (j + f + v + w) / total_all * 100 if total_all else 0
+
+            data.append((name, j, f, v, w, b, k, jp, fp, vp, wp, tot))
+
+        data.sort(key=lambda x: (x[1] + x[2] + x[3] + x[4] + x[5] + x[6]), reverse=True)
+
+        # ... (Embed generation from original code remains mostly the same) ...
+
+        lines=[]
+        for d in data:
+            name,j,f,v,w,b,k,jp,fp,vp,wp,tot=d
+            lines.append(
+                f"{name}\n"
+                f"{j} | {f} | {v} | {w} | {b} | {k} | "
+                f"{jp:.2f}% | {fp:.2f}% | {vp:.2f}% | {wp:.2f}% | {tot:.2f}%"
+            )
+
+        prefix = await get_prefix(ctx.bot, ctx.message)
+
+        embed=discord.Embed(
+            title=f"Mods Performance Report – {title_period}",
+            description=f"**Moderator**\n`{prefix}j | {prefix}f | {prefix}v | {prefix}w | ban | kick | {prefix}j_% | {prefix}f_% | {prefix}v_% | {prefix}w_% | total_%`\n\n"+"\n\n".join(lines),
+            color=discord.Color.purple()
+        )
+        embed.set_footer(text=f"Generated on {now.strftime('%Y-%m-%d %H:%M UTC')}")
+        await ctx.send(embed=embed)
+
+    # ====== AUTO WEEKLY REPORT (OPTIONAL) ======
+    @tasks.loop(hours=1)
+    async def auto_weekly_report(self):
+        leases = self.bot.leases
+        ch = self.bot.get_channel(AUTO_REPORT_CHANNEL_ID)
+        if ch is None:
+            # Another shard's channel (or not cached yet): leave the lease to a process that can post
+            if WEEKLY_REPORT_LEASE in leases.names:
+                await leases.unregister(WEEKLY_REPORT_LEASE)
+            return
+        if WEEKLY_REPORT_LEASE not in leases.names:
+            leases.register(WEEKLY_REPORT_LEASE)
+            await leases.renew(WEEKLY_REPORT_LEASE)
+
+        now = datetime.now(UTC)
+        if now.weekday() == 0:  # Monday
+            # The date is claimed in storage, fenced by our lease token, before anything is posted:
+            # at most one report per Monday across processes, reloads and restarts
+            if await leases.claim_run(WEEKLY_REPORT_LEASE, now.date().isoformat()):
+                try:
+                    await ch.send("📊 Auto Weekly Mod Report")
+                    # Create a fake Context object for the modreport command
+                    # This is a bit of a hack, but necessary for task-triggered commands
+                    class FakeContext:
+                        def __init__(self, bot, guild, channel):
+                            self.bot = bot
+                            self.guild = guild
+                            self.channel = channel
+                            self.author = bot.user # The bot is the author of the report
+                            self.message = type("FakeMessage", (), {"content": "", "guild": guild})()
+                        async def send(self, *args, **kwargs):
+                            return await self.channel.send(*args, **kwargs)
+                        async def reply(self, *args, **kwargs):
+                            return await self.channel.send(*args, **kwargs)
+
+                    fake_ctx = FakeContext(self.bot, ch.guild, ch)
+                    await self.modreport(fake_ctx, "week")
+                except Exception as e:
+                    print("Auto report failed:", e)
+
+    @auto_weekly_report.before_loop
+    async def before_auto_weekly_report(self):
+        await self.bot.wait_until_ready()
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Reports(bot))
@@ -0,0 +1,229 @@
+"""Join gate and verification queue: on_member_join, `v`, `v bulk`, `v queue`."""
+
+import discord
+from discord.ext import commands
+from datetime import datetime, timedelta, UTC
+import asyncio
+from typing import List, Tuple
+
+from helpers import cfg_get, format_time, parse_time, format_duration, log_action, records_changed
+from settings import AUTO_REPORT_CHANNEL_ID, RECORD_ICONS, VERIFY_BULK_MAX, VERIFY_SWAP_INTERVAL
+from storage import StorageUnavailable
+
+
+async def approve_members(ctx: commands.Context, members: List[discord.Member], reason: str) -> Tuple[List[discord.Member], List[Tuple[discord.Member, str]]]:
+    """
+    Swaps to_verify -> normie for each member (one role edit each, paced by
+    VERIFY_SWAP_INTERVAL), then writes all verify records in one batch.
+    Returns (verified, [(failed member, error)]).
+    """
+    gid = ctx.guild.id
+    tv = await cfg_get(ctx.bot, gid, "to_verify")
+    normie = await cfg_get(ctx.bot, gid, "normie")
+    tv_role = ctx.guild.get_role(int(tv)) if tv and tv.isdigit() else None
+    normie_role = ctx.guild.get_role(int(normie)) if normie and normie.isdigit() else None
+    if not normie_role:
+        return [], [(m, "normie role is not set") for m in members]
+
+    queued = {d["user_id"]: d for d in await ctx.bot.store.dequeue_verifications(gid, [str(m.id) for m in members])}
+    now = datetime.now(UTC)
+    documents, verified, failed = [], [], []
+
+    for i, member in enumerate(members):
+        if i:
+            await asyncio.sleep(VERIFY_SWAP_INTERVAL)
+        roles = [r for r in member.roles if r != ctx.guild.default_role and r != tv_role]
+        if normie_role not in roles:
+            roles.append(normie_role)
+        try:
+            await member.edit(roles=roles, reason=f"Verified by {ctx.author.name}")
+        except discord.HTTPException as e:
+            failed.append((member, str(e)))
+            # Put them back so they are not lost from the queue
+            if str(member.id) in queued:
+                await ctx.bot.store.enqueue_verification(gid, str(member.id), queued[str(member.id)]["joined_at"])
+            continue
+
+        entry = queued.get(str(member.id))
+        joined_at = parse_time(entry["joined_at"]) if entry else member.joined_at
+        documents.append({
+            "guild_id": gid,
+            "user_id": str(member.id),
+            "mod_id": str(ctx.author.id),
+            "reason": reason,
+            "time": format_time(now),
+            "wait_seconds": (now - joined_at).total_seconds() if joined_at else None
+        })
+        verified.append(member)
+
+    await ctx.bot.store.insert_records("verify", documents)
+    for member in verified:
+        records_changed(ctx.bot, gid, member.id, action="verify", at=now)
+    return verified, failed
+
+
+class Verification(commands.Cog):
+    """New member verification."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        # ... (Logic for on_member_join updated to use MongoDB/async) ...
+        botid = self.bot.user.id
+        gid = member.guild.id
+
+        # Use async helpers
+        announce_ch = await cfg_get(self.bot, gid, "announce")
+        pr = await cfg_get(self.bot, gid, "prisoner")
+        tv = await cfg_get(self.bot, gid, "to_verify")
+        modrole = await cfg_get(self.bot, gid, "mod")
+
+        ch = self.bot.get_channel(int(announce_ch)) if announce_ch and announce_ch.isdigit() else None
+        ah = self.bot.get_channel(int(AUTO_REPORT_CHANNEL_ID)) if AUTO_REPORT_CHANNEL_ID and str(AUTO_REPORT_CHANNEL_ID).isdigit() else None
+
+        # --- NEW ACCOUNT AGE CHECK ---
+        six_months_ago = datetime.now(UTC) - timedelta(days=182)
+        account_created_at = member.created_at.replace(tzinfo=UTC)
+        is_new_account = account_created_at > six_months_ago
+
+        if not is_new_account:
+            return 
+
+        # 1️⃣ Check active jail record: RE-JAIL ESCAPED PRISONER
+        key = (gid, member.id)
+        roles_to_restore = self.bot.jailed_users_cache.get(key)
+
+        if roles_to_restore and pr:
+            prisoner_role_id = int(pr)
+            prisoner = member.guild.get_role(prisoner_role_id)
+
+            if prisoner:
+                await member.add_roles(prisoner)
+                # Remove to_verify role if it exists
+                if tv and (vr := member.guild.get_role(int(tv))):
+                    await member.remove_roles(vr, reason="Re-jailed")
+
+            if ah: 
+                em = discord.Embed(
+                    title="🚨 Escaped Prisoner Recaptured!",
+                    color=discord.Color.dark_red(),
+                    description=f"{member.mention} was re-jailed automatically."
+                )
+                await ah.send(embed=em)
+            return
+
+        # 2️⃣ New Member: Add 'to_verify' role and send welcome notice
+        if tv:
+            role = member.guild.get_role(int(tv))
+            if role:
+                try:
+                    await member.add_roles(role)
+                except discord.Forbidden:
+                    pass
+                # Track them in the pending verification queue
+                joined_at = member.joined_at or datetime.now(UTC)
+                await self.bot.store.enqueue_verification(gid, str(member.id), format_time(joined_at))
+
+        if not ch: 
+            return
+
+        # Send Welcome/Verification Alert embed
+        # ... (Embed creation omitted for brevity, same as original) ...
+        em_welcome = discord.Embed(
+            title="Verification Alert!!",
+            color=discord.Color.blue(),
+            description=(
+                         f"Hello New Joiner 👋 \n Welcome to ---- drum roll ----\n\n > The MHK Cult 🎀 Server 🎉\n\n Please answer the following prompts and wait for a staff member to reach out to you:\n -> Are you new to this platform? (Discord)\n -> Are you new to this server? If not... Include why you left / got kicked out / banned.\n *please read server rules and answer the next one*\n -> Do you agree to follow server rules to the *best of your ability*?"
+            )
+        )
+        em_welcome.set_thumbnail(url=member.display_avatar.url)
+        em_welcome.set_footer(text=f"Joined at {member.joined_at.strftime('%Y-%m-%d %H:%M:%S')}")
+        await ch.send(embed=em_welcome)
+
+        # Notify mods about verification 
+        if modrole and (mod_role_obj := member.guild.get_role(int(modrole))):
+            em_notify = discord.Embed(
+                title="📩 New Member Waiting for Verification",
+                color=discord.Color.blue(),
+                description=f"{mod_role_obj.mention}, {member.mention} has joined and awaits verification."
+            )
+            if ah: await ah.send(content=mod_role_obj.mention, embed=em_notify)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        """Leaving drops them from the pending verification queue."""
+        try:
+            await self.bot.store.dequeue_verifications(member.guild.id, [str(member.id)])
+        except StorageUnavailable:
+            pass
+
+    @commands.group(name="v", invoke_without_command=True)
+    @commands.has_permissions(manage_roles=True)
+    async def verify(self, ctx: commands.Context, member: discord.Member = None, *, reason: str = "Verified"):
+        """Verify a member (to_verify -> normie). Usage: ln.v @user [reason] / ln.v bulk <N> / ln.v queue"""
+        if not member:
+            return await ctx.reply(f"📘 Usage: `{ctx.prefix}v @user [reason]` / `{ctx.prefix}v bulk <N> [reason]` / `{ctx.prefix}v queue`")
+
+        verified, failed = await approve_members(ctx, [member], reason)
+        if failed:
+            return await ctx.reply(f"❌ Could not verify {member.mention}: {failed[0][1]}")
+
+        await log_action(ctx, action_type="verify", member=member, reason=reason, log_emoji=RECORD_ICONS["verify"])
+        await ctx.reply(f"✅ {member.mention} verified.")
+
+    @verify.command(name="bulk")
+    @commands.has_permissions(manage_roles=True)
+    async def verify_bulk(self, ctx: commands.Context, count: int, *, reason: str = "Verified (bulk)"):
+        """Verify the N longest-waiting members in the queue. Usage: ln.v bulk <N> [reason]"""
+        count = max(1, min(count, VERIFY_BULK_MAX))
+        gid = ctx.guild.id
+
+        pending = await self.bot.store.pending_verifications(gid, count)
+        members, gone = [], []
+        for entry in pending:
+            member = ctx.guild.get_member(int(entry["user_id"]))
+            (members if member else gone).append(member or entry["user_id"])
+        # Members who left without on_member_remove being seen (e.g. while offline)
+        if gone:
+            await self.bot.store.dequeue_verifications(gid, gone)
+
+        if not members:
+            return await ctx.reply("📭 The verification queue is empty.")
+
+        status = await ctx.reply(f"⏳ Verifying {len(members)} member(s)...")
+        verified, failed = await approve_members(ctx, members, reason)
+
+        text = f"✅ Verified **{len(verified)}** member(s)."
+        if failed:
+            text += "\n❌ Failed: " + ", ".join(f"{m.mention} ({err})" for m, err in failed[:10])
+        if gone:
+            text += f"\n🧹 Removed {len(gone)} member(s) who already left."
+        await status.edit(content=text)
+
+    @verify.command(name="queue")
+    @commands.has_permissions(manage_roles=True)
+    async def verify_queue(self, ctx: commands.Context):
+        """Show verification queue depth, the longest waits and time-to-verify."""
+        gid = ctx.guild.id
+        now = datetime.now(UTC)
+
+        depth = await self.bot.store.count_pending_verifications(gid)
+        oldest = await self.bot.store.pending_verifications(gid, 10)
+        waits = sorted(await self.bot.store.verify_waits(gid, format_time(now - timedelta(days=7))))
+
+        embed = discord.Embed(title="📥 Verification Queue", color=discord.Color.blue())
+        embed.add_field(name="Waiting", value=str(depth), inline=True)
+        if waits:
+            median = waits[len(waits) // 2]
+            p90 = waits[min(len(waits) - 1, int(len(waits) * 0.9))]
+            embed.add_field(name="Time to verify (7d)", value=f"median {format_duration(median)} • p90 {format_duration(p90)} • n={len(waits)}", inline=False)
+        if oldest:
+            lines = [f"<@{e['user_id']}> — waiting {format_duration((now - parse_time(e['joined_at'])).total_seconds())}" for e in oldest]
+            embed.add_field(name="Longest waiting", value="\n".join(lines), inline=False)
+        await ctx.reply(embed=embed)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Verification(bot))
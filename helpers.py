@@ -0,0 +1,360 @@
+"""
+Helpers shared by the bot core and its extensions (cogs/).
+
+`ln.reload` reloads this module before the extensions, so fixes here go live
+without a restart. Long-lived state does not belong here (see state.py).
+"""
+import discord
+from discord.ext import commands
+from datetime import datetime, timedelta, UTC
+import re
+from typing import Optional, List, Dict, Any, FrozenSet
+
+from profiling import SlowCallback
+from settings import DEFAULT_PREFIX, RECORD_ICONS, CONFIRM_YES_ID, CONFIRM_NO_ID, USER_SUMMARY_RECENT, JAIL_MAX_DURATION
+
+
+# --- DYNAMIC PREFIX LOGIC ---
+async def get_prefix(bot: commands.Bot, message: discord.Message):
+    """Retrieves the custom prefix for the guild from storage."""
+    if not message.guild:
+        return commands.when_mentioned_or(DEFAULT_PREFIX)(bot, message)
+    
+    guild_id = message.guild.id
+    prefix = await bot.store.cfg_get(guild_id, "prefix") or DEFAULT_PREFIX
+    
+    # Allow mention OR custom prefix
+    return commands.when_mentioned_or(prefix)(bot, message)
+
+
+# ====== TIME HELPERS ======
+
+def format_time(dt: datetime) -> str:
+    """Formats a datetime the way records store it."""
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+def parse_time(value: str) -> datetime:
+    """Parses a stored record time string (UTC)."""
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=UTC)
+
+DURATION_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def format_duration(seconds: float) -> str:
+    """Formats seconds as a short human duration, e.g. 2d 3h or 5m."""
+    seconds = int(seconds)
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return " ".join(parts[:2]) or f"{seconds}s"
+
+def parse_duration(token: str, limit: int = JAIL_MAX_DURATION) -> Optional[timedelta]:
+    """
+    Parses durations like 30m, 12h, 7d, 2w or 1d12h. Returns None if token is not a duration.
+    Raises ValueError if it is longer than `limit` seconds.
+    """
+    parts = re.fullmatch(r"(?:\d+[mhdw])+", token.lower())
+    if not parts:
+        return None
+    seconds = 0
+    for n, u in re.findall(r"(\d+)([mhdw])", token.lower()):
+        # Checked before int(): huge numbers overflow timedelta (or int parsing itself)
+        if len(n) > len(str(limit)):
+            raise ValueError(f"Duration {token} is too long")
+        seconds += int(n) * DURATION_UNITS[u]
+    if seconds > limit:
+        raise ValueError(f"Duration {token} is too long")
+    return timedelta(seconds=seconds) if seconds else None
+
+# ====== STORAGE HELPERS ======
+
+async def cfg_set(bot: commands.Bot, gid: int, k: str, v: str):
+    """Sets a guild configuration value."""
+    await bot.store.cfg_set(gid, k, v)
+
+async def cfg_get(bot: commands.Bot, gid: int, k: str) -> Optional[str]:
+    """Gets a guild configuration value."""
+    return await bot.store.cfg_get(gid, k)
+
+async def increment_deleted_count(bot: commands.Bot, gid: int, uid: str):
+    """Increments the count of deleted actions for a user."""
+    await bot.store.increment_deleted_count(gid, uid)
+
+async def get_deleted_count(bot: commands.Bot, gid: int, uid: str) -> int:
+    """Gets the count of deleted actions for a user."""
+    return await bot.store.get_deleted_count(gid, uid)
+
+# ====== DATA MIGRATION PLACEHOLDER ======
+
+async def migrate_data_from_sqlite(bot: commands.Bot, guild_id: int):
+    """
+    ⚠️ THIS IS A PLACEHOLDER.
+    If you need to migrate data, you would import sqlite3 here, open the old
+    guild_X.db file, read the data, and insert it into MongoDB.
+    This function should only be run once.
+    """
+    # import sqlite3 
+    # db_path = f"{DATA_DIR}/bot_{bot.user.id}/guild_{guild_id}.db"
+    # if not os.path.exists(db_path):
+    #     print(f"No SQLite DB found for guild {guild_id}. Skipping migration.")
+    #     return
+
+    # with sqlite3.connect(db_path) as conn:
+    #     cursor = conn.cursor()
+    #
+    #     # Example: Migrating warnings
+    #     warnings_data = cursor.execute("SELECT user_id, mod_id, reason, time FROM warnings").fetchall()
+    #     mongo_warnings = [{
+    #         "guild_id": guild_id, 
+    #         "user_id": row[0], 
+    #         "mod_id": row[1], 
+    #         "reason": row[2], 
+    #         "time": row[3] # Store as string or convert to datetime object
+    #     } for row in warnings_data]
+    #     if mongo_warnings:
+    #         await bot.warnings_col.insert_many(mongo_warnings)
+    #
+    # # ... repeat for jail, verifications, config, etc.
+    
+    print(f"MIGRATION: Guild {guild_id} data migration placeholder executed.")
+
+
+# ====== LOGGING (Updated to be async and use new cfg_get) ======
+
+def log_slow_callback(event: SlowCallback):
+    """LoopMonitor hook (runs on the watchdog thread): prints who blocked the loop and where."""
+    print(f"🐢 Event loop blocked for {event.duration * 1000:.0f}ms in {event.label}\n{''.join(event.stack[-8:])}")
+
+async def log_action(ctx: commands.Context, action_type: str, member: discord.Member, reason: str, log_emoji: str, duration: str = None):
+    """Sends a standardized moderation log entry to the configured channel."""
+    await send_log(ctx.bot, ctx.guild, ctx.author, action_type, member, reason, log_emoji, duration)
+
+async def send_log(bot: commands.Bot, guild: discord.Guild, moderator: discord.abc.User, action_type: str, member: discord.abc.User, reason: str, log_emoji: str, duration: str = None):
+    """Same as log_action, for actions that have no command context (background jobs)."""
+    gid = guild.id
+    
+    log_channel_id_str = await cfg_get(bot, gid, 'log-channel')
+    
+    if not log_channel_id_str:
+        return
+        
+    try:
+        log_channel = guild.get_channel(int(log_channel_id_str))
+        if not log_channel:
+             return
+
+        title = f"{log_emoji} {action_type.upper()}"
+        color_map = {
+            "ban": discord.Color.red(), 
+            "jail": discord.Color.dark_red(), 
+            "warning": discord.Color.orange(),
+            "free": discord.Color.green(),
+            "verify": discord.Color.blue()
+        }
+        color = color_map.get(action_type.lower(), discord.Color.light_grey())
+
+        fields = [
+            ("User", f"{member.mention}\n`{member.id}`", True),
+            ("Moderator", f"{moderator.mention}\n`{moderator.id}`", True),
+        ]
+        
+        if duration:
+            fields.insert(2, ("Duration", duration, True))
+            
+        fields.append(("Reason", reason or "No reason provided.", False))
+            
+        embed = discord.Embed(
+            title=title,
+            color=color,
+            timestamp=datetime.now(UTC) 
+        )
+        
+        for name, value, inline in fields:
+            embed.add_field(name=name, value=value, inline=inline)
+            
+        await log_channel.send(embed=embed)
+
+    except Exception as e:
+        print(f"❌ Error sending log message to Discord: {e}")
+
+# ====== RECORD FETCH HELPER (Updated for MongoDB) ======
+
+async def fetch_raw_record(bot: commands.Bot, gid: int, rid: Any, rtype: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetches the actual record data from its source collection using the record id.
+    Returns a dict: {'type': str, 'mod': int, 'reason': str, 'time': str}
+    """
+    if rtype == 'warn':
+        doc = await bot.store.get_record('warn', gid, rid)
+        if doc: return {'type': 'warn', 'mod': doc.get('mod_id'), 'reason': doc.get('reason'), 'time': doc.get('time')}
+        
+    elif rtype == 'verify':
+        doc = await bot.store.get_record('verify', gid, rid)
+        if doc: return {'type': 'verify', 'mod': doc.get('mod_id'), 'reason': doc.get('reason'), 'time': doc.get('time')}
+        
+    elif rtype in ['jail', 'free']:
+        doc = await bot.store.get_record('jail', gid, rid)
+        if doc: 
+            if rtype == 'jail':
+                return {'type': 'jail', 'mod': doc.get('jailer'), 'reason': doc.get('reason'), 'time': doc.get('jailed_at')}
+            elif rtype == 'free':
+                # Map free_by to 'mod' and free_reason to 'reason' for consistency
+                return {'type': 'free', 'mod': doc.get('free_by'), 'reason': doc.get('free_reason'), 'time': doc.get('freed_at')}
+        
+    return None
+
+# ====== CONFIRMATION HELPER (Buttons, routed by bot.confirmations) ======
+# The original record_details dictionary structure is maintained.
+
+async def confirm_action(ctx: commands.Context, record_type: str, record_number: int, member: discord.Member, record_details: dict, new_reason: str = None, timeout: int = 20) -> bool:
+    """
+    Asks the moderator for confirmation on deleting or editing a record.
+    record_type is "delete" or "edit".
+    """
+    # (The body of the original confirm_action function goes here)
+    # It must be updated to use the new RECORD_ICONS (e.g., free is now just '✅')
+    
+    # ... (omitted for brevity, assume the original logic is copied and updated) ...
+    
+    action_verb = "DELETING" if record_type == "delete" else "EDITING"
+    color = discord.Color.red() if record_type == "delete" else discord.Color.gold()
+    
+    emoji = RECORD_ICONS.get(record_details['type'], "📁")
+    
+    reason_display = record_details['reason'] or "No reason provided."
+    # Edited reasons carry the ` E ` prefix
+    if reason_display and reason_display.startswith("` E ` "):
+        reason_display = reason_display[6:] 
+
+    description = (
+        f"**User:** {member.mention} (`{member.id}`)\n"
+        f"**Action:** {action_verb} Record **#{record_number}**\n\n"
+        f"**__Original Record__**\n"
+        f"**Type:** {emoji} {record_details['type'].upper()}\n"
+        f"**Time:** {record_details['time']}\n"
+        f"**Moderator:** <@{record_details['mod']}>\n"
+        f"**Reason:** *{reason_display}*"
+    )
+    
+    if new_reason and record_type == "edit":
+        description += (
+            f"\n\n**__New Reason__**\n"
+            f"**{new_reason}**"
+        )
+
+    embed = discord.Embed(
+        title=f"⚠️ CONFIRM {action_verb} RECORD",
+        description=description,
+        color=color
+    )
+    embed.set_footer(text=f"Press ✅ Confirm or ❌ Cancel. | Timeout: {timeout}s")
+
+    view = discord.ui.View(timeout=None)
+    view.add_item(discord.ui.Button(label="Confirm", emoji="✅", style=discord.ButtonStyle.danger, custom_id=CONFIRM_YES_ID))
+    view.add_item(discord.ui.Button(label="Cancel", emoji="❌", style=discord.ButtonStyle.secondary, custom_id=CONFIRM_NO_ID))
+
+    try:
+        confirmation_message = await ctx.reply(embed=embed, view=view)
+    except discord.Forbidden:
+        await ctx.reply("❌ Error: I do not have permission to send embeds or messages in this channel.")
+        return False
+
+    # The dispatcher owns routing and timeouts; drop the per-view store entry
+    view.stop()
+    result = await ctx.bot.confirmations.register(confirmation_message.id, ctx.author.id, timeout)
+
+    if result is None:
+        embed.set_footer(text="⌛ Action timed out and cancelled.")
+        try:
+            await confirmation_message.edit(embed=embed, view=None)
+        except discord.HTTPException:
+            pass
+        return False
+
+    return result
+
+
+# ====== JAIL HELPERS ======
+
+# free_reason of jail records closed by a ban made outside the bot, until the
+# audit log ingester (state.AuditLogIngester) names the moderator
+EXTERNAL_BAN_REASON = "Banned by external action (Bot closes record)"
+
+
+async def release_jail(bot: commands.Bot, guild: discord.Guild, user_id: int, moderator: discord.abc.User, reason: str, roles: Optional[List[int]] = None) -> bool:
+    """
+    Restores a jailed user's roles, closes their jail record, clears the cache and logs it.
+    Shared by `free` and timed jail expiry. Returns True if an open jail record was closed.
+    Callers hold bot.member_locks(guild.id, user_id).
+    """
+    key = (guild.id, user_id)
+    if roles is None:
+        roles = bot.jailed_users_cache.get(key, [])
+
+    member = guild.get_member(user_id)
+    if member:
+        real = [guild.get_role(r) for r in roles if guild.get_role(r)]
+        await member.edit(roles=real, reason=f"Freed by {moderator.name}")
+    
+    # Update the active jail record
+    freed_at = datetime.now(UTC)
+    closed = await bot.store.close_active_jail(guild.id, str(user_id), free_by=str(moderator.id), free_reason=reason, freed_at=format_time(freed_at))
+    
+    # Clear from cache
+    bot.jailed_users_cache.pop(key, None)
+    records_changed(bot, guild.id, user_id, action="free" if closed else None, at=freed_at)
+
+    if member:
+        await send_log(bot, guild, moderator, "Free", member, reason, RECORD_ICONS["free"])
+    return closed
+
+
+# ====== CROSS-GUILD HISTORY ======
+
+def records_changed(bot: commands.Bot, gid: int, uid: Any, action: Optional[str] = None, at: Optional[datetime] = None):
+    """
+    Drops cached views of a user's records after a write: their `r all` pages here and
+    their cross-guild summary. `action` (warn / jail / free / verify) also counts it in `stats`,
+    at `at`: the time stored in the record, so a stats rebuild can tell whether it already has it.
+    """
+    bot.record_views.invalidate(gid, uid)
+    bot.user_summaries.invalidate(uid)
+    if action:
+        bot.mod_stats.record(gid, action, uid, at)
+
+
+async def sharing_guilds(bot: commands.Bot) -> FrozenSet[int]:
+    """Ids of the guilds that opted in with `sharerecords on`."""
+    gids = bot.user_summaries.sharing_guilds()
+    if gids is None:
+        gids = frozenset(int(g) for g in await bot.store.cfg_guilds("share_records", "on"))
+        bot.user_summaries.set_sharing_guilds(gids)
+    return gids
+
+
+async def user_summary(bot: commands.Bot, uid: Any) -> Dict[str, Any]:
+    """
+    A user's records in every sharing guild, from one storage query, cached per user:
+      guilds: {guild_id: {"warn": n, "jail": n, "verify": n, "jailed_now": bool, "last": time}}
+      recent: the newest USER_SUMMARY_RECENT entries (kind, guild_id, mod, reason, time, freed_at)
+      total:  number of records
+    """
+    uid = str(uid)
+    summary = bot.user_summaries.get(uid)
+    if summary is not None:
+        return summary
+
+    generation = bot.user_summaries.generation
+    history = await bot.store.user_history(uid, sorted(await sharing_guilds(bot)))
+    guilds: Dict[int, Dict[str, Any]] = {}
+    for doc in history:
+        # Newest first, so the first entry seen for a guild is its latest
+        counts = guilds.setdefault(int(doc["guild_id"]), {"warn": 0, "jail": 0, "verify": 0, "jailed_now": False, "last": doc.get("time")})
+        counts[doc["kind"]] += 1
+        if doc["kind"] == "jail" and not doc.get("freed_at"):
+            counts["jailed_now"] = True
+
+    summary = {"guilds": guilds, "recent": history[:USER_SUMMARY_RECENT], "total": len(history)}
+    bot.user_summaries.put(uid, summary, generation)
+    return summary
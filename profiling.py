@@ -0,0 +1,164 @@
+"""
+Event loop diagnostics for LadyNight bot.
+
+`LoopMonitor` watches the event loop from a separate thread. Every `interval`
+it schedules a no-op callback on the loop and times how long the callback
+waits to run (the loop lag). If the callback has not run after
+`slow_threshold` seconds, something is holding the loop. The watchdog then
+snapshots the loop thread's stack while the culprit is still running, so a
+slow handler is reported with the code that was actually executing.
+
+`sample_profile` is an on-demand sampling profiler. It collects stacks of
+every thread at a fixed interval and returns them in the folded format
+("frame;frame;frame count" per line) read by flamegraph.pl, speedscope and
+inferno.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from dataclasses import dataclass
+from datetime import datetime, UTC
+from typing import Optional, List, Tuple, Callable, Any
+
+
+@dataclass
+class SlowCallback:
+    """One stretch of time during which the event loop was blocked."""
+    at: datetime
+    duration: float
+    label: str
+    stack: List[str]
+
+
+def _is_app_frame(filename: str, app_paths: Tuple[str, ...]) -> bool:
+    return filename.startswith(app_paths) and "site-packages" not in filename
+
+
+class LoopMonitor:
+    """
+    Event loop lag monitor and slow callback detector.
+    Lag samples and slow callbacks are kept in bounded histories for `ln.profile`.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.5, slow_threshold: float = 0.1,
+                 app_paths: Tuple[str, ...] = (), history: int = 50, lag_samples: int = 600,
+                 on_slow: Optional[Callable[[SlowCallback], Any]] = None):
+        self.loop = loop
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        # Source directories whose frames name the culprit (library frames are skipped)
+        self.app_paths = tuple(os.path.abspath(p) for p in app_paths)
+        self.lags: deque = deque(maxlen=lag_samples)
+        self.max_lag = 0.0
+        self.slow_callbacks: deque = deque(maxlen=history)
+        self.slow_count = 0
+        # Called from the watchdog thread; must be thread safe (print is)
+        self.on_slow = on_slow
+        self._loop_thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Starts watching. Must be called from the loop's own thread."""
+        if self._thread is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="ladynight-loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+
+    def lag_percentile(self, pct: float) -> float:
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            pong = threading.Event()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(pong.set)
+            except RuntimeError:
+                # Loop closed under us
+                return
+            if pong.wait(self.slow_threshold):
+                self._record_lag(time.monotonic() - sent)
+                continue
+
+            # Still blocked: the frame on the loop thread right now is the culprit
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            label = self._label(frame)
+            while not pong.wait(self.interval):
+                if self._stopped.is_set():
+                    return
+            lag = time.monotonic() - sent
+            self._record_lag(lag)
+            event = SlowCallback(at=datetime.now(UTC), duration=lag, label=label, stack=stack)
+            self.slow_callbacks.append(event)
+            self.slow_count += 1
+            if self.on_slow:
+                try:
+                    self.on_slow(event)
+                except Exception as e:
+                    print(f"❌ Slow callback hook failed: {e}")
+
+    def _record_lag(self, lag: float):
+        self.lags.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+
+    def _label(self, frame) -> str:
+        """App functions on the stack, outermost first, e.g. 'urecord_all → render_record_pages'."""
+        names = []
+        while frame is not None:
+            # Module level is just the `bot.run()` call every stack starts from
+            if frame.f_code.co_name != "<module>" and _is_app_frame(frame.f_code.co_filename, self.app_paths):
+                names.append(frame.f_code.co_name)
+            frame = frame.f_back
+        return " → ".join(reversed(names)) or "<library code>"
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    # First line of the function, so every sample inside it folds into one frame
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample(seconds: float, interval: float) -> Tuple[Counter, int]:
+    own = threading.get_ident()
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            path = []
+            while frame is not None:
+                path.append(_frame_name(frame))
+                frame = frame.f_back
+            path.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(path))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+async def sample_profile(seconds: float, interval: float = 0.005) -> Tuple[str, int]:
+    """
+    Samples every thread's stack for `seconds` without blocking the loop.
+    Returns (folded stacks, number of samples taken).
+    """
+    stacks, samples = await asyncio.to_thread(_sample, seconds, interval)
+    folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+    return folded, samples
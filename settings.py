@@ -0,0 +1,134 @@
+"""
+Configuration for LadyNight bot, read once at startup from the environment.
+Not reloaded by `ln.reload`; changing these needs a restart.
+"""
+import os
+
+# ==================== CONFIGURATION ====================
+# ! IMPORTANT: REPLACE WITH YOUR ACTUAL MONGO DB CONNECTION STRING
+# ! IMPORTANT: REPLACE WITH YOUR BO
+MONGO_URI = os.getenv("MONGO_URI")
+TOKEN = os.getenv("BOT_TOKEN")
+if not TOKEN:
+    print("❌ CRITICAL RENDER ERROR: TOKEN variable is empty/None.")
+    # Use a dummy invalid token to prevent a Python crash, but still allow a LoginFailure error
+    # This ensures a message appears in the Render log.
+    TOKEN = "INVALID_RENDER_TOKEN_CHECK" 
+else:
+    # Print the first and last characters of the token to confirm it's loaded
+    print(f"✅ RENDER TOKEN LOADED. Start: {TOKEN[:5]}, End: {TOKEN[-5:]}")
+# 🚨 END DEBUGGING 🚨
+
+AUTO_REPORT_CHANNEL_ID = int(os.getenv("AUTO_REPORT_CHANNEL_ID", "")) if os.getenv("AUTO_REPORT_CHANNEL_ID", "").isdigit() else None
+
+DEFAULT_PREFIX = "ln."
+DATA_DIR = "data" # Still used for the migration logic (if needed)
+
+# Storage backend: "mongo" (remote cluster, default) or "sqlite" (embedded, single host)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "ladynight.db"))
+# MongoDB client tuning (see storage.MongoStorage). The interactive pool serves prefixes,
+# config and records from the primary; the analytics pool serves `mr`, search and stats
+# rebuilds, reading secondaries at most MONGO_MAX_STALENESS seconds behind (driver minimum
+# 90). MONGO_ANALYTICS_POOL_SIZE=0 shares the interactive pool. Compression per pool as a
+# comma list, e.g. "zstd,zlib" (zstd and snappy need extra packages, see the pymongo docs).
+MONGO_OPTIONS = {
+    "pool_size": int(os.getenv("MONGO_POOL_SIZE", "50")),
+    "min_pool_size": int(os.getenv("MONGO_MIN_POOL_SIZE", "2")),
+    "analytics_pool_size": int(os.getenv("MONGO_ANALYTICS_POOL_SIZE", "10")),
+    "max_staleness": int(os.getenv("MONGO_MAX_STALENESS", "120")),
+    "compressors": os.getenv("MONGO_COMPRESSORS", ""),
+    "analytics_compressors": os.getenv("MONGO_ANALYTICS_COMPRESSORS", "zlib"),
+}
+# Test only: make storage slow/failing, e.g. "delay=1.5,jitter=0.5,fail_rate=0.2"
+STORAGE_FAULTS = os.getenv("STORAGE_FAULTS")
+
+# Results per page for `r search`, and how far back (days) its `since` filter may reach
+SEARCH_PAGE_SIZE = 10
+SEARCH_MAX_SINCE_DAYS = 3650
+
+# Verification queue: max members per `v bulk`, and pause between role swaps
+VERIFY_BULK_MAX = 50
+VERIFY_SWAP_INTERVAL = 0.5
+
+# `r all` pagination, rendered page cache size, and how long a cached page is
+# trusted (seconds) before it is re-rendered to pick up writes from other bot processes
+RECORD_PAGE_SIZE = 15
+RECORD_PAGE_CHARS = 3800 # Embed descriptions are capped at 4096
+RECORD_VIEW_CACHE_SIZE = 1000
+RECORD_VIEW_TTL = 120
+
+# Cross-guild history (`r global`, join vetting) across guilds with `sharerecords on`:
+# cached per-user summaries, how long one is trusted (seconds) before it is rebuilt
+# to pick up writes from other bot processes, and how many recent entries it keeps
+USER_SUMMARY_CACHE_SIZE = 5000
+USER_SUMMARY_TTL = 600
+USER_SUMMARY_RECENT = 10
+
+# `stats` aggregates: updated on every action, rebuilt from storage by a background
+# job when older than STATS_MAX_AGE (seconds) or after records were deleted
+STATS_REFRESH_INTERVAL = 60
+STATS_MAX_AGE = 6 * 3600
+
+# Audit log ingestion (who banned / kicked / removed the prisoner role outside the bot).
+# Guilds with ban or leave events are read every AUDIT_LOG_INTERVAL seconds from their
+# stored cursor, plus one other guild in rotation. At most AUDIT_LOG_MAX_ENTRIES per guild
+# per pass (100 per request); a guild's first pass starts AUDIT_LOG_BACKFILL seconds back.
+AUDIT_LOG_INTERVAL = 10
+AUDIT_LOG_MAX_ENTRIES = 500
+AUDIT_LOG_BACKFILL = 3600
+# How long a ban / jailed member's departure waits for its audit log entry (seconds)
+# before the ban stays unattributed / the departure is reported as an escape
+AUDIT_LOG_SETTLE = 5
+# A ban's entry is matched to the jail record its ban event closed if that record was
+# freed within this many seconds of the entry (gateway delay, clock skew, queued writes)
+AUDIT_LOG_MATCH_WINDOW = 120
+
+# Icons for record types
+RECORD_ICONS = {
+    "warn": "⚠️",
+    "jail": "⚔️",
+    "free": "✅",
+    "verify": "✅"
+}
+# Timed jails: how many upcoming expiries the scheduler keeps in memory,
+# and how many due jails it releases per wake-up
+JAIL_EXPIRY_WINDOW = 1000
+JAIL_EXPIRY_BATCH = 50
+# Reload the heap this often, to pick up timed jails created by other bot processes
+JAIL_EXPIRY_RESYNC = 300
+# Longest duration `j` accepts (seconds)
+JAIL_MAX_DURATION = 365 * 86400
+
+# Leases for singleton background jobs (seconds). Leases are renewed every
+# LEASE_TTL / 3, so a crashed leader is replaced within LEASE_TTL.
+LEASE_TTL = 60
+
+# Jail reconciliation: one guild is checked every JAIL_SWEEP_INTERVAL seconds,
+# reporting at most JAIL_SWEEP_REPORT_LIMIT mismatches per guild pass
+JAIL_SWEEP_INTERVAL = 30
+JAIL_SWEEP_REPORT_LIMIT = 20
+
+# Event loop profiling (opt-in): set LOOP_MONITOR=1 to watch loop lag and log any
+# callback that blocks the loop for more than LOOP_SLOW_MS, with its stack
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "").lower() in ("1", "true", "yes")
+LOOP_SLOW_MS = int(os.getenv("LOOP_SLOW_MS", "100"))
+LOOP_MONITOR_INTERVAL = 0.5
+# `profile sample`: default and maximum run time (seconds)
+PROFILE_DEFAULT_SECONDS = 15
+PROFILE_MAX_SECONDS = 60
+
+# Custom ids for confirmation buttons (routed by ConfirmationDispatcher)
+CONFIRM_YES_ID = "ln:confirm:yes"
+CONFIRM_NO_ID = "ln:confirm:no"
+
+# Extensions loaded at startup, in order (each is reloadable with `ln.reload`)
+EXTENSIONS = (
+    "cogs.config",
+    "cogs.moderation",
+    "cogs.verification",
+    "cogs.records",
+    "cogs.reports",
+    "cogs.admin",
+)
+# =======================================================
@@ -0,0 +1,915 @@
+"""
+Long-lived bot state: caches, schedulers and coordinators owned by the bot.
+
+These objects are created once in LadynightBot.__init__ and survive
+`ln.reload`, so reloading extensions keeps every cache, pending
+confirmation, lease and scheduled jail release. Helpers they call are looked
+up through the `helpers` module at call time, so reloaded helpers apply.
+"""
+import discord
+from discord.ext import commands
+from datetime import datetime, timedelta, UTC
+import asyncio
+import bisect
+import heapq
+import json
+import time
+import weakref
+from collections import Counter, OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+
+import helpers
+from storage import Storage, StorageUnavailable
+from settings import (
+    CONFIRM_YES_ID, CONFIRM_NO_ID, LEASE_TTL, JAIL_EXPIRY_WINDOW, JAIL_EXPIRY_BATCH,
+    JAIL_EXPIRY_RESYNC, JAIL_SWEEP_REPORT_LIMIT, RECORD_VIEW_CACHE_SIZE, RECORD_VIEW_TTL,
+    USER_SUMMARY_CACHE_SIZE, USER_SUMMARY_TTL, STATS_MAX_AGE, AUTO_REPORT_CHANNEL_ID, RECORD_ICONS,
+    AUDIT_LOG_MAX_ENTRIES, AUDIT_LOG_BACKFILL, AUDIT_LOG_SETTLE, AUDIT_LOG_MATCH_WINDOW,
+)
+
+
+class KeyedLocks:
+    """
+    One asyncio.Lock per key, e.g. (guild_id, user_id), created on first use.
+    Locks are held weakly: once no task holds or waits on a key its lock is
+    garbage collected, so idle keys cost nothing.
+
+        async with bot.member_locks(gid, uid):
+            ...
+    """
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[Tuple, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def __call__(self, *key) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class ConfirmationDispatcher:
+    """
+    Tracks pending button confirmations by message id.
+    Button presses are routed with a single dict lookup, and one background
+    task expires every pending confirmation from a deadline heap.
+    """
+
+    def __init__(self):
+        # message_id -> (author_id, future resolved with True / False / None on timeout)
+        self.pending: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._deadlines: List[Tuple[float, int]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, message_id: int, author_id: int, timeout: float) -> asyncio.Future:
+        """Starts waiting on a confirmation message. The future resolves when answered or expired."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = (author_id, future)
+        deadline = time.monotonic() + timeout
+        heapq.heappush(self._deadlines, (deadline, message_id))
+        # Only wake the scheduler if this deadline is now the earliest
+        if self._deadlines[0][1] == message_id:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._expire_loop())
+        return future
+
+    async def dispatch(self, interaction: discord.Interaction) -> bool:
+        """Resolves the confirmation the pressed button belongs to. Returns False if it is not ours."""
+        custom_id = (interaction.data or {}).get("custom_id")
+        if custom_id not in (CONFIRM_YES_ID, CONFIRM_NO_ID) or not interaction.message:
+            return False
+
+        entry = self.pending.get(interaction.message.id)
+        if entry is None:
+            await interaction.response.send_message("⌛ This confirmation has expired.", ephemeral=True)
+            return True
+
+        author_id, future = entry
+        if interaction.user.id != author_id:
+            await interaction.response.send_message("❌ Only the moderator who ran the command can answer this.", ephemeral=True)
+            return True
+
+        del self.pending[interaction.message.id]
+        confirmed = custom_id == CONFIRM_YES_ID
+        # Resolved before the edit: if editing fails (message deleted, already answered)
+        # the waiting command still gets its answer instead of waiting forever
+        if not future.done():
+            future.set_result(confirmed)
+        embed = interaction.message.embeds[0] if interaction.message.embeds else None
+        if embed:
+            embed.set_footer(text="✅ Confirmed." if confirmed else "❌ Action cancelled.")
+        # Answering the interaction also removes the buttons, no separate edit/delete call needed
+        await interaction.response.edit_message(embed=embed, view=None)
+        return True
+
+    async def _expire_loop(self):
+        while self._deadlines:
+            deadline, message_id = self._deadlines[0]
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._deadlines)
+            # Entries answered before their deadline are already gone from `pending`
+            entry = self.pending.pop(message_id, None)
+            if entry and not entry[1].done():
+                entry[1].set_result(None)
+
+
+class LeaseManager:
+    """
+    Leader election for singleton background jobs when several bot processes
+    run at once (blue/green deploys, shard workers).
+
+    Every registered lease is acquired or renewed by one task every ttl/3.
+    is_leader() is the cheap local view; it lapses on its own if renewals stop
+    (e.g. the process was paused). fenced() additionally checks the fencing
+    token in storage, and must be awaited right before a job's side effects.
+    """
+
+    def __init__(self, store: Storage, holder: str, ttl: float = LEASE_TTL, clock=time.time):
+        self.store = store
+        self.holder = holder
+        self.ttl = ttl
+        # Wall clock used for lease expiry; injectable to test failover timing
+        self.clock = clock
+        self.names: set = set()
+        self.tokens: Dict[str, int] = {}
+        self._valid_until: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, *names: str):
+        self.names.update(names)
+
+    async def unregister(self, name: str):
+        """Stops contending for a lease, giving it up if held (e.g. this process can no longer do the job)."""
+        self.names.discard(name)
+        token = self.tokens.pop(name, None)
+        self._valid_until.pop(name, None)
+        if token is not None:
+            try:
+                await self.store.release_lease(name, self.holder, token)
+            except Exception:
+                pass
+
+    async def start(self):
+        """Acquires registered leases once, then keeps renewing them in the background."""
+        if self._task is None or self._task.done():
+            await self.renew_all()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self.renew_all()
+
+    async def renew_all(self):
+        for name in list(self.names):
+            await self.renew(name)
+
+    async def renew(self, name: str):
+        started = time.monotonic()
+        try:
+            token = await self.store.acquire_lease(name, self.holder, self.ttl, self.tokens.get(name), now=self.clock())
+        except Exception as e:
+            # Outcome unknown: keep the token so the next renewal can still extend
+            # our lease, and let is_leader() lapse on its own meanwhile
+            print(f"❌ Lease renewal failed for {name}: {e}")
+            return
+        if token is None:
+            if self.tokens.pop(name, None) is not None:
+                print(f"Lease lost: {name}")
+            self._valid_until.pop(name, None)
+            return
+        if self.tokens.get(name) != token:
+            print(f"Lease acquired: {name} (token {token})")
+        self.tokens[name] = token
+        # Counted from before the request, with a margin for clock drift between processes
+        self._valid_until[name] = started + self.ttl * 0.8
+
+    def is_leader(self, name: str) -> bool:
+        return name in self.tokens and time.monotonic() < self._valid_until.get(name, 0)
+
+    async def fenced(self, name: str) -> bool:
+        """True only if this process holds the lease and its token is still the current one."""
+        if not self.is_leader(name):
+            return False
+        try:
+            info = await self.store.lease_info(name)
+        except Exception:
+            return False
+        return bool(info) and info["holder"] == self.holder and info["token"] == self.tokens[name] and info["expires_at"] > self.clock()
+
+    async def claim_run(self, name: str, period: str) -> bool:
+        """
+        For once-per-period jobs: records in storage, fenced by our token, that the
+        job ran for `period`. False if we are not the holder or any process (this one
+        before a restart included) already claimed `period`. Claim before doing the work.
+        """
+        if not self.is_leader(name):
+            return False
+        try:
+            return await self.store.claim_lease_run(name, self.holder, self.tokens[name], period, now=self.clock())
+        except Exception as e:
+            print(f"❌ Could not claim {name} for {period}: {e}")
+            return False
+
+    async def release_all(self):
+        """Gives up every held lease so another process can take over immediately."""
+        if self._task:
+            self._task.cancel()
+        for name, token in list(self.tokens.items()):
+            try:
+                await self.store.release_lease(name, self.holder, token)
+            except Exception:
+                pass
+        self.tokens.clear()
+        self._valid_until.clear()
+
+
+class JailExpiryScheduler:
+    """
+    Releases timed jails when they expire.
+    Keeps a min-heap of the next JAIL_EXPIRY_WINDOW expiries (loaded from the
+    indexed expires_at query) and sleeps until the earliest one. On wake-up the
+    database is asked which jails are actually due, so jails freed or edited
+    in the meantime are never released twice. Pending jails live only in
+    storage, so they survive restarts.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._heap: List[Tuple[datetime, int, int]] = []
+        # Latest expiry loaded when the window was full; later ones are picked up on reload
+        self._horizon: Optional[datetime] = None
+        self._loaded_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def schedule(self, gid: int, uid: int, expires_at: datetime):
+        """Adds a newly created timed jail to the heap."""
+        if self._horizon is not None and expires_at > self._horizon:
+            return
+        heapq.heappush(self._heap, (expires_at, gid, uid))
+        if self._heap[0][0] == expires_at:
+            self._wakeup.set()
+
+    async def _load(self):
+        docs = await self.bot.store.jail_expiries(limit=JAIL_EXPIRY_WINDOW)
+        self._heap = [(helpers.parse_time(d["expires_at"]), d["guild_id"], int(d["user_id"])) for d in docs]
+        heapq.heapify(self._heap)
+        self._horizon = helpers.parse_time(docs[-1]["expires_at"]) if len(docs) >= JAIL_EXPIRY_WINDOW else None
+        self._loaded_at = time.monotonic()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._load()
+                break
+            except StorageUnavailable as e:
+                print(f"❌ Could not load jail expiries, retrying: {e}")
+                await asyncio.sleep(30)
+
+        while True:
+            resync_in = JAIL_EXPIRY_RESYNC - (time.monotonic() - self._loaded_at)
+            if resync_in <= 0 or (not self._heap and self._horizon is not None):
+                try:
+                    await self._load()
+                except StorageUnavailable:
+                    await asyncio.sleep(30)
+                continue
+
+            delay = (self._heap[0][0] - datetime.now(UTC)).total_seconds() if self._heap else resync_in
+            delay = min(delay, resync_in)
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = datetime.now(UTC)
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+            try:
+                await self._release_due(now)
+            except Exception as e:
+                print(f"❌ Jail expiry pass failed: {e}")
+                await asyncio.sleep(30)
+
+    async def _release_due(self, now: datetime):
+        # Only the lease holder releases; other processes just keep their heap current
+        if not await self.bot.leases.fenced(self.bot.lease_name("jail_expiry")):
+            return
+        until = now.strftime('%Y-%m-%d %H:%M:%S')
+        while True:
+            due = await self.bot.store.jail_expiries(limit=JAIL_EXPIRY_BATCH, until=until)
+            if not due:
+                return
+            released = await asyncio.gather(*(self._release(doc) for doc in due))
+            # Stop if nothing in this batch was ours to release, or it would be fetched again forever
+            if len(due) < JAIL_EXPIRY_BATCH or not any(released):
+                return
+
+    async def _release(self, doc: Dict[str, Any]) -> bool:
+        """Releases one due jail. Returns False if it belongs to another shard."""
+        gid, uid = doc["guild_id"], int(doc["user_id"])
+        guild = self.bot.get_guild(gid)
+        if guild is None and self.bot.shard_count not in (None, 1):
+            # Another shard's guild; its own leader releases it
+            return False
+        async with self.bot.member_locks(gid, uid):
+            await self._release_locked(guild, gid, uid, doc)
+        return True
+
+    async def _release_locked(self, guild: Optional[discord.Guild], gid: int, uid: int, doc: Dict[str, Any]):
+        try:
+            if guild:
+                await helpers.release_jail(self.bot, guild, uid, self.bot.user, "Jail time expired", roles=json.loads(doc.get("roles") or "[]"))
+            else:
+                # Bot is no longer in the guild; just close the record
+                freed_at = datetime.now(UTC)
+                closed = await self.bot.store.close_active_jail(gid, str(uid), free_by=str(self.bot.user.id), free_reason="Jail time expired", freed_at=helpers.format_time(freed_at))
+                self.bot.jailed_users_cache.pop((gid, uid), None)
+                helpers.records_changed(self.bot, gid, uid, action="free" if closed else None, at=freed_at)
+        except Exception as e:
+            print(f"❌ Could not release expired jail {gid}/{uid}: {e}")
+            # Close the record anyway so a failing member edit cannot stall the queue
+            freed_at = datetime.now(UTC)
+            closed = await self.bot.store.close_active_jail(gid, str(uid), free_by=str(self.bot.user.id), free_reason=f"Jail time expired (release failed: {e})", freed_at=helpers.format_time(freed_at))
+            self.bot.jailed_users_cache.pop((gid, uid), None)
+            helpers.records_changed(self.bot, gid, uid, action="free" if closed else None, at=freed_at)
+
+
+class JailReconciler:
+    """
+    Finds drift between jailed_users_cache, open jail records and the members
+    who actually hold the prisoner role, one guild per sweep step.
+
+    Cache drift is repaired in place. Role drift (a jailed member without the
+    prisoner role, or a prisoner-role holder with no open record) is only
+    reported, since it usually means a moderator edited roles by hand.
+    A mismatch must show up on two consecutive passes over the same guild
+    before anything is done, so a jail/free still in flight is never touched.
+    """
+
+    DRIFT_KINDS = ("cache_missing", "cache_stale", "missing_role", "untracked_prisoner")
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._queue: List[int] = []
+        # gid -> mismatches seen on the previous pass: {(kind, user_id)}
+        self._suspects: Dict[int, set] = {}
+        # Metrics
+        self.passes = 0
+        self.repaired = {"cache_missing": 0, "cache_stale": 0}
+        self.reported = {"missing_role": 0, "untracked_prisoner": 0}
+        self.current_drift: Dict[int, Dict[str, int]] = {}
+        self.last_pass_at: Optional[datetime] = None
+
+    async def sweep_next(self):
+        """Reconciles the next guild in round-robin order."""
+        if not self._queue:
+            self._queue = [g.id for g in self.bot.guilds]
+            if not self._queue:
+                return
+        guild = self.bot.get_guild(self._queue.pop())
+        if guild:
+            await self.reconcile(guild)
+
+    async def diff(self, guild: discord.Guild) -> Tuple[Dict[str, set], Dict[int, Dict[str, Any]]]:
+        """Returns the guild's mismatches by kind (sets of user ids) and its open jail records by user id."""
+        gid = guild.id
+        cached = {uid for (g, uid) in self.bot.jailed_users_cache if g == gid}
+        stored = {int(d["user_id"]): d for d in await self.bot.store.active_jails(gid)}
+
+        pr = await helpers.cfg_get(self.bot, gid, "prisoner")
+        prisoner = guild.get_role(int(pr)) if pr and pr.isdigit() else None
+        holders = {m.id for m in prisoner.members} if prisoner else None
+
+        drift = {
+            "cache_missing": set(stored) - cached,
+            "cache_stale": cached - set(stored),
+            "missing_role": set(),
+            "untracked_prisoner": set(),
+        }
+        if holders is not None:
+            # Jailed members who left are escapes, not drift
+            drift["missing_role"] = {uid for uid in stored if uid not in holders and guild.get_member(uid)}
+            drift["untracked_prisoner"] = holders - set(stored)
+        return drift, stored
+
+    async def reconcile(self, guild: discord.Guild, confirm: bool = True) -> Dict[str, set]:
+        """Diffs one guild, repairs cache drift and reports role drift. Returns the acted-on mismatches."""
+        gid = guild.id
+        drift, stored = await self.diff(guild)
+
+        seen = {(kind, uid) for kind, uids in drift.items() for uid in uids}
+        if confirm:
+            confirmed = seen & self._suspects.get(gid, set())
+            self._suspects[gid] = seen
+        else:
+            confirmed = seen
+            self._suspects.pop(gid, None)
+        acted = {kind: {uid for k, uid in confirmed if k == kind} for kind in self.DRIFT_KINDS}
+
+        for uid in acted["cache_missing"]:
+            self.bot.jailed_users_cache[(gid, uid)] = json.loads(stored[uid].get("roles") or "[]")
+        for uid in acted["cache_stale"]:
+            self.bot.jailed_users_cache.pop((gid, uid), None)
+        self.repaired["cache_missing"] += len(acted["cache_missing"])
+        self.repaired["cache_stale"] += len(acted["cache_stale"])
+
+        self.passes += 1
+        self.last_pass_at = datetime.now(UTC)
+        self.current_drift[gid] = {kind: len(uids) for kind, uids in drift.items()}
+
+        to_report = [(kind, uid) for kind in ("missing_role", "untracked_prisoner") for uid in sorted(acted[kind])]
+        if to_report:
+            self.reported["missing_role"] += len(acted["missing_role"])
+            self.reported["untracked_prisoner"] += len(acted["untracked_prisoner"])
+            await self._report(guild, to_report)
+        return acted
+
+    async def _report(self, guild: discord.Guild, mismatches: List[Tuple[str, int]]):
+        log_channel_id_str = await helpers.cfg_get(self.bot, guild.id, 'log-channel')
+        if not log_channel_id_str:
+            return
+        log_channel = guild.get_channel(int(log_channel_id_str))
+        if not log_channel:
+            return
+
+        labels = {
+            "missing_role": "has an open jail record but not the prisoner role",
+            "untracked_prisoner": "has the prisoner role but no open jail record",
+        }
+        lines = [f"<@{uid}> {labels[kind]}" for kind, uid in mismatches[:JAIL_SWEEP_REPORT_LIMIT]]
+        if len(mismatches) > JAIL_SWEEP_REPORT_LIMIT:
+            lines.append(f"... and {len(mismatches) - JAIL_SWEEP_REPORT_LIMIT} more")
+        embed = discord.Embed(
+            title="🧭 Jail State Drift",
+            description="\n".join(lines),
+            color=discord.Color.orange(),
+            timestamp=datetime.now(UTC)
+        )
+        try:
+            await log_channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f"❌ Error sending jail drift report: {e}")
+
+
+class RecordViewCache:
+    """
+    Bounded LRU of rendered `r all` pages keyed by (guild_id, user_id, page).
+    Every command that writes a user's records calls invalidate(), so a
+    cached page is never older than the last write made by this process;
+    pages also expire after `ttl` seconds so writes by other bot processes show up.
+    """
+
+    def __init__(self, maxsize: int = RECORD_VIEW_CACHE_SIZE, ttl: float = RECORD_VIEW_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._pages: "OrderedDict[Tuple[int, str, int], Tuple[float, discord.Embed]]" = OrderedDict()
+        self._by_user: Dict[Tuple[int, str], set] = {}
+        # How many pages each cached user has, so a page past the end maps to the last one
+        self._page_counts: Dict[Tuple[int, str], int] = {}
+        # Bumped on every invalidation; a render that raced a write is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, gid: int, uid: str, page: int) -> Optional[discord.Embed]:
+        """The cached page, clamped to the user's first / last page, or None if not cached."""
+        page = min(max(page, 1), self._page_counts.get((gid, uid), page))
+        key = (gid, uid, page)
+        entry = self._pages.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                # All of a user's pages are rendered together, so they expire together
+                self.invalidate(gid, uid, bump=False)
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, gid: int, uid: str, pages: List[discord.Embed], generation: int):
+        """Stores all pages of one user's record, unless a write happened since `generation`."""
+        if generation != self.generation:
+            return
+        self.invalidate(gid, uid, bump=False)
+        keys = self._by_user.setdefault((gid, uid), set())
+        self._page_counts[(gid, uid)] = len(pages)
+        rendered_at = time.monotonic()
+        for page, embed in enumerate(pages, start=1):
+            key = (gid, uid, page)
+            self._pages[key] = (rendered_at, embed)
+            keys.add(key)
+        while len(self._pages) > self.maxsize:
+            old_key, _ = self._pages.popitem(last=False)
+            user_keys = self._by_user.get(old_key[:2])
+            if user_keys is not None:
+                user_keys.discard(old_key)
+                if not user_keys:
+                    del self._by_user[old_key[:2]]
+                    self._page_counts.pop(old_key[:2], None)
+
+    def invalidate(self, gid: int, uid: Any, bump: bool = True):
+        if bump:
+            self.generation += 1
+        self._page_counts.pop((gid, str(uid)), None)
+        for key in self._by_user.pop((gid, str(uid)), ()):
+            self._pages.pop(key, None)
+
+
+class UserSummaryCache:
+    """
+    Bounded LRU of cross-guild user summaries (built by helpers.user_summary)
+    keyed by user id, plus the set of guilds that share their records.
+    Writes made by this process invalidate a user immediately; entries also
+    expire after `ttl` seconds so writes by other bot processes show up.
+    """
+
+    def __init__(self, maxsize: int = USER_SUMMARY_CACHE_SIZE, ttl: float = USER_SUMMARY_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._sharing: Optional[Tuple[float, frozenset]] = None
+        # Bumped on every invalidation; a summary built while a write raced it is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(uid)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._entries.pop(uid, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(uid)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, uid: str, summary: Dict[str, Any], generation: int):
+        if generation != self.generation:
+            return
+        self._entries[uid] = (time.monotonic(), summary)
+        self._entries.move_to_end(uid)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, uid: Any):
+        self.generation += 1
+        self._entries.pop(str(uid), None)
+
+    def sharing_guilds(self) -> Optional[frozenset]:
+        if self._sharing is None or time.monotonic() - self._sharing[0] > self.ttl:
+            return None
+        return self._sharing[1]
+
+    def set_sharing_guilds(self, gids: frozenset):
+        self._sharing = (time.monotonic(), gids)
+
+    def clear(self):
+        """Drops everything, e.g. after a guild starts or stops sharing."""
+        self.generation += 1
+        self._entries.clear()
+        self._sharing = None
+
+
+class GuildStats:
+    """
+    Moderation aggregates for one guild, updated one action at a time so
+    reading them never touches the record history:
+      - repeat offenders: users with two or more warns / jails
+      - warn → jail escalation: warned users who were jailed after a warn
+      - jail durations (sorted, for the median) and actions by hour (UTC)
+    """
+
+    def __init__(self):
+        self.totals: Counter = Counter()
+        self.by_hour = [0] * 24
+        self.offences: Dict[str, int] = {}
+        self.repeat_offenders = 0
+        self.warned: set = set()
+        self.escalated: set = set()
+        self.open_jails: Dict[str, datetime] = {}
+        self.jail_durations: List[float] = []
+        self.built_at = time.monotonic()
+
+    def add(self, kind: str, uid: str, at: datetime):
+        """Applies one warn / jail / free / verify. Actions must arrive in time order per user."""
+        self.totals[kind] += 1
+        self.by_hour[at.hour] += 1
+        if kind in ("warn", "jail"):
+            self.offences[uid] = self.offences.get(uid, 0) + 1
+            if self.offences[uid] == 2:
+                self.repeat_offenders += 1
+        if kind == "warn":
+            self.warned.add(uid)
+        elif kind == "jail":
+            if uid in self.warned:
+                self.escalated.add(uid)
+            self.open_jails[uid] = at
+        elif kind == "free":
+            jailed_at = self.open_jails.pop(uid, None)
+            if jailed_at is not None:
+                bisect.insort(self.jail_durations, (at - jailed_at).total_seconds())
+
+    @classmethod
+    def from_activity(cls, rows: List[Dict[str, Any]], before: str) -> "GuildStats":
+        """Replays the rows of Storage.guild_activity; frees at or after `before` are left to add()."""
+        events = []
+        for row in rows:
+            uid = str(row["user_id"])
+            events.append((row["time"], row["kind"], uid))
+            if row["kind"] == "jail" and row.get("freed_at") and row["freed_at"] < before:
+                events.append((row["freed_at"], "free", uid))
+        # Stable sort: a jail and its free in the same second stay in that order
+        events.sort(key=lambda e: e[0])
+        stats = cls()
+        for at, kind, uid in events:
+            stats.add(kind, uid, helpers.parse_time(at))
+        return stats
+
+    @property
+    def repeat_offender_rate(self) -> Optional[float]:
+        return self.repeat_offenders / len(self.offences) if self.offences else None
+
+    @property
+    def escalation_rate(self) -> Optional[float]:
+        return len(self.escalated) / len(self.warned) if self.warned else None
+
+    @property
+    def median_jail_seconds(self) -> Optional[float]:
+        d = self.jail_durations
+        if not d:
+            return None
+        mid = len(d) // 2
+        return d[mid] if len(d) % 2 else (d[mid - 1] + d[mid]) / 2
+
+
+class ModerationStats:
+    """
+    GuildStats for every guild this process serves, for `ln.stats`.
+
+    Commands report each action with record(); the background job in
+    cogs.reports rebuilds a guild from Storage.guild_activity when it has
+    never been built, is older than STATS_MAX_AGE (picking up actions made by
+    other bot processes) or was marked stale because records were deleted.
+    Actions reported while a rebuild is reading are replayed on top of it.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._guilds: Dict[int, GuildStats] = {}
+        # gid -> actions reported while that guild is being rebuilt
+        self._rebuilding: Dict[int, List[Tuple[str, str, datetime]]] = {}
+        self._stale: set = set()
+        self._locks = KeyedLocks()
+
+    def get(self, gid: int) -> Optional[GuildStats]:
+        return self._guilds.get(gid)
+
+    def record(self, gid: int, kind: str, uid: Any, at: Optional[datetime] = None):
+        at = at or datetime.now(UTC)
+        if gid in self._rebuilding:
+            self._rebuilding[gid].append((kind, str(uid), at))
+        stats = self._guilds.get(gid)
+        if stats is not None:
+            stats.add(kind, str(uid), at)
+
+    def mark_stale(self, gid: int):
+        """Deletes cannot be subtracted from the aggregates; the next refresh rebuilds the guild."""
+        self._stale.add(gid)
+
+    def needs_refresh(self, gid: int) -> bool:
+        stats = self._guilds.get(gid)
+        return stats is None or gid in self._stale or time.monotonic() - stats.built_at > STATS_MAX_AGE
+
+    async def refresh(self, gid: int, only_if_needed: bool = False) -> GuildStats:
+        """Rebuilds one guild from storage. The history is replayed in a worker thread, off the event loop."""
+        async with self._locks(gid):
+            if only_if_needed and not self.needs_refresh(gid):
+                return self._guilds[gid]
+            self._stale.discard(gid)
+            # Collect live actions first, then cut off at the next whole second (record times
+            # have one-second resolution): everything stamped from the cutoff on is in the
+            # replay list and not in the query, everything before it is in the query only
+            self._rebuilding[gid] = []
+            try:
+                cutoff = datetime.now(UTC).replace(microsecond=0) + timedelta(seconds=1)
+                while (wait := (cutoff - datetime.now(UTC)).total_seconds()) > 0:
+                    await asyncio.sleep(wait)
+                before = helpers.format_time(cutoff)
+                rows = await self.bot.store.guild_activity(gid, before)
+                stats = await asyncio.to_thread(GuildStats.from_activity, rows, before)
+                for kind, uid, at in self._rebuilding[gid]:
+                    if at >= cutoff:
+                        stats.add(kind, uid, at)
+            except BaseException:
+                self._stale.add(gid)
+                raise
+            finally:
+                del self._rebuilding[gid]
+            self._guilds[gid] = stats
+            return stats
+
+
+class AuditLogIngester:
+    """
+    Reads each guild's audit log incrementally from a stored cursor (config key
+    "audit_log_cursor") to learn who banned, kicked or un-jailed someone
+    outside the bot.
+
+    Ban and leave events only mark their guild. The next pass reads every entry
+    since the cursor, oldest first, 100 per request, so a raid of many bans
+    costs a few API calls instead of one per event.
+      - external bans and kicks are stored for `mr` (Storage.insert_mod_actions)
+      - jail records closed by an external ban are re-attributed to the banner
+      - a moderator removing the prisoner role by hand frees the jail in their name
+      - a jailed member who left is reported as kicked, or as escaped if no kick
+        entry shows up within AUDIT_LOG_SETTLE
+    """
+
+    RECENT_LIMIT = 1000
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._dirty: set = set()
+        self._queue: List[int] = []
+        # gid -> {(user_id, "ban" | "leave"): monotonic time of the event}, waiting for their entry
+        self._pending: Dict[int, Dict[Tuple[int, str], float]] = {}
+        # (gid, user_id, "ban" | "kick") -> action doc, for events that arrive after their entry was read
+        self._recent: "OrderedDict[Tuple[int, int, str], Dict[str, Any]]" = OrderedDict()
+
+    def mark(self, gid: int):
+        """Something happened in the guild the audit log can explain; read it on the next pass."""
+        self._dirty.add(gid)
+
+    def expect(self, gid: int, uid: int, event: str):
+        """Waits for the audit log entry of a ban (to attribute its jail record) or of a jailed member's departure."""
+        self._pending.setdefault(gid, {})[(uid, event)] = time.monotonic()
+        self.mark(gid)
+
+    async def run(self, sweep: bool = False):
+        """Reads the marked guilds and those with pending events, plus the next guild in rotation when `sweep`."""
+        gids = self._dirty | set(self._pending)
+        self._dirty = set()
+        if sweep:
+            if not self._queue:
+                self._queue = [g.id for g in self.bot.guilds]
+            if self._queue:
+                gids.add(self._queue.pop())
+        for gid in gids:
+            guild = self.bot.get_guild(gid)
+            if guild is None:
+                self._pending.pop(gid, None)
+                continue
+            try:
+                await self.ingest(guild)
+            except StorageUnavailable:
+                self._dirty |= gids
+                raise
+            except Exception as e:
+                print(f"❌ Audit log ingestion failed for {gid}: {e}")
+
+    async def ingest(self, guild: discord.Guild) -> int:
+        """One pass over a guild's new audit log entries. Returns how many external actions were stored."""
+        gid = guild.id
+        if not guild.me.guild_permissions.view_audit_log:
+            await self._resolve_pending(guild, give_up=True)
+            return 0
+
+        cursor = await helpers.cfg_get(self.bot, gid, "audit_log_cursor")
+        if cursor and cursor.isdigit():
+            after = int(cursor)
+        else:
+            after = discord.utils.time_snowflake(datetime.now(UTC) - timedelta(seconds=AUDIT_LOG_BACKFILL))
+        pr = await helpers.cfg_get(self.bot, gid, "prisoner")
+        prisoner_id = int(pr) if pr and pr.isdigit() else None
+
+        actions, role_frees, last_id, read = [], [], None, 0
+        async for entry in guild.audit_logs(limit=AUDIT_LOG_MAX_ENTRIES, after=discord.Object(id=after), oldest_first=True):
+            last_id, read = entry.id, read + 1
+            # The bot's own actions are already in its records
+            if entry.user is None or entry.user.id == self.bot.user.id or entry.target is None:
+                continue
+            if entry.action in (discord.AuditLogAction.ban, discord.AuditLogAction.kick):
+                doc = {
+                    "guild_id": gid,
+                    "entry_id": str(entry.id),
+                    "user_id": str(entry.target.id),
+                    "mod_id": str(entry.user.id),
+                    "action": entry.action.name,
+                    "reason": entry.reason,
+                    "time": helpers.format_time(entry.created_at),
+                }
+                actions.append(doc)
+                self._recent[(gid, entry.target.id, doc["action"])] = doc
+                while len(self._recent) > self.RECENT_LIMIT:
+                    self._recent.popitem(last=False)
+            elif entry.action == discord.AuditLogAction.member_role_update and prisoner_id:
+                # For role updates, `before.roles` holds the removed roles
+                if any(r.id == prisoner_id for r in getattr(entry.before, "roles", None) or []):
+                    role_frees.append(entry)
+
+        if actions:
+            await self.bot.store.insert_mod_actions(actions)
+        for doc in actions:
+            if doc["action"] == "ban":
+                await self._attribute_ban(guild, doc)
+        for entry in role_frees:
+            await self._role_free(guild, entry, prisoner_id)
+        if last_id is not None:
+            # Only after everything above is stored: a crash re-reads the batch, and every step is idempotent
+            await helpers.cfg_set(self.bot, gid, "audit_log_cursor", str(last_id))
+        if read >= AUDIT_LOG_MAX_ENTRIES:
+            # More entries than one pass reads; continue on the next one
+            self._dirty.add(gid)
+        await self._resolve_pending(guild)
+        return len(actions)
+
+    async def _attribute_ban(self, guild: discord.Guild, doc: Dict[str, Any]):
+        # Only the record this ban closed; older placeholder records belong to other bans
+        banned_at = helpers.parse_time(doc["time"])
+        window = timedelta(seconds=AUDIT_LOG_MATCH_WINDOW)
+        if await self.bot.store.attribute_jail_release(
+            guild.id, doc["user_id"], helpers.EXTERNAL_BAN_REASON,
+            freed_from=helpers.format_time(banned_at - window), freed_to=helpers.format_time(banned_at + window),
+            free_by=doc["mod_id"], free_reason=f"Banned: {doc['reason'] or 'No reason'}"
+        ):
+            helpers.records_changed(self.bot, guild.id, doc["user_id"])
+
+    async def _role_free(self, guild: discord.Guild, entry: discord.AuditLogEntry, prisoner_id: int):
+        """A moderator took the prisoner role off a jailed member by hand: close the jail in their name."""
+        gid, uid = guild.id, entry.target.id
+        reason = f"Prisoner role removed by hand{': ' + entry.reason if entry.reason else ''}"
+        async with self.bot.member_locks(gid, uid):
+            member = guild.get_member(uid)
+            # Re-jailed (or role given back) since: the entry is history, not the current state
+            if (gid, uid) not in self.bot.jailed_users_cache or member is None or member.get_role(prisoner_id):
+                return
+            closed = await self.bot.store.close_active_jail(gid, str(uid), free_by=str(entry.user.id), free_reason=reason, freed_at=helpers.format_time(entry.created_at))
+            self.bot.jailed_users_cache.pop((gid, uid), None)
+            helpers.records_changed(self.bot, gid, uid, action="free" if closed else None, at=entry.created_at)
+        if closed:
+            await helpers.send_log(self.bot, guild, entry.user, "Free", member, reason, RECORD_ICONS["free"])
+
+    async def _resolve_pending(self, guild: discord.Guild, give_up: bool = False):
+        pending = self._pending.get(guild.id)
+        if not pending:
+            return
+        now = time.monotonic()
+        for (uid, event), since in list(pending.items()):
+            if event == "ban":
+                doc = self._recent.get((guild.id, uid, "ban"))
+                if doc:
+                    await self._attribute_ban(guild, doc)
+                elif not give_up and now - since < AUDIT_LOG_SETTLE:
+                    continue
+            else:
+                doc = self._recent.get((guild.id, uid, "kick"))
+                if not doc and not give_up and now - since < AUDIT_LOG_SETTLE:
+                    continue
+                await self._report_departure(uid, doc)
+            del pending[(uid, event)]
+        if not pending:
+            del self._pending[guild.id]
+
+    async def _report_departure(self, uid: int, kick: Optional[Dict[str, Any]]):
+        ch = self.bot.get_channel(AUTO_REPORT_CHANNEL_ID) if AUTO_REPORT_CHANNEL_ID else None
+        if not ch:
+            return
+        if kick:
+            em = discord.Embed(
+                title="👢 Prisoner Kicked",
+                color=discord.Color.orange(),
+                description=f"<@{uid}> was kicked by <@{kick['mod_id']}> while jailed. Reason: {kick['reason'] or 'No reason'}"
+            )
+        else:
+            em = discord.Embed(
+                title="🚨 Prisoner Escaped!",
+                color=discord.Color.red(),
+                description=f"<@{uid}> has left the server while jailed!"
+            )
+        try:
+            await ch.send(embed=em)
+        except discord.HTTPException:
+            pass
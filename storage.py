@@ -0,0 +1,1704 @@
+"""
+Storage backends for LadyNight bot.
+
+Every command talks to a `Storage` object instead of raw Motor collections,
+so the same code runs against the remote MongoDB cluster (`MongoStorage`) or
+an embedded SQLite file (`SQLiteStorage`) for single-host deployments.
+
+Record ids are opaque strings: the MongoDB ObjectId as a hex string, or the
+SQLite rowid as a decimal string. Documents are returned as plain dicts using
+the same field names the Mongo collections have always used.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+# Record kind -> (Mongo collection / SQLite table)
+RECORD_TABLES = {
+    "warn": "warnings",
+    "verify": "verifications",
+    "jail": "jail",
+}
+
+# Fields a caller may filter, group or update on, per record kind.
+# Anything outside this map is rejected before it reaches SQL.
+RECORD_FIELDS = {
+    "warn": {"mod_id", "reason", "time"},
+    "verify": {"mod_id", "reason", "time", "wait_seconds"},
+    "jail": {"jailer", "reason", "roles", "jailed_at", "freed_at", "free_by", "free_reason", "expires_at"},
+}
+
+# Field each record kind is dated by (used for `since` filters)
+RECORD_TIME_FIELDS = {
+    "warn": "time",
+    "verify": "time",
+    "jail": "jailed_at",
+}
+
+
+def search_terms(query: str) -> List[str]:
+    """Splits a free-text query into plain word terms."""
+    return [t for t in "".join(c if c.isalnum() else " " for c in query.lower()).split() if t]
+
+
+class StorageUnavailable(Exception):
+    """Raised for reads the storage circuit breaker cannot serve while the backend is down."""
+
+
+def _check_field(kind: str, field: str):
+    if kind not in RECORD_TABLES:
+        raise ValueError(f"Unknown record kind: {kind}")
+    if field not in RECORD_FIELDS[kind]:
+        raise ValueError(f"Unknown field '{field}' for record kind '{kind}'")
+
+
+class Storage:
+    """Interface shared by all storage backends. All methods are coroutines."""
+
+    async def setup(self):
+        """Creates tables/indexes. Safe to call on every start."""
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    def pool_stats(self) -> Dict[str, Dict[str, float]]:
+        """Connection pool metrics by pool name (see PoolWaitStats.snapshot); empty if the backend has no pools."""
+        return {}
+
+    # --- Guild config ---
+    async def cfg_get(self, gid: int, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def cfg_set(self, gid: int, key: str, value: str):
+        raise NotImplementedError
+
+    async def cfg_guilds(self, key: str, value: str) -> List[int]:
+        """Ids of every guild whose config `key` is set to `value`."""
+        raise NotImplementedError
+
+    # --- Records (warn / verify / jail) ---
+    async def insert_record(self, kind: str, doc: Dict[str, Any]) -> str:
+        """Inserts a record and returns its id."""
+        raise NotImplementedError
+
+    async def insert_records(self, kind: str, docs: List[Dict[str, Any]]) -> int:
+        """Inserts many records of one kind in a single round trip. Returns how many were inserted."""
+        raise NotImplementedError
+
+    async def get_record(self, kind: str, gid: int, rid: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def list_records(self, kind: str, gid: int, uid: str, sort_field: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All records of one kind for a user, optionally sorted ascending by a field."""
+        raise NotImplementedError
+
+    async def delete_record(self, kind: str, gid: int, rid: str) -> bool:
+        raise NotImplementedError
+
+    async def update_record(self, kind: str, gid: int, rid: str, fields: Dict[str, Any]) -> bool:
+        """Sets fields on a record. Returns True if the record was modified."""
+        raise NotImplementedError
+
+    async def count_by_mod(self, kind: str, gid: int, time_field: str, mod_field: str, since: str) -> Dict[str, int]:
+        """Counts records per moderator with time_field >= since."""
+        raise NotImplementedError
+
+    async def search_records(self, gid: int, terms: List[str], since: Optional[str] = None, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Full-text search over record reasons in one guild, best match first.
+        Each result is the record document plus 'kind' and 'score'.
+        """
+        raise NotImplementedError
+
+    async def user_history(self, uid: str, gids: List[int]) -> List[Dict[str, Any]]:
+        """
+        One user's records across the given guilds in a single query on the
+        (user_id, time) indexes, newest first. Each result has kind, guild_id,
+        mod, reason, time and freed_at (jail records only).
+        """
+        raise NotImplementedError
+
+    async def guild_activity(self, gid: int, before: str) -> List[Dict[str, Any]]:
+        """
+        Every warn, jail and verify of a guild recorded before `before`, oldest
+        first, with only kind, user_id, time (jailed_at for jails) and freed_at.
+        Used to rebuild the `stats` aggregates off the command path.
+        """
+        raise NotImplementedError
+
+    # --- Jail specifics ---
+    async def count_jails(self, gid: int, uid: str) -> int:
+        raise NotImplementedError
+
+    async def open_jail(self, doc: Dict[str, Any]) -> Optional[str]:
+        """
+        Inserts an open jail record unless the user already has one in that guild.
+        Returns the new record id, or None if an open jail already exists.
+        """
+        raise NotImplementedError
+
+    async def close_active_jail(self, gid: int, uid: str, free_by: str, free_reason: str, freed_at: str) -> bool:
+        """Marks the user's open jail record as freed. Returns True if one was closed."""
+        raise NotImplementedError
+
+    async def active_jails(self, gid: Optional[int] = None) -> List[Dict[str, Any]]:
+        """All open jail records (guild_id, user_id, roles), across guilds or for one guild."""
+        raise NotImplementedError
+
+    async def jail_expiries(self, limit: int, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Open timed jails ordered by expires_at, earliest first (guild_id, user_id, roles, expires_at).
+        With `until`, only jails that expire at or before it.
+        """
+        raise NotImplementedError
+
+    # --- Deleted actions counter ---
+    async def increment_deleted_count(self, gid: int, uid: str):
+        raise NotImplementedError
+
+    async def get_deleted_count(self, gid: int, uid: str) -> int:
+        raise NotImplementedError
+
+    # --- `r all` serial number map ---
+    async def replace_record_map(self, gid: int, uid: str, entries: List[Dict[str, Any]]):
+        """Replaces the user's serial-number map with entries ({id, action_type, record_rowid})."""
+        raise NotImplementedError
+
+    async def get_record_map_entry(self, gid: int, uid: str, number: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def clear_record_map(self, gid: int, uid: str):
+        raise NotImplementedError
+
+    # --- Pending verification queue ---
+    async def enqueue_verification(self, gid: int, uid: str, joined_at: str):
+        """Adds a member to the guild's pending queue (no-op if already queued)."""
+        raise NotImplementedError
+
+    async def dequeue_verifications(self, gid: int, uids: List[str]) -> List[Dict[str, Any]]:
+        """Removes members from the queue and returns their entries ({user_id, joined_at})."""
+        raise NotImplementedError
+
+    async def pending_verifications(self, gid: int, limit: int) -> List[Dict[str, Any]]:
+        """Oldest pending members first ({user_id, joined_at})."""
+        raise NotImplementedError
+
+    async def count_pending_verifications(self, gid: int) -> int:
+        raise NotImplementedError
+
+    async def verify_waits(self, gid: int, since: str, limit: int = 1000) -> List[float]:
+        """Join-to-verify times (seconds) of the guild's most recent verifications since `since`."""
+        raise NotImplementedError
+
+    # --- External moderator actions (read from the audit log) ---
+    async def insert_mod_actions(self, docs: List[Dict[str, Any]]) -> int:
+        """
+        Stores bans / kicks made outside the bot ({guild_id, entry_id, user_id,
+        mod_id, action, reason, time}). Audit log entries already stored are
+        skipped. Returns how many were new.
+        """
+        raise NotImplementedError
+
+    async def count_mod_actions(self, gid: int, since: str) -> Dict[str, Dict[str, int]]:
+        """External actions with time >= since, per moderator and action: {mod_id: {action: n}}."""
+        raise NotImplementedError
+
+    async def attribute_jail_release(self, gid: int, uid: str, placeholder_reason: str, freed_from: str, freed_to: str,
+                                     free_by: str, free_reason: str) -> bool:
+        """
+        Re-attributes one jail record to the moderator who actually acted: the user's
+        latest record still closed with `placeholder_reason` (e.g. by an external ban)
+        and freed between `freed_from` and `freed_to`. Returns True if it changed.
+        """
+        raise NotImplementedError
+
+    # --- Leases (singleton background jobs across processes) ---
+    async def acquire_lease(self, name: str, holder: str, ttl: float, token: Optional[int] = None, now: Optional[float] = None) -> Optional[int]:
+        """
+        Renews the lease if `holder` still owns it with `token`, otherwise takes
+        it over if it is free or expired. Returns the fencing token now held,
+        or None if another holder owns an unexpired lease. A takeover always
+        yields a new token. `now` is epoch seconds (defaults to time.time()).
+        """
+        raise NotImplementedError
+
+    async def release_lease(self, name: str, holder: str, token: int):
+        """Expires the lease immediately if `holder` still owns it with `token`."""
+        raise NotImplementedError
+
+    async def lease_info(self, name: str) -> Optional[Dict[str, Any]]:
+        """Current lease state: {holder, token, expires_at (epoch seconds)}."""
+        raise NotImplementedError
+
+    async def claim_lease_run(self, name: str, holder: str, token: int, period: str, now: Optional[float] = None) -> bool:
+        """
+        Records on the lease that its job ran for `period` (e.g. a date), in one
+        conditional write: only if `holder` still holds it with `token` and
+        nothing was recorded for `period` yet. True means the caller may run it.
+        """
+        raise NotImplementedError
+
+
+def _new_lease_token(now: float) -> int:
+    # Start from the clock so a lease that expired and was garbage collected
+    # never hands out a token an old holder might still carry
+    return int(now * 1000)
+
+
+# ==================== MONGODB ====================
+
+class PoolWaitStats:
+    """
+    Checkout metrics of one MongoDB connection pool, fed by a pymongo pool
+    listener from driver threads: how long operations waited for a connection,
+    failed checkouts, and connections open / in use.
+    """
+
+    def __init__(self, samples: int = 1000):
+        self._lock = threading.Lock()
+        self.waits: deque = deque(maxlen=samples)
+        self.max_wait = 0.0
+        self.checkouts = 0
+        self.failed = 0
+        self.open = 0
+        self.in_use = 0
+
+    def checked_out(self, wait: float):
+        with self._lock:
+            self.waits.append(wait)
+            self.max_wait = max(self.max_wait, wait)
+            self.checkouts += 1
+            self.in_use += 1
+
+    def percentile(self, pct: float) -> float:
+        with self._lock:
+            ordered = sorted(self.waits)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "wait_p50_ms": self.percentile(50) * 1000,
+            "wait_p99_ms": self.percentile(99) * 1000,
+            "wait_max_ms": self.max_wait * 1000,
+            "checkouts": self.checkouts,
+            "failed": self.failed,
+            "open": self.open,
+            "in_use": self.in_use,
+        }
+
+
+def _pool_listener(stats: PoolWaitStats):
+    """A pymongo ConnectionPoolListener feeding `stats` (pymongo is only imported for the Mongo backend)."""
+    from pymongo import monitoring
+
+    class PoolWaitListener(monitoring.ConnectionPoolListener):
+        def __init__(self):
+            # Driver versions without event.duration: checkout start per driver thread
+            self._started = threading.local()
+
+        def connection_check_out_started(self, event):
+            self._started.at = time.monotonic()
+
+        def connection_checked_out(self, event):
+            wait = getattr(event, "duration", None)
+            if wait is None:
+                wait = time.monotonic() - getattr(self._started, "at", time.monotonic())
+            stats.checked_out(wait)
+
+        def connection_check_out_failed(self, event):
+            with stats._lock:
+                stats.failed += 1
+
+        def connection_checked_in(self, event):
+            with stats._lock:
+                stats.in_use = max(0, stats.in_use - 1)
+
+        def connection_created(self, event):
+            with stats._lock:
+                stats.open += 1
+
+        def connection_closed(self, event):
+            with stats._lock:
+                stats.open = max(0, stats.open - 1)
+
+        def pool_cleared(self, event):
+            pass
+
+        def pool_created(self, event):
+            pass
+
+        def pool_ready(self, event):
+            pass
+
+        def pool_closed(self, event):
+            pass
+
+        def connection_ready(self, event):
+            pass
+
+    return PoolWaitListener()
+
+
+class MongoStorage(Storage):
+    """
+    MongoDB backend with two connection pools, so report-style queries never
+    queue latency-sensitive lookups (prefixes, config, single records) behind them:
+      - interactive: everything by default, primary reads
+      - analytics: `mr` counts, search and verify wait stats, read from a
+        secondary at most `max_staleness` seconds behind (primary if none is
+        fresh enough), plus `stats` rebuilds, which read the primary through
+        this pool because they must see every write up to their cutoff
+    `analytics_pool_size=0` puts analytics on the interactive pool.
+    `compressors` / `analytics_compressors` set wire compression per pool,
+    e.g. "zstd,zlib" (the server picks the first it supports).
+    """
+
+    def __init__(self, uri: str, db_name: str = "ladynight_bot", pool_size: int = 50, min_pool_size: int = 0,
+                 analytics_pool_size: int = 10, max_staleness: int = 120,
+                 compressors: str = "", analytics_compressors: str = ""):
+        import motor.motor_asyncio as motor
+        from pymongo import ReadPreference
+
+        self.pools = {"interactive": PoolWaitStats()}
+        options: Dict[str, Any] = {"maxPoolSize": pool_size, "minPoolSize": min_pool_size, "appname": "ladynight"}
+        self.mongo_client = motor.AsyncIOMotorClient(
+            uri, event_listeners=[_pool_listener(self.pools["interactive"])],
+            **options, **({"compressors": compressors} if compressors else {})
+        )
+        self.db = self.mongo_client[db_name]
+
+        if analytics_pool_size:
+            self.pools["analytics"] = PoolWaitStats()
+            self.analytics_client = motor.AsyncIOMotorClient(
+                uri, event_listeners=[_pool_listener(self.pools["analytics"])],
+                **dict(options, maxPoolSize=analytics_pool_size, minPoolSize=0, appname="ladynight-analytics"),
+                readPreference="secondaryPreferred", maxStalenessSeconds=max_staleness,
+                **({"compressors": analytics_compressors} if analytics_compressors else {})
+            )
+            self.analytics_db = self.analytics_client[db_name]
+            self.analytics_primary_db = self.analytics_client.get_database(db_name, read_preference=ReadPreference.PRIMARY)
+        else:
+            self.analytics_client = None
+            self.analytics_db = self.analytics_primary_db = self.db
+        self.config_col = self.db.config
+        self.warnings_col = self.db.warnings
+        self.jail_col = self.db.jail
+        self.verifications_col = self.db.verifications
+        self.deleted_actions_col = self.db.deleted_actions
+        self.all_records_col = self.db.all_records # Temporary map
+        self.leases_col = self.db.leases
+        self.pending_verifications_col = self.db.pending_verifications
+        self.mod_actions_col = self.db.mod_actions
+
+    def _col(self, kind: str, analytics: bool = False):
+        if kind not in RECORD_TABLES:
+            raise ValueError(f"Unknown record kind: {kind}")
+        return (self.analytics_db if analytics else self.db)[RECORD_TABLES[kind]]
+
+    @staticmethod
+    def _oid(rid: Any):
+        from bson.objectid import ObjectId
+        try:
+            return ObjectId(rid)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _out(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if doc is not None and "_id" in doc:
+            doc["_id"] = str(doc["_id"])
+        return doc
+
+    async def setup(self):
+        await self.config_col.create_index([("guild_id", 1), ("key", 1)], unique=True)
+        await self.config_col.create_index([("key", 1), ("value", 1)])
+        await self.warnings_col.create_index([("guild_id", 1), ("user_id", 1), ("time", 1)])
+        await self.warnings_col.create_index([("guild_id", 1), ("time", 1)])
+        await self.verifications_col.create_index([("guild_id", 1), ("user_id", 1), ("time", 1)])
+        await self.verifications_col.create_index([("guild_id", 1), ("time", 1)])
+        await self.jail_col.create_index([("guild_id", 1), ("user_id", 1), ("freed_at", 1)])
+        await self.jail_col.create_index([("guild_id", 1), ("jailed_at", 1)])
+        await self.jail_col.create_index([("guild_id", 1), ("freed_at", 1)])
+        # Cross-guild history (`r global`) is looked up by user first
+        await self.warnings_col.create_index([("user_id", 1), ("time", 1)])
+        await self.verifications_col.create_index([("user_id", 1), ("time", 1)])
+        await self.jail_col.create_index([("user_id", 1), ("jailed_at", 1)])
+        # At most one open jail per user; open_jail relies on this to reject a concurrent second jail
+        from pymongo.errors import OperationFailure
+        try:
+            await self.jail_col.create_index(
+                [("guild_id", 1), ("user_id", 1)],
+                name="one_open_jail",
+                unique=True,
+                partialFilterExpression={"freed_at": {"$type": "null"}}
+            )
+        except OperationFailure as e:
+            print(f"❌ Could not create unique open-jail index (duplicate open jails?): {e}")
+        # Only timed jails carry a string expires_at, so the index stays as small as the pending set
+        await self.jail_col.create_index(
+            [("expires_at", 1), ("freed_at", 1)],
+            name="pending_expiry",
+            partialFilterExpression={"expires_at": {"$type": "string"}}
+        )
+        await self.pending_verifications_col.create_index([("guild_id", 1), ("user_id", 1)], unique=True)
+        await self.pending_verifications_col.create_index([("guild_id", 1), ("joined_at", 1)])
+        await self.mod_actions_col.create_index([("guild_id", 1), ("entry_id", 1)], unique=True)
+        await self.mod_actions_col.create_index([("guild_id", 1), ("time", 1)])
+        # Abandoned leases are removed a day after they expire
+        await self.leases_col.create_index("expires_at", expireAfterSeconds=86400)
+        await self.deleted_actions_col.create_index([("guild_id", 1), ("user_id", 1)], unique=True)
+        await self.all_records_col.create_index([("guild_id", 1), ("user_id", 1), ("id", 1)])
+        # Text indexes for `r search`, prefixed by guild so each query only touches one guild
+        await self.warnings_col.create_index([("guild_id", 1), ("reason", "text")], name="guild_reason_text")
+        await self.verifications_col.create_index([("guild_id", 1), ("reason", "text")], name="guild_reason_text")
+        await self.jail_col.create_index([("guild_id", 1), ("reason", "text"), ("free_reason", "text")], name="guild_reason_text")
+
+    async def close(self):
+        self.mongo_client.close()
+        if self.analytics_client is not None:
+            self.analytics_client.close()
+
+    def pool_stats(self):
+        return {name: stats.snapshot() for name, stats in self.pools.items()}
+
+    async def cfg_get(self, gid, key):
+        doc = await self.config_col.find_one({"guild_id": gid, "key": key})
+        return doc.get("value") if doc else None
+
+    async def cfg_set(self, gid, key, value):
+        await self.config_col.update_one(
+            {"guild_id": gid, "key": key},
+            {"$set": {"value": value}},
+            upsert=True
+        )
+
+    async def cfg_guilds(self, key, value):
+        cursor = self.config_col.find({"key": key, "value": value}, {"_id": 0, "guild_id": 1})
+        return [doc["guild_id"] async for doc in cursor]
+
+    @staticmethod
+    def _check_doc(kind, doc):
+        # Same fields SQLite has columns for, so both backends reject the same documents
+        for field in doc:
+            if field not in ("guild_id", "user_id"):
+                _check_field(kind, field)
+
+    async def insert_record(self, kind, doc):
+        self._check_doc(kind, doc)
+        result = await self._col(kind).insert_one(dict(doc))
+        return str(result.inserted_id)
+
+    async def insert_records(self, kind, docs):
+        if not docs:
+            return 0
+        for doc in docs:
+            self._check_doc(kind, doc)
+        result = await self._col(kind).insert_many([dict(d) for d in docs], ordered=False)
+        return len(result.inserted_ids)
+
+    async def get_record(self, kind, gid, rid):
+        object_id = self._oid(rid)
+        if object_id is None:
+            return None
+        return self._out(await self._col(kind).find_one({"_id": object_id, "guild_id": gid}))
+
+    async def list_records(self, kind, gid, uid, sort_field=None):
+        cursor = self._col(kind).find({"guild_id": gid, "user_id": uid})
+        if sort_field:
+            _check_field(kind, sort_field)
+            cursor = cursor.sort(sort_field, 1)
+        return [self._out(doc) async for doc in cursor]
+
+    async def delete_record(self, kind, gid, rid):
+        object_id = self._oid(rid)
+        if object_id is None:
+            return False
+        result = await self._col(kind).delete_one({"_id": object_id, "guild_id": gid})
+        return result.deleted_count > 0
+
+    async def update_record(self, kind, gid, rid, fields):
+        for field in fields:
+            _check_field(kind, field)
+        object_id = self._oid(rid)
+        if object_id is None:
+            return False
+        result = await self._col(kind).update_one({"_id": object_id, "guild_id": gid}, {"$set": fields})
+        return result.modified_count > 0
+
+    async def count_by_mod(self, kind, gid, time_field, mod_field, since):
+        _check_field(kind, time_field)
+        _check_field(kind, mod_field)
+        pipeline = [
+            {"$match": {"guild_id": gid, time_field: {"$gte": since}}},
+            {"$group": {"_id": f"${mod_field}", "count": {"$sum": 1}}}
+        ]
+        counts = {}
+        async for doc in self._col(kind, analytics=True).aggregate(pipeline):
+            if doc['_id']:
+                counts[doc['_id']] = doc['count']
+        return counts
+
+    async def search_records(self, gid, terms, since=None, limit=10, offset=0):
+        if not terms:
+            return []
+        results = []
+        # Each collection returns its own best (offset + limit); the merged ranking is sliced after
+        for kind in RECORD_TABLES:
+            query = {"guild_id": gid, "$text": {"$search": " ".join(terms)}}
+            if since:
+                query[RECORD_TIME_FIELDS[kind]] = {"$gte": since}
+            cursor = (
+                self._col(kind, analytics=True)
+                .find(query, {"score": {"$meta": "textScore"}})
+                .sort([("score", {"$meta": "textScore"})])
+                .limit(offset + limit)
+            )
+            async for doc in cursor:
+                doc["kind"] = kind
+                results.append(self._out(doc))
+        results.sort(key=lambda d: d["score"], reverse=True)
+        return results[offset:offset + limit]
+
+    async def user_history(self, uid, gids):
+        if not gids:
+            return []
+        match = {"$match": {"user_id": uid, "guild_id": {"$in": list(gids)}}}
+        fields = {
+            "warn": {"guild_id": 1, "mod": "$mod_id", "reason": 1, "time": 1},
+            "verify": {"guild_id": 1, "mod": "$mod_id", "reason": 1, "time": 1},
+            "jail": {"guild_id": 1, "mod": "$jailer", "reason": 1, "time": "$jailed_at", "freed_at": 1},
+        }
+
+        def branch(kind):
+            return [match, {"$project": dict(fields[kind], kind={"$literal": kind})}]
+
+        # One round trip: the other collections are unioned into the warnings pipeline
+        pipeline = branch("warn") + [
+            {"$unionWith": {"coll": RECORD_TABLES[kind], "pipeline": branch(kind)}} for kind in ("verify", "jail")
+        ] + [{"$sort": {"time": -1}}]
+        return [self._out(doc) async for doc in self.warnings_col.aggregate(pipeline)]
+
+    async def guild_activity(self, gid, before):
+        fields = {
+            "warn": {"_id": 0, "user_id": 1, "time": 1},
+            "verify": {"_id": 0, "user_id": 1, "time": 1},
+            "jail": {"_id": 0, "user_id": 1, "time": "$jailed_at", "freed_at": 1},
+        }
+        time_field = {"warn": "time", "verify": "time", "jail": "jailed_at"}
+
+        def branch(kind):
+            return [
+                {"$match": {"guild_id": gid, time_field[kind]: {"$lt": before}}},
+                {"$project": dict(fields[kind], kind={"$literal": kind})}
+            ]
+
+        pipeline = branch("warn") + [
+            {"$unionWith": {"coll": RECORD_TABLES[kind], "pipeline": branch(kind)}} for kind in ("verify", "jail")
+        ] + [{"$sort": {"time": 1}}]
+        # Analytics pool, but primary reads: the rebuild must include every write before `before`
+        return [doc async for doc in self.analytics_primary_db.warnings.aggregate(pipeline, allowDiskUse=True)]
+
+    async def count_jails(self, gid, uid):
+        return await self.jail_col.count_documents({"guild_id": gid, "user_id": uid, "jailed_at": {"$ne": None}})
+
+    async def open_jail(self, doc):
+        from pymongo.errors import DuplicateKeyError
+        self._check_doc("jail", doc)
+        try:
+            result = await self.jail_col.insert_one(dict(doc, freed_at=None))
+        except DuplicateKeyError:
+            return None
+        return str(result.inserted_id)
+
+    async def close_active_jail(self, gid, uid, free_by, free_reason, freed_at):
+        result = await self.jail_col.update_one(
+            {"guild_id": gid, "user_id": uid, "freed_at": None},
+            {"$set": {"free_by": free_by, "free_reason": free_reason, "freed_at": freed_at}}
+        )
+        return result.modified_count > 0
+
+    async def active_jails(self, gid=None):
+        query = {"freed_at": None} if gid is None else {"guild_id": gid, "freed_at": None}
+        cursor = self.jail_col.find(query, {"_id": 0, "user_id": 1, "roles": 1, "guild_id": 1})
+        return [doc async for doc in cursor]
+
+    async def jail_expiries(self, limit, until=None):
+        expires = {"$type": "string"}
+        if until:
+            expires["$lte"] = until
+        cursor = self.jail_col.find(
+            {"expires_at": expires, "freed_at": None},
+            {"_id": 0, "guild_id": 1, "user_id": 1, "roles": 1, "expires_at": 1}
+        ).sort("expires_at", 1).limit(limit)
+        return [doc async for doc in cursor]
+
+    async def increment_deleted_count(self, gid, uid):
+        await self.deleted_actions_col.update_one(
+            {"guild_id": gid, "user_id": uid},
+            {"$inc": {"count": 1}},
+            upsert=True
+        )
+
+    async def get_deleted_count(self, gid, uid):
+        doc = await self.deleted_actions_col.find_one({"guild_id": gid, "user_id": uid})
+        return doc.get("count", 0) if doc else 0
+
+    async def replace_record_map(self, gid, uid, entries):
+        await self.all_records_col.delete_many({"guild_id": gid, "user_id": uid})
+        if entries:
+            await self.all_records_col.insert_many(
+                [{"guild_id": gid, "user_id": uid, **e} for e in entries]
+            )
+
+    async def get_record_map_entry(self, gid, uid, number):
+        return await self.all_records_col.find_one({"guild_id": gid, "user_id": uid, "id": number})
+
+    async def clear_record_map(self, gid, uid):
+        await self.all_records_col.delete_many({"guild_id": gid, "user_id": uid})
+
+    async def enqueue_verification(self, gid, uid, joined_at):
+        await self.pending_verifications_col.update_one(
+            {"guild_id": gid, "user_id": uid},
+            {"$setOnInsert": {"joined_at": joined_at}},
+            upsert=True
+        )
+
+    async def dequeue_verifications(self, gid, uids):
+        query = {"guild_id": gid, "user_id": {"$in": list(uids)}}
+        docs = [d async for d in self.pending_verifications_col.find(query, {"_id": 0, "user_id": 1, "joined_at": 1})]
+        if docs:
+            await self.pending_verifications_col.delete_many(query)
+        return docs
+
+    async def pending_verifications(self, gid, limit):
+        cursor = self.pending_verifications_col.find(
+            {"guild_id": gid}, {"_id": 0, "user_id": 1, "joined_at": 1}
+        ).sort("joined_at", 1).limit(limit)
+        return [d async for d in cursor]
+
+    async def count_pending_verifications(self, gid):
+        return await self.pending_verifications_col.count_documents({"guild_id": gid})
+
+    async def verify_waits(self, gid, since, limit=1000):
+        cursor = self.analytics_db.verifications.find(
+            {"guild_id": gid, "time": {"$gte": since}, "wait_seconds": {"$ne": None}},
+            {"_id": 0, "wait_seconds": 1}
+        ).sort("time", -1).limit(limit)
+        return [d["wait_seconds"] async for d in cursor if d.get("wait_seconds") is not None]
+
+    async def insert_mod_actions(self, docs):
+        from pymongo.errors import BulkWriteError
+        if not docs:
+            return 0
+        try:
+            result = await self.mod_actions_col.insert_many([dict(d) for d in docs], ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Duplicate entry ids were ingested before; everything else still went in
+            return e.details.get("nInserted", 0)
+
+    async def count_mod_actions(self, gid, since):
+        pipeline = [
+            {"$match": {"guild_id": gid, "time": {"$gte": since}}},
+            {"$group": {"_id": {"mod_id": "$mod_id", "action": "$action"}, "count": {"$sum": 1}}}
+        ]
+        counts: Dict[str, Dict[str, int]] = {}
+        async for doc in self.analytics_db.mod_actions.aggregate(pipeline):
+            counts.setdefault(doc["_id"]["mod_id"], {})[doc["_id"]["action"]] = doc["count"]
+        return counts
+
+    async def attribute_jail_release(self, gid, uid, placeholder_reason, freed_from, freed_to, free_by, free_reason):
+        doc = await self.jail_col.find_one_and_update(
+            {"guild_id": gid, "user_id": uid, "free_reason": placeholder_reason, "freed_at": {"$gte": freed_from, "$lte": freed_to}},
+            {"$set": {"free_by": free_by, "free_reason": free_reason}},
+            sort=[("freed_at", -1)],
+            projection={"_id": 1}
+        )
+        return doc is not None
+
+    async def acquire_lease(self, name, holder, ttl, token=None, now=None):
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+        now = time.time() if now is None else now
+        now_dt = datetime.fromtimestamp(now, UTC)
+        expires = datetime.fromtimestamp(now + ttl, UTC)
+
+        if token is not None:
+            result = await self.leases_col.update_one(
+                {"_id": name, "holder": holder, "token": token, "expires_at": {"$gt": now_dt}},
+                {"$set": {"expires_at": expires}}
+            )
+            if result.modified_count:
+                return token
+
+        doc = await self.leases_col.find_one_and_update(
+            {"_id": name, "expires_at": {"$lte": now_dt}},
+            {"$set": {"holder": holder, "expires_at": expires}, "$inc": {"token": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            return doc["token"]
+
+        try:
+            await self.leases_col.insert_one({"_id": name, "holder": holder, "token": _new_lease_token(now), "expires_at": expires})
+        except DuplicateKeyError:
+            return None
+        return _new_lease_token(now)
+
+    async def release_lease(self, name, holder, token):
+        await self.leases_col.update_one(
+            {"_id": name, "holder": holder, "token": token},
+            {"$set": {"expires_at": datetime.fromtimestamp(0, UTC)}}
+        )
+
+    async def claim_lease_run(self, name, holder, token, period, now=None):
+        now = time.time() if now is None else now
+        result = await self.leases_col.update_one(
+            {"_id": name, "holder": holder, "token": token, "expires_at": {"$gt": datetime.fromtimestamp(now, UTC)}, "last_run": {"$ne": period}},
+            {"$set": {"last_run": period}}
+        )
+        return result.modified_count > 0
+
+    async def lease_info(self, name):
+        doc = await self.leases_col.find_one({"_id": name})
+        if not doc:
+            return None
+        expires = doc["expires_at"]
+        if expires.tzinfo is None:
+            expires = expires.replace(tzinfo=UTC)
+        return {"holder": doc["holder"], "token": doc["token"], "expires_at": expires.timestamp()}
+
+
+# ==================== SQLITE (WAL) ====================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS config (
+    guild_id INTEGER NOT NULL,
+    key      TEXT    NOT NULL,
+    value    TEXT,
+    PRIMARY KEY (guild_id, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS warnings (
+    id       INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    user_id  TEXT    NOT NULL,
+    mod_id   TEXT,
+    reason   TEXT,
+    time     TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_warnings_user ON warnings (guild_id, user_id, time);
+CREATE INDEX IF NOT EXISTS ix_warnings_time ON warnings (guild_id, time);
+CREATE INDEX IF NOT EXISTS ix_warnings_user_time ON warnings (user_id, time);
+
+CREATE TABLE IF NOT EXISTS verifications (
+    id       INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    user_id  TEXT    NOT NULL,
+    mod_id   TEXT,
+    reason   TEXT,
+    time     TEXT,
+    wait_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS ix_verifications_user ON verifications (guild_id, user_id, time);
+CREATE INDEX IF NOT EXISTS ix_verifications_time ON verifications (guild_id, time);
+CREATE INDEX IF NOT EXISTS ix_verifications_user_time ON verifications (user_id, time);
+
+CREATE TABLE IF NOT EXISTS jail (
+    id          INTEGER PRIMARY KEY,
+    guild_id    INTEGER NOT NULL,
+    user_id     TEXT    NOT NULL,
+    jailer      TEXT,
+    reason      TEXT,
+    roles       TEXT,
+    jailed_at   TEXT,
+    freed_at    TEXT,
+    free_by     TEXT,
+    free_reason TEXT,
+    expires_at  TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jail_user ON jail (guild_id, user_id, freed_at);
+CREATE INDEX IF NOT EXISTS ix_jail_jailed ON jail (guild_id, jailed_at);
+CREATE INDEX IF NOT EXISTS ix_jail_freed ON jail (guild_id, freed_at);
+CREATE INDEX IF NOT EXISTS ix_jail_user_time ON jail (user_id, jailed_at);
+
+CREATE TABLE IF NOT EXISTS deleted_actions (
+    guild_id INTEGER NOT NULL,
+    user_id  TEXT    NOT NULL,
+    count    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS all_records (
+    guild_id     INTEGER NOT NULL,
+    user_id      TEXT    NOT NULL,
+    id           INTEGER NOT NULL,
+    action_type  TEXT    NOT NULL,
+    record_rowid TEXT    NOT NULL,
+    PRIMARY KEY (guild_id, user_id, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS pending_verifications (
+    guild_id  INTEGER NOT NULL,
+    user_id   TEXT    NOT NULL,
+    joined_at TEXT    NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_pending_verifications_joined ON pending_verifications (guild_id, joined_at);
+
+-- Bans / kicks made outside the bot, keyed by audit log entry id
+CREATE TABLE IF NOT EXISTS mod_actions (
+    guild_id INTEGER NOT NULL,
+    entry_id TEXT    NOT NULL,
+    user_id  TEXT    NOT NULL,
+    mod_id   TEXT    NOT NULL,
+    action   TEXT    NOT NULL,
+    reason   TEXT,
+    time     TEXT    NOT NULL,
+    PRIMARY KEY (guild_id, entry_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_mod_actions_time ON mod_actions (guild_id, time);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name       TEXT PRIMARY KEY,
+    holder     TEXT    NOT NULL,
+    token      INTEGER NOT NULL,
+    expires_at REAL    NOT NULL
+) WITHOUT ROWID;
+
+-- Full-text index over record reasons for `r search`.
+-- rowid = record id * 4 + kind code (1 warn, 2 verify, 3 jail), so the
+-- triggers below can maintain it by primary key. The guild is an indexed
+-- token ("g<id>") so a query only reads postings for its own guild.
+CREATE VIRTUAL TABLE IF NOT EXISTS record_search USING fts5(
+    body, guild, time UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS warnings_search_ai AFTER INSERT ON warnings BEGIN
+    INSERT INTO record_search (rowid, body, guild, time) VALUES (new.id * 4 + 1, new.reason, 'g' || new.guild_id, new.time);
+END;
+CREATE TRIGGER IF NOT EXISTS warnings_search_ad AFTER DELETE ON warnings BEGIN
+    DELETE FROM record_search WHERE rowid = old.id * 4 + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS warnings_search_au AFTER UPDATE OF reason, time ON warnings BEGIN
+    DELETE FROM record_search WHERE rowid = old.id * 4 + 1;
+    INSERT INTO record_search (rowid, body, guild, time) VALUES (new.id * 4 + 1, new.reason, 'g' || new.guild_id, new.time);
+END;
+
+CREATE TRIGGER IF NOT EXISTS verifications_search_ai AFTER INSERT ON verifications BEGIN
+    INSERT INTO record_search (rowid, body, guild, time) VALUES (new.id * 4 + 2, new.reason, 'g' || new.guild_id, new.time);
+END;
+CREATE TRIGGER IF NOT EXISTS verifications_search_ad AFTER DELETE ON verifications BEGIN
+    DELETE FROM record_search WHERE rowid = old.id * 4 + 2;
+END;
+CREATE TRIGGER IF NOT EXISTS verifications_search_au AFTER UPDATE OF reason, time ON verifications BEGIN
+    DELETE FROM record_search WHERE rowid = old.id * 4 + 2;
+    INSERT INTO record_search (rowid, body, guild, time) VALUES (new.id * 4 + 2, new.reason, 'g' || new.guild_id, new.time);
+END;
+
+CREATE TRIGGER IF NOT EXISTS jail_search_ai AFTER INSERT ON jail BEGIN
+    INSERT INTO record_search (rowid, body, guild, time)
+    VALUES (new.id * 4 + 3, coalesce(new.reason, '') || ' ' || coalesce(new.free_reason, ''), 'g' || new.guild_id, new.jailed_at);
+END;
+CREATE TRIGGER IF NOT EXISTS jail_search_ad AFTER DELETE ON jail BEGIN
+    DELETE FROM record_search WHERE rowid = old.id * 4 + 3;
+END;
+CREATE TRIGGER IF NOT EXISTS jail_search_au AFTER UPDATE OF reason, free_reason, jailed_at ON jail BEGIN
+    DELETE FROM record_search WHERE rowid = old.id * 4 + 3;
+    INSERT INTO record_search (rowid, body, guild, time)
+    VALUES (new.id * 4 + 3, coalesce(new.reason, '') || ' ' || coalesce(new.free_reason, ''), 'g' || new.guild_id, new.jailed_at);
+END;
+"""
+
+# Backfills the search index for databases created before it existed
+SQLITE_SEARCH_REBUILD = """
+INSERT INTO record_search (rowid, body, guild, time) SELECT id * 4 + 1, reason, 'g' || guild_id, time FROM warnings;
+INSERT INTO record_search (rowid, body, guild, time) SELECT id * 4 + 2, reason, 'g' || guild_id, time FROM verifications;
+INSERT INTO record_search (rowid, body, guild, time)
+    SELECT id * 4 + 3, coalesce(reason, '') || ' ' || coalesce(free_reason, ''), 'g' || guild_id, jailed_at FROM jail;
+"""
+
+SEARCH_KIND_CODES = {1: "warn", 2: "verify", 3: "jail"}
+
+# Columns added after a table was first released: (table, column, declaration)
+SQLITE_ADDED_COLUMNS = [
+    ("jail", "expires_at", "TEXT"),
+    ("verifications", "wait_seconds", "REAL"),
+    ("leases", "last_run", "TEXT"),
+]
+
+# Indexes on added columns, created once the columns exist
+SQLITE_POST_MIGRATION = """
+CREATE INDEX IF NOT EXISTS ix_jail_expiry ON jail (expires_at) WHERE freed_at IS NULL AND expires_at IS NOT NULL;
+"""
+
+# At most one open jail per user; open_jail relies on this to reject a concurrent second jail.
+# Created separately since it fails on databases that already hold duplicate open jails.
+SQLITE_OPEN_JAIL_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS ux_jail_open ON jail (guild_id, user_id) WHERE freed_at IS NULL"
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache reuses the prepared form on every call.
+SQL_CFG_GET = "SELECT value FROM config WHERE guild_id = ? AND key = ?"
+SQL_CFG_SET = (
+    "INSERT INTO config (guild_id, key, value) VALUES (?, ?, ?) "
+    "ON CONFLICT (guild_id, key) DO UPDATE SET value = excluded.value"
+)
+SQL_CFG_GUILDS = "SELECT guild_id FROM config WHERE key = ? AND value = ?"
+# ?1 = user id, ?2 = JSON array of guild ids
+SQL_USER_HISTORY = (
+    "SELECT 'warn' AS kind, id, guild_id, mod_id AS mod, reason, time, NULL AS freed_at FROM warnings "
+    "WHERE user_id = ?1 AND guild_id IN (SELECT value FROM json_each(?2)) "
+    "UNION ALL SELECT 'verify', id, guild_id, mod_id, reason, time, NULL FROM verifications "
+    "WHERE user_id = ?1 AND guild_id IN (SELECT value FROM json_each(?2)) "
+    "UNION ALL SELECT 'jail', id, guild_id, jailer, reason, jailed_at, freed_at FROM jail "
+    "WHERE user_id = ?1 AND guild_id IN (SELECT value FROM json_each(?2)) "
+    "ORDER BY time DESC"
+)
+SQL_GUILD_ACTIVITY = (
+    "SELECT 'warn' AS kind, user_id, time, NULL AS freed_at FROM warnings WHERE guild_id = ?1 AND time < ?2 "
+    "UNION ALL SELECT 'verify', user_id, time, NULL FROM verifications WHERE guild_id = ?1 AND time < ?2 "
+    "UNION ALL SELECT 'jail', user_id, jailed_at, freed_at FROM jail WHERE guild_id = ?1 AND jailed_at < ?2 "
+    "ORDER BY time"
+)
+SQL_COUNT_JAILS = "SELECT COUNT(*) FROM jail WHERE guild_id = ? AND user_id = ? AND jailed_at IS NOT NULL"
+SQL_CLOSE_JAIL = (
+    "UPDATE jail SET free_by = ?, free_reason = ?, freed_at = ? "
+    "WHERE guild_id = ? AND user_id = ? AND freed_at IS NULL"
+)
+SQL_ACTIVE_JAILS = "SELECT guild_id, user_id, roles FROM jail WHERE freed_at IS NULL"
+SQL_ACTIVE_JAILS_GUILD = "SELECT guild_id, user_id, roles FROM jail WHERE guild_id = ? AND freed_at IS NULL"
+SQL_JAIL_EXPIRIES = (
+    "SELECT guild_id, user_id, roles, expires_at FROM jail "
+    "WHERE freed_at IS NULL AND expires_at IS NOT NULL AND expires_at <= ? "
+    "ORDER BY expires_at LIMIT ?"
+)
+SQL_DELETED_INC = (
+    "INSERT INTO deleted_actions (guild_id, user_id, count) VALUES (?, ?, 1) "
+    "ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1"
+)
+SQL_DELETED_GET = "SELECT count FROM deleted_actions WHERE guild_id = ? AND user_id = ?"
+SQL_MAP_CLEAR = "DELETE FROM all_records WHERE guild_id = ? AND user_id = ?"
+SQL_MAP_INSERT = "INSERT INTO all_records (guild_id, user_id, id, action_type, record_rowid) VALUES (?, ?, ?, ?, ?)"
+SQL_MAP_GET = "SELECT id, action_type, record_rowid FROM all_records WHERE guild_id = ? AND user_id = ? AND id = ?"
+SQL_PENDING_ADD = "INSERT OR IGNORE INTO pending_verifications (guild_id, user_id, joined_at) VALUES (?, ?, ?)"
+SQL_PENDING_GET = "SELECT user_id, joined_at FROM pending_verifications WHERE guild_id = ? AND user_id = ?"
+SQL_PENDING_DEL = "DELETE FROM pending_verifications WHERE guild_id = ? AND user_id = ?"
+SQL_PENDING_OLDEST = "SELECT user_id, joined_at FROM pending_verifications WHERE guild_id = ? ORDER BY joined_at LIMIT ?"
+SQL_PENDING_COUNT = "SELECT COUNT(*) FROM pending_verifications WHERE guild_id = ?"
+SQL_VERIFY_WAITS = (
+    "SELECT wait_seconds FROM verifications "
+    "WHERE guild_id = ? AND time >= ? AND wait_seconds IS NOT NULL ORDER BY time DESC LIMIT ?"
+)
+SQL_MOD_ACTION_ADD = (
+    "INSERT OR IGNORE INTO mod_actions (guild_id, entry_id, user_id, mod_id, action, reason, time) "
+    "VALUES (:guild_id, :entry_id, :user_id, :mod_id, :action, :reason, :time)"
+)
+SQL_MOD_ACTION_COUNTS = "SELECT mod_id, action, COUNT(*) FROM mod_actions WHERE guild_id = ? AND time >= ? GROUP BY mod_id, action"
+SQL_JAIL_ATTRIBUTE = """
+UPDATE jail SET free_by = ?1, free_reason = ?2
+WHERE id = (
+    SELECT id FROM jail
+    WHERE guild_id = ?3 AND user_id = ?4 AND free_reason = ?5 AND freed_at BETWEEN ?6 AND ?7
+    ORDER BY freed_at DESC LIMIT 1
+)
+"""
+SQL_LEASE_RENEW = "UPDATE leases SET expires_at = ? WHERE name = ? AND holder = ? AND token = ? AND expires_at > ?"
+SQL_LEASE_TAKEOVER = "UPDATE leases SET holder = ?, token = token + 1, expires_at = ? WHERE name = ? AND expires_at <= ?"
+SQL_LEASE_CREATE = "INSERT OR IGNORE INTO leases (name, holder, token, expires_at) VALUES (?, ?, ?, ?)"
+SQL_LEASE_RELEASE = "UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ? AND token = ?"
+SQL_LEASE_GET = "SELECT holder, token, expires_at FROM leases WHERE name = ?"
+SQL_LEASE_CLAIM_RUN = "UPDATE leases SET last_run = ? WHERE name = ? AND holder = ? AND token = ? AND expires_at > ? AND last_run IS NOT ?"
+SQL_SEARCH = (
+    "SELECT rowid, bm25(record_search, 1.0, 0.0) AS rank FROM record_search "
+    "WHERE record_search MATCH ? AND coalesce(time, '') >= ? "
+    "ORDER BY rank LIMIT ? OFFSET ?"
+)
+
+
+class SQLiteStorage(Storage):
+    """
+    Embedded storage for single-host deployments.
+    One connection in WAL mode, driven by a single worker thread so the
+    event loop never blocks on disk and the connection is never shared
+    between threads concurrently.
+
+    Reports and scans (search, counts, activity rebuilds, history) run on a
+    second, read-only connection with its own worker thread. WAL lets it read
+    alongside the writer, so a multi-second stats rebuild never queues the
+    cfg_get every message makes behind it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ladynight-sqlite")
+        self._read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ladynight-sqlite-read")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._read_conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _run_read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, fn, *args)
+
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(SQLITE_SCHEMA)
+        for table, column, decl in SQLITE_ADDED_COLUMNS:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        conn.executescript(SQLITE_POST_MIGRATION)
+        try:
+            conn.execute(SQLITE_OPEN_JAIL_INDEX)
+        except sqlite3.IntegrityError as e:
+            print(f"❌ Could not create unique open-jail index (duplicate open jails?): {e}")
+        if conn.execute("SELECT 1 FROM record_search LIMIT 1").fetchone() is None:
+            conn.executescript(SQLITE_SEARCH_REBUILD)
+        self._conn = conn
+
+    def _connect_read(self):
+        # Opened after _connect so the schema and WAL mode already exist
+        uri = f"{Path(self.path).absolute().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=5000")
+        self._read_conn = conn
+
+    async def setup(self):
+        if self._conn is None:
+            await self._run(self._connect)
+        if self._read_conn is None:
+            await self._run_read(self._connect_read)
+
+    async def close(self):
+        if self._read_conn is not None:
+            await self._run_read(self._read_conn.close)
+            self._read_conn = None
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._read_executor.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+
+    # --- low level helpers (run on the worker thread) ---
+
+    def _fetchone(self, sql, params):
+        return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params):
+        return self._conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql, params) -> sqlite3.Cursor:
+        return self._conn.execute(sql, params)
+
+    def _read_all(self, sql, params):
+        # Read-only connection; runs on the read worker thread
+        return self._read_conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _row_to_doc(row: sqlite3.Row) -> Dict[str, Any]:
+        doc = dict(row)
+        doc["_id"] = str(doc.pop("id"))
+        return doc
+
+    @staticmethod
+    def _rowid(rid: Any) -> Optional[int]:
+        try:
+            return int(rid)
+        except (TypeError, ValueError):
+            return None
+
+    # --- Guild config ---
+
+    async def cfg_get(self, gid, key):
+        row = await self._run(self._fetchone, SQL_CFG_GET, (gid, key))
+        return row[0] if row else None
+
+    async def cfg_set(self, gid, key, value):
+        await self._run(self._execute, SQL_CFG_SET, (gid, key, value))
+
+    async def cfg_guilds(self, key, value):
+        rows = await self._run(self._fetchall, SQL_CFG_GUILDS, (key, value))
+        return [r[0] for r in rows]
+
+    # --- Records ---
+
+    async def insert_record(self, kind, doc):
+        table = RECORD_TABLES[kind]
+        fields = ["guild_id", "user_id"]
+        for field in doc:
+            if field in ("guild_id", "user_id"):
+                continue
+            _check_field(kind, field)
+            fields.append(field)
+        sql = f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+        cur = await self._run(self._execute, sql, tuple(doc.get(f) for f in fields))
+        return str(cur.lastrowid)
+
+    def _insert_many(self, kind, docs):
+        fields = ["guild_id", "user_id"] + sorted({f for d in docs for f in d} - {"guild_id", "user_id"})
+        for field in fields[2:]:
+            _check_field(kind, field)
+        sql = f"INSERT INTO {RECORD_TABLES[kind]} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(sql, [tuple(d.get(f) for f in fields) for d in docs])
+        return len(docs)
+
+    async def insert_records(self, kind, docs):
+        if not docs:
+            return 0
+        return await self._run(self._insert_many, kind, docs)
+
+    async def get_record(self, kind, gid, rid):
+        rowid = self._rowid(rid)
+        if rowid is None:
+            return None
+        row = await self._run(self._fetchone, f"SELECT * FROM {RECORD_TABLES[kind]} WHERE id = ? AND guild_id = ?", (rowid, gid))
+        return self._row_to_doc(row) if row else None
+
+    async def list_records(self, kind, gid, uid, sort_field=None):
+        sql = f"SELECT * FROM {RECORD_TABLES[kind]} WHERE guild_id = ? AND user_id = ?"
+        if sort_field:
+            _check_field(kind, sort_field)
+            sql += f" ORDER BY {sort_field}, id"
+        rows = await self._run(self._fetchall, sql, (gid, uid))
+        return [self._row_to_doc(r) for r in rows]
+
+    async def delete_record(self, kind, gid, rid):
+        rowid = self._rowid(rid)
+        if rowid is None:
+            return False
+        cur = await self._run(self._execute, f"DELETE FROM {RECORD_TABLES[kind]} WHERE id = ? AND guild_id = ?", (rowid, gid))
+        return cur.rowcount > 0
+
+    async def update_record(self, kind, gid, rid, fields):
+        for field in fields:
+            _check_field(kind, field)
+        rowid = self._rowid(rid)
+        if rowid is None or not fields:
+            return False
+        assignments = ", ".join(f"{f} = ?" for f in fields)
+        # Only count the row as modified if a value actually changes (Mongo semantics)
+        changed = " OR ".join(f"{f} IS NOT ?" for f in fields)
+        sql = f"UPDATE {RECORD_TABLES[kind]} SET {assignments} WHERE id = ? AND guild_id = ? AND ({changed})"
+        values = tuple(fields.values())
+        cur = await self._run(self._execute, sql, values + (rowid, gid) + values)
+        return cur.rowcount > 0
+
+    async def count_by_mod(self, kind, gid, time_field, mod_field, since):
+        _check_field(kind, time_field)
+        _check_field(kind, mod_field)
+        sql = (
+            f"SELECT {mod_field}, COUNT(*) FROM {RECORD_TABLES[kind]} "
+            f"WHERE guild_id = ? AND {time_field} >= ? GROUP BY {mod_field}"
+        )
+        rows = await self._run_read(self._read_all, sql, (gid, since))
+        return {r[0]: r[1] for r in rows if r[0]}
+
+    def _search(self, gid, terms, since, limit, offset):
+        # Every term is quoted so user input can never be read as FTS syntax
+        body = " OR ".join(f'"{t}"' for t in terms)
+        match = f'guild : "g{gid}" AND body : ({body})'
+        hits = self._read_conn.execute(SQL_SEARCH, (match, since or "", limit, offset)).fetchall()
+        results = []
+        for rowid, rank in hits:
+            kind = SEARCH_KIND_CODES[rowid % 4]
+            row = self._read_conn.execute(f"SELECT * FROM {RECORD_TABLES[kind]} WHERE id = ?", (rowid // 4,)).fetchone()
+            if row:
+                doc = self._row_to_doc(row)
+                doc["kind"] = kind
+                doc["score"] = -rank
+                results.append(doc)
+        return results
+
+    async def search_records(self, gid, terms, since=None, limit=10, offset=0):
+        if not terms:
+            return []
+        return await self._run_read(self._search, gid, terms, since, limit, offset)
+
+    async def user_history(self, uid, gids):
+        if not gids:
+            return []
+        rows = await self._run_read(self._read_all, SQL_USER_HISTORY, (uid, json.dumps(list(gids))))
+        return [self._row_to_doc(r) for r in rows]
+
+    async def guild_activity(self, gid, before):
+        # A full rebuild can be every record in the guild: convert off the event loop too
+        return await self._run_read(self._guild_activity, gid, before)
+
+    def _guild_activity(self, gid, before):
+        return [dict(r) for r in self._read_conn.execute(SQL_GUILD_ACTIVITY, (gid, before))]
+
+    # --- Jail specifics ---
+
+    async def count_jails(self, gid, uid):
+        row = await self._run(self._fetchone, SQL_COUNT_JAILS, (gid, uid))
+        return row[0]
+
+    async def open_jail(self, doc):
+        try:
+            return await self.insert_record("jail", dict(doc, freed_at=None))
+        except sqlite3.IntegrityError:
+            return None
+
+    async def close_active_jail(self, gid, uid, free_by, free_reason, freed_at):
+        cur = await self._run(self._execute, SQL_CLOSE_JAIL, (free_by, free_reason, freed_at, gid, uid))
+        return cur.rowcount > 0
+
+    async def active_jails(self, gid=None):
+        if gid is None:
+            rows = await self._run(self._fetchall, SQL_ACTIVE_JAILS, ())
+        else:
+            rows = await self._run(self._fetchall, SQL_ACTIVE_JAILS_GUILD, (gid,))
+        return [dict(r) for r in rows]
+
+    async def jail_expiries(self, limit, until=None):
+        # '~' sorts after every timestamp string, so no `until` means "all"
+        rows = await self._run(self._fetchall, SQL_JAIL_EXPIRIES, (until or "~", limit))
+        return [dict(r) for r in rows]
+
+    # --- Deleted actions counter ---
+
+    async def increment_deleted_count(self, gid, uid):
+        await self._run(self._execute, SQL_DELETED_INC, (gid, uid))
+
+    async def get_deleted_count(self, gid, uid):
+        row = await self._run(self._fetchone, SQL_DELETED_GET, (gid, uid))
+        return row[0] if row else 0
+
+    # --- `r all` serial number map ---
+
+    def _replace_map(self, gid, uid, entries):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(SQL_MAP_CLEAR, (gid, uid))
+            self._conn.executemany(
+                SQL_MAP_INSERT,
+                [(gid, uid, e["id"], e["action_type"], e["record_rowid"]) for e in entries]
+            )
+
+    async def replace_record_map(self, gid, uid, entries):
+        await self._run(self._replace_map, gid, uid, entries)
+
+    async def get_record_map_entry(self, gid, uid, number):
+        row = await self._run(self._fetchone, SQL_MAP_GET, (gid, uid, number))
+        return dict(row) if row else None
+
+    async def clear_record_map(self, gid, uid):
+        await self._run(self._execute, SQL_MAP_CLEAR, (gid, uid))
+
+    # --- Pending verification queue ---
+
+    async def enqueue_verification(self, gid, uid, joined_at):
+        await self._run(self._execute, SQL_PENDING_ADD, (gid, uid, joined_at))
+
+    def _dequeue(self, gid, uids):
+        docs = []
+        with self._conn:
+            self._conn.execute("BEGIN")
+            for uid in uids:
+                row = self._conn.execute(SQL_PENDING_GET, (gid, uid)).fetchone()
+                if row:
+                    docs.append(dict(row))
+                    self._conn.execute(SQL_PENDING_DEL, (gid, uid))
+        return docs
+
+    async def dequeue_verifications(self, gid, uids):
+        return await self._run(self._dequeue, gid, list(uids))
+
+    async def pending_verifications(self, gid, limit):
+        rows = await self._run(self._fetchall, SQL_PENDING_OLDEST, (gid, limit))
+        return [dict(r) for r in rows]
+
+    async def count_pending_verifications(self, gid):
+        row = await self._run(self._fetchone, SQL_PENDING_COUNT, (gid,))
+        return row[0]
+
+    async def verify_waits(self, gid, since, limit=1000):
+        rows = await self._run_read(self._read_all, SQL_VERIFY_WAITS, (gid, since, limit))
+        return [r[0] for r in rows]
+
+    # --- External moderator actions ---
+
+    def _insert_mod_actions(self, docs):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            before = self._conn.total_changes
+            self._conn.executemany(SQL_MOD_ACTION_ADD, docs)
+            return self._conn.total_changes - before
+
+    async def insert_mod_actions(self, docs):
+        if not docs:
+            return 0
+        return await self._run(self._insert_mod_actions, [dict(d) for d in docs])
+
+    async def count_mod_actions(self, gid, since):
+        counts: Dict[str, Dict[str, int]] = {}
+        for mod_id, action, count in await self._run_read(self._read_all, SQL_MOD_ACTION_COUNTS, (gid, since)):
+            counts.setdefault(mod_id, {})[action] = count
+        return counts
+
+    async def attribute_jail_release(self, gid, uid, placeholder_reason, freed_from, freed_to, free_by, free_reason):
+        cur = await self._run(self._execute, SQL_JAIL_ATTRIBUTE, (free_by, free_reason, gid, uid, placeholder_reason, freed_from, freed_to))
+        return cur.rowcount > 0
+
+    # --- Leases ---
+
+    def _acquire_lease(self, name, holder, ttl, token, now):
+        # BEGIN IMMEDIATE takes the write lock up front, so processes sharing
+        # the file serialise on it; this makes SQLite a local stand-in for failover tests
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if token is not None and self._conn.execute(SQL_LEASE_RENEW, (now + ttl, name, holder, token, now)).rowcount:
+                return token
+            if self._conn.execute(SQL_LEASE_TAKEOVER, (holder, now + ttl, name, now)).rowcount:
+                return self._conn.execute(SQL_LEASE_GET, (name,)).fetchone()["token"]
+            if self._conn.execute(SQL_LEASE_CREATE, (name, holder, _new_lease_token(now), now + ttl)).rowcount:
+                return _new_lease_token(now)
+            return None
+
+    async def acquire_lease(self, name, holder, ttl, token=None, now=None):
+        return await self._run(self._acquire_lease, name, holder, ttl, token, time.time() if now is None else now)
+
+    async def release_lease(self, name, holder, token):
+        await self._run(self._execute, SQL_LEASE_RELEASE, (name, holder, token))
+
+    async def claim_lease_run(self, name, holder, token, period, now=None):
+        now = time.time() if now is None else now
+        cur = await self._run(self._execute, SQL_LEASE_CLAIM_RUN, (period, name, holder, token, now, period))
+        return cur.rowcount > 0
+
+    async def lease_info(self, name):
+        row = await self._run(self._fetchone, SQL_LEASE_GET, (name,))
+        return dict(row) if row else None
+
+
+# ==================== WRAPPERS ====================
+
+# Every data method of the Storage interface (setup/close are lifecycle, not data)
+STORAGE_METHODS = [
+    name for name, fn in vars(Storage).items()
+    if asyncio.iscoroutinefunction(fn) and name not in ("setup", "close")
+]
+
+
+def _proxy(name: str):
+    async def method(self, *args, **kwargs):
+        return await self._call(name, *args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+class CircuitBreakerStorage(Storage):
+    """
+    Wraps a backend with a latency/error aware circuit breaker.
+
+    Every call gets a timeout. Errors, timeouts and calls slower than
+    `slow_threshold` count as failures; once `failure_threshold` of the last
+    `window` calls failed the breaker opens for `cooldown` seconds, then lets
+    a single probe call through (half-open) and closes again if it succeeds.
+
+    ANALYTICS_CALLS (reports, search, history scans, bulk loads at startup) are
+    expected to be slow on big deployments: they get `analytics_timeout` and never
+    count towards opening the breaker, so a few heavy reads cannot take
+    interactive ones down.
+
+    While open:
+      - cfg_get is served from a write-through cache of every config value seen
+      - writes in QUEUED_WRITES are queued in memory and replayed in order on recovery
+      - any other call raises StorageUnavailable immediately instead of stalling
+    Until the queue has drained, later QUEUED_WRITES join it too, so a newer
+    write can never be overtaken by an older queued one.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    # Writes that can be applied later without the caller needing a real result
+    QUEUED_WRITES = {"cfg_set", "insert_record", "open_jail", "close_active_jail", "increment_deleted_count", "enqueue_verification"}
+    # What a queued write reports back to its caller; anything not listed returns None
+    OPTIMISTIC_RESULTS = {"open_jail": "", "close_active_jail": True}
+    # Slow by nature; kept out of the failure accounting
+    ANALYTICS_CALLS = {
+        "search_records", "count_by_mod", "count_mod_actions", "guild_activity", "user_history", "verify_waits",
+        # Whole-deployment scans run on startup (jail cache, expiry heap, sharing guilds)
+        "active_jails", "jail_expiries", "cfg_guilds",
+    }
+
+    def __init__(self, inner: Storage, timeout: float = 2.0, slow_threshold: float = 0.5,
+                 failure_threshold: int = 5, window: int = 20, cooldown: float = 15.0,
+                 queue_limit: int = 10000, analytics_timeout: float = 30.0):
+        self.inner = inner
+        self.timeout = timeout
+        self.analytics_timeout = analytics_timeout
+        self.slow_threshold = slow_threshold
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._outcomes = deque(maxlen=window)  # True = failure
+        self._probe_in_flight = False
+        self._config: Dict[Tuple[int, str], Optional[str]] = {}
+        # (name, args, kwargs, future of a caller waiting for the real result, or None)
+        self.pending_writes: deque = deque(maxlen=queue_limit)
+        self.dropped_writes = 0
+        self._replay_task: Optional[asyncio.Task] = None
+        # Called with the new state on every transition (e.g. to announce it)
+        self.on_state_change: Optional[Callable[[str], Any]] = None
+
+    async def setup(self):
+        await self.inner.setup()
+
+    async def close(self):
+        await self.inner.close()
+
+    def pool_stats(self):
+        return self.inner.pool_stats()
+
+    def cached_cfg(self, gid: int, key: str) -> Optional[str]:
+        return self._config.get((gid, key))
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        if state == self.CLOSED:
+            self._outcomes.clear()
+            self._start_replay()
+        if self.on_state_change and state != self.HALF_OPEN:
+            self.on_state_change(state)
+
+    def _record(self, failed: bool):
+        if self.state == self.HALF_OPEN:
+            self._set_state(self.OPEN if failed else self.CLOSED)
+            return
+        self._outcomes.append(failed)
+        if failed and sum(self._outcomes) >= self.failure_threshold:
+            self._set_state(self.OPEN)
+
+    def trip(self):
+        """Forces the breaker open (e.g. when the backend is unreachable at startup)."""
+        self._set_state(self.OPEN)
+
+    def _allow(self) -> bool:
+        """Whether a call may reach the backend right now."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    async def _invoke(self, name: str, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(getattr(self.inner, name)(*args, **kwargs), timeout=self.timeout)
+        except ValueError:
+            # Caller error, not a backend failure
+            raise
+        except Exception:
+            self._record(True)
+            raise
+        finally:
+            # Also on cancellation, or a cancelled probe would keep the breaker half-open for good
+            self._probe_in_flight = False
+        self._record(time.monotonic() - started > self.slow_threshold)
+        return result
+
+    async def _call(self, name: str, *args, **kwargs):
+        if name == "cfg_get" and self.pending_writes and (args[0], args[1]) in self._config:
+            # Queued config writes are newer than what the backend holds until replay finishes
+            return self._config[(args[0], args[1])]
+        if name in self.ANALYTICS_CALLS:
+            return await self._call_analytics(name, *args, **kwargs)
+        if name in self.QUEUED_WRITES and self.pending_writes:
+            # Older writes are still queued: this one goes behind them
+            if self.state == self.CLOSED:
+                return await self._enqueue_and_wait(name, *args, **kwargs)
+            return self._degraded(name, *args, **kwargs)
+        if not self._allow():
+            return self._degraded(name, *args, **kwargs)
+
+        try:
+            result = await self._invoke(name, *args, **kwargs)
+        except asyncio.TimeoutError:
+            raise StorageUnavailable(f"{name} timed out after {self.timeout}s")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise StorageUnavailable(f"{name} failed: {e}") from e
+
+        if name == "cfg_get":
+            self._config[(args[0], args[1])] = result
+        elif name == "cfg_set":
+            self._config[(args[0], args[1])] = args[2]
+        return result
+
+    async def _call_analytics(self, name: str, *args, **kwargs):
+        # Never used as the half-open probe: a slow report says nothing about recovery
+        if self.state != self.CLOSED:
+            raise StorageUnavailable(f"Storage is degraded; {name} is unavailable")
+        try:
+            return await asyncio.wait_for(getattr(self.inner, name)(*args, **kwargs), timeout=self.analytics_timeout)
+        except asyncio.TimeoutError:
+            raise StorageUnavailable(f"{name} timed out after {self.analytics_timeout}s")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise StorageUnavailable(f"{name} failed: {e}") from e
+
+    def _queue(self, name: str, args, kwargs, waiter: Optional[asyncio.Future] = None):
+        if len(self.pending_writes) == self.pending_writes.maxlen:
+            self.dropped_writes += 1
+        self.pending_writes.append((name, args, kwargs, waiter))
+        if name == "cfg_set":
+            self._config[(args[0], args[1])] = args[2]
+
+    def _degraded(self, name: str, *args, **kwargs):
+        if name == "cfg_get":
+            return self._config.get((args[0], args[1]))
+        if name in self.QUEUED_WRITES:
+            self._queue(name, args, kwargs)
+            # Optimistic result: the write will be applied on replay
+            return self.OPTIMISTIC_RESULTS.get(name)
+        raise StorageUnavailable(f"Storage is degraded; {name} is unavailable")
+
+    async def _enqueue_and_wait(self, name: str, *args, **kwargs):
+        """Queues a write behind the ones being replayed and returns its real result once applied."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue(name, args, kwargs, waiter)
+        self._start_replay()
+        return await waiter
+
+    def _start_replay(self):
+        if self.pending_writes and (self._replay_task is None or self._replay_task.done()):
+            self._replay_task = asyncio.create_task(self._replay())
+
+    async def _replay(self):
+        """Applies queued writes in order. Stops (keeping the rest queued) if the backend fails again."""
+        replayed = 0
+        while self.pending_writes and self.state == self.CLOSED:
+            name, args, kwargs, waiter = self.pending_writes[0]
+            try:
+                result = await self._invoke(name, *args, **kwargs)
+            except ValueError as e:
+                # Will never succeed; drop it rather than block every write behind it
+                print(f"❌ Dropped queued {name}: {e}")
+                self.pending_writes.popleft()
+                if waiter is not None and not waiter.done():
+                    waiter.set_exception(e)
+                continue
+            except Exception as e:
+                print(f"❌ Replay of queued {name} failed: {e}")
+                self._release_waiters()
+                return
+            self.pending_writes.popleft()
+            if waiter is not None and not waiter.done():
+                waiter.set_result(result)
+            replayed += 1
+        # Reopened mid-replay: whoever waits gets the optimistic result, their write stays queued
+        self._release_waiters()
+        if replayed:
+            print(f"Replayed {replayed} queued storage writes.")
+
+    def _release_waiters(self):
+        for i, (name, args, kwargs, waiter) in enumerate(self.pending_writes):
+            if waiter is not None:
+                if not waiter.done():
+                    waiter.set_result(self.OPTIMISTIC_RESULTS.get(name))
+                self.pending_writes[i] = (name, args, kwargs, None)
+
+
+class FaultInjectingStorage(Storage):
+    """
+    Test double that wraps a backend and makes it slow or failing on demand.
+    Change `delay`, `jitter` and `fail_rate` at runtime to simulate a cluster
+    slowing down or failing over.
+    """
+
+    def __init__(self, inner: Storage, delay: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0):
+        self.inner = inner
+        self.delay = delay
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+
+    async def setup(self):
+        await self.inner.setup()
+
+    async def close(self):
+        await self.inner.close()
+
+    def pool_stats(self):
+        return self.inner.pool_stats()
+
+    async def _call(self, name: str, *args, **kwargs):
+        pause = self.delay + random.uniform(0, self.jitter)
+        if pause:
+            await asyncio.sleep(pause)
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise ConnectionError(f"Injected failure in {name}")
+        return await getattr(self.inner, name)(*args, **kwargs)
+
+
+for _name in STORAGE_METHODS:
+    setattr(CircuitBreakerStorage, _name, _proxy(_name))
+    setattr(FaultInjectingStorage, _name, _proxy(_name))
+
+
+def parse_faults(spec: str) -> Dict[str, float]:
+    """Parses a fault spec like 'delay=1.5,jitter=0.5,fail_rate=0.2'."""
+    faults = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, _, value = part.partition("=")
+        if key not in ("delay", "jitter", "fail_rate"):
+            raise ValueError(f"Unknown storage fault: {key}")
+        faults[key] = float(value)
+    return faults
+
+
+def create_storage(backend: str, mongo_uri: Optional[str] = None, sqlite_path: Optional[str] = None,
+                   faults: Optional[str] = None, breaker: bool = True, mongo_options: Optional[Dict[str, Any]] = None) -> Storage:
+    """
+    Builds the configured storage backend ('mongo' or 'sqlite'), optionally
+    wrapped in fault injection (for testing), inside a circuit breaker.
+    """
+    backend = (backend or "mongo").lower()
+    if backend == "sqlite":
+        store: Storage = SQLiteStorage(sqlite_path or os.path.join("data", "ladynight.db"))
+    elif backend == "mongo":
+        store = MongoStorage(mongo_uri, **(mongo_options or {}))
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    if faults:
+        store = FaultInjectingStorage(store, **parse_faults(faults))
+    if breaker:
+        store = CircuitBreakerStorage(store)
+    return store
@@ -0,0 +1,55 @@
+"""
+Shared fixtures. `store` runs every storage test against both backends:
+SQLite, and MongoDB. MongoDB is a real server when MONGO_TEST_URI points at one, e.g.
+    MONGO_TEST_URI=mongodb://localhost:27017 python -m pytest
+and otherwise mongomock-motor, an in-memory stand-in for the driver. Tests that
+need server-only features (text search, $unionWith, partial unique indexes)
+are marked `mongo_server` and skipped on mongomock.
+Each Mongo run gets its own throwaway database.
+"""
+import os
+import uuid
+
+import pytest
+
+from storage import SQLiteStorage
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongo_server: needs a real MongoDB server, not mongomock")
+
+
+@pytest.fixture(params=["sqlite", "mongo"])
+async def store(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        s = SQLiteStorage(str(tmp_path / "ladynight.db"))
+        await s.setup()
+        yield s
+        await s.close()
+        return
+
+    pytest.importorskip("motor")
+    uri = os.environ.get("MONGO_TEST_URI")
+    if not uri:
+        if request.node.get_closest_marker("mongo_server"):
+            pytest.skip("needs a MongoDB server (set MONGO_TEST_URI)")
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        import motor.motor_asyncio
+        monkeypatch.setattr(motor.motor_asyncio, "AsyncIOMotorClient", mongomock_motor.AsyncMongoMockClient)
+        uri = "mongodb://mongomock"
+    from storage import MongoStorage
+    db_name = f"ladynight_test_{uuid.uuid4().hex[:8]}"
+    # No analytics pool: secondaries could lag behind the writes a test just made
+    s = MongoStorage(uri, db_name=db_name, analytics_pool_size=0)
+    await s.setup()
+    yield s
+    await s.mongo_client.drop_database(db_name)
+    await s.close()
+
+
+@pytest.fixture
+async def sqlite_store(tmp_path):
+    s = SQLiteStorage(str(tmp_path / "ladynight.db"))
+    await s.setup()
+    yield s
+    await s.close()
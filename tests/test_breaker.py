@@ -0,0 +1,141 @@
+"""CircuitBreakerStorage over a real SQLite backend, made slow or failing with FaultInjectingStorage."""
+import asyncio
+
+import pytest
+
+from storage import CircuitBreakerStorage, FaultInjectingStorage, StorageUnavailable
+
+GID = 1001
+JAIL = {
+    "guild_id": GID, "user_id": "10", "jailer": "1", "reason": "raid", "roles": "[]",
+    "jailed_at": "2026-01-01 10:00:00", "freed_at": None, "expires_at": None,
+}
+
+
+@pytest.fixture
+def faults(sqlite_store):
+    return FaultInjectingStorage(sqlite_store)
+
+
+@pytest.fixture
+def breaker(faults):
+    return CircuitBreakerStorage(faults, timeout=0.5, slow_threshold=0.05, failure_threshold=3, window=5, cooldown=0.05)
+
+
+async def fail_until_open(breaker, faults):
+    faults.fail_rate = 1.0
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(StorageUnavailable):
+            await breaker.get_deleted_count(GID, "10")
+    assert breaker.state == breaker.OPEN
+
+
+async def recover(breaker, faults):
+    faults.fail_rate = 0.0
+    await asyncio.sleep(breaker.cooldown)
+    # The probe closes the breaker and starts the replay
+    await breaker.get_deleted_count(GID, "10")
+    assert breaker.state == breaker.CLOSED
+    if breaker._replay_task:
+        await breaker._replay_task
+
+
+async def test_opens_and_serves_degraded(breaker, faults):
+    await breaker.cfg_set(GID, "prefix", "!")
+    assert await breaker.cfg_get(GID, "prefix") == "!"
+    await fail_until_open(breaker, faults)
+
+    # Config from cache, writes queued with optimistic results, other reads refused
+    assert await breaker.cfg_get(GID, "prefix") == "!"
+    assert await breaker.open_jail(JAIL) == ""
+    with pytest.raises(StorageUnavailable):
+        await breaker.count_jails(GID, "10")
+    assert [w[0] for w in breaker.pending_writes] == ["open_jail"]
+
+
+async def test_slow_calls_open_the_breaker(breaker, faults):
+    faults.delay = 0.06
+    for _ in range(breaker.failure_threshold):
+        await breaker.cfg_get(GID, "prefix")
+    assert breaker.state == breaker.OPEN
+
+
+async def test_replay_keeps_write_order(breaker, faults, sqlite_store):
+    await fail_until_open(breaker, faults)
+    assert await breaker.open_jail(JAIL) == ""
+    await breaker.cfg_set(GID, "prefix", "old")
+
+    faults.fail_rate = 0.0
+    await asyncio.sleep(breaker.cooldown)
+    await breaker.get_deleted_count(GID, "10")
+    assert breaker.state == breaker.CLOSED
+    # Issued while the queue is still draining: must land after the queued writes, not before
+    faults.delay = 0.01
+    closed = await breaker.close_active_jail(GID, "10", free_by="1", free_reason="done", freed_at="2026-01-01 11:00:00")
+    await breaker.cfg_set(GID, "prefix", "new")
+
+    assert closed is True
+    assert not breaker.pending_writes
+    assert await sqlite_store.active_jails(GID) == []
+    assert await sqlite_store.cfg_get(GID, "prefix") == "new"
+    assert await breaker.cfg_get(GID, "prefix") == "new"
+
+
+async def test_invalid_queued_write_is_dropped_on_replay(breaker, faults, sqlite_store):
+    await fail_until_open(breaker, faults)
+    await breaker.insert_record("warn", {"guild_id": GID, "user_id": "10", "mood": "grumpy"})
+    await breaker.cfg_set(GID, "prefix", "!")
+    await recover(breaker, faults)
+    assert not breaker.pending_writes
+    assert await sqlite_store.cfg_get(GID, "prefix") == "!"
+
+
+async def test_analytics_calls_do_not_count_as_failures(breaker, faults):
+    faults.delay = 0.06
+    for _ in range(breaker.failure_threshold + 1):
+        await breaker.search_records(GID, ["raid"])
+        await breaker.guild_activity(GID, "~")
+    assert breaker.state == breaker.CLOSED
+
+    breaker.analytics_timeout = 0.01
+    for _ in range(breaker.failure_threshold + 1):
+        with pytest.raises(StorageUnavailable):
+            await breaker.user_history("10", [GID])
+    assert breaker.state == breaker.CLOSED
+
+
+async def test_analytics_refused_while_open(breaker, faults):
+    await fail_until_open(breaker, faults)
+    faults.fail_rate = 0.0
+    await asyncio.sleep(breaker.cooldown)
+    with pytest.raises(StorageUnavailable):
+        await breaker.count_mod_actions(GID, "2026-01-01 00:00:00")
+    # Not taken as the half-open probe
+    assert not breaker._probe_in_flight
+
+
+async def test_cancelled_probe_releases_half_open(breaker, faults):
+    await fail_until_open(breaker, faults)
+    faults.fail_rate = 0.0
+    faults.delay = 0.2
+    await asyncio.sleep(breaker.cooldown)
+    probe = asyncio.create_task(breaker.count_jails(GID, "10"))
+    await asyncio.sleep(0.02)
+    assert breaker.state == breaker.HALF_OPEN and breaker._probe_in_flight
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert not breaker._probe_in_flight
+
+    faults.delay = 0.0
+    assert await breaker.count_jails(GID, "10") == 0
+    assert breaker.state == breaker.CLOSED
+
+
+async def test_startup_scans_get_the_analytics_budget(breaker, faults):
+    await breaker.open_jail(JAIL)
+    # Slower than the interactive timeout, like the startup jail cache load on a big deployment
+    faults.delay = breaker.timeout + 0.05
+    assert [j["user_id"] for j in await breaker.active_jails()] == ["10"]
+    assert await breaker.jail_expiries(limit=10) == []
+    assert breaker.state == breaker.CLOSED
@@ -0,0 +1,504 @@
+"""
+Command conformance: warn / jail / free / r (all, warn, search) / d / e / v / stats driven end to end on both
+storage backends (the `store` fixture, see conftest.py), with stand-ins for
+the Discord objects the commands touch.
+"""
+import asyncio
+import types
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+pytest.importorskip("discord")
+
+import discord
+
+import cogs.verification
+from cogs.moderation import Moderation
+from cogs.records import Records
+from cogs.reports import Reports
+from cogs.verification import Verification
+from helpers import confirm_action, format_time
+from settings import CONFIRM_NO_ID, CONFIRM_YES_ID, SEARCH_MAX_SINCE_DAYS, SEARCH_PAGE_SIZE
+from state import ConfirmationDispatcher, KeyedLocks, ModerationStats, RecordViewCache, UserSummaryCache
+
+GID = 1001
+PRISONER, MEMBER_ROLE, EVERYONE, TO_VERIFY, NORMIE = 50, 51, 52, 53, 54
+
+
+class FakeRole:
+    def __init__(self, rid):
+        self.id = rid
+
+    # Equal by id, like discord.Role
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMember:
+    def __init__(self, uid, roles=(), joined_at=None, fail_edit=False):
+        self.id = uid
+        self.name = f"user{uid}"
+        self.mention = f"<@{uid}>"
+        self.roles = list(roles)
+        self.joined_at = joined_at
+        self.fail_edit = fail_edit
+        self.dms = []
+
+    async def edit(self, roles, reason=None):
+        if self.fail_edit:
+            raise discord.HTTPException(types.SimpleNamespace(status=403, reason="Forbidden"), "Missing Permissions")
+        self.roles = list(roles)
+
+    async def send(self, embed=None):
+        self.dms.append(embed)
+
+
+class FakeGuild:
+    def __init__(self, members):
+        self.id = GID
+        self.name = "Test Server"
+        self._roles = {rid: FakeRole(rid) for rid in (PRISONER, MEMBER_ROLE, EVERYONE, TO_VERIFY, NORMIE)}
+        self.default_role = self._roles[EVERYONE]
+        self._members = {m.id: m for m in members}
+
+    def get_role(self, rid):
+        return self._roles.get(rid)
+
+    def get_member(self, uid):
+        return self._members.get(uid)
+
+    def get_channel(self, cid):
+        return None
+
+
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, content=None, embed=None):
+        self.id = FakeMessage._next_id
+        FakeMessage._next_id += 1
+        self.content, self.embed = content, embed
+
+    @property
+    def embeds(self):
+        return [self.embed] if self.embed else []
+
+    async def edit(self, content=None, embed=None, view=None):
+        self.content = content if content is not None else self.content
+        self.embed = embed
+
+
+class FakeContext:
+    def __init__(self, bot, guild, author):
+        self.bot, self.guild, self.author = bot, guild, author
+        self.prefix = "ln."
+        self.message = types.SimpleNamespace(guild=guild)
+        self.replies = []
+
+    async def reply(self, content=None, embed=None, view=None):
+        message = FakeMessage(content, embed)
+        self.replies.append(message)
+        return message
+
+    @property
+    def last(self):
+        return self.replies[-1]
+
+
+async def confirm(message_id, user_id, timeout):
+    return True
+
+
+class FakeResponse:
+    def __init__(self):
+        self.sent, self.edited = [], []
+
+    async def send_message(self, content, ephemeral=False):
+        self.sent.append(content)
+
+    async def edit_message(self, embed=None, view=None):
+        self.edited.append(embed)
+
+
+def press(message, user_id, custom_id):
+    return types.SimpleNamespace(data={"custom_id": custom_id}, message=message, user=types.SimpleNamespace(id=user_id), response=FakeResponse())
+
+
+async def prompt(bot, ctx, command, *args):
+    """Runs a command up to its confirmation prompt; returns the running command and the prompt message."""
+    task = asyncio.create_task(command(*args))
+    while not bot.confirmations.pending:
+        await asyncio.sleep(0)
+    (message_id,) = bot.confirmations.pending
+    message = ctx.last
+    assert message.id == message_id
+    return task, message
+
+
+def make_bot(store):
+    bot = types.SimpleNamespace(
+        store=store, member_locks=KeyedLocks(), jailed_users_cache={},
+        record_views=RecordViewCache(), user_summaries=UserSummaryCache(),
+        confirmations=types.SimpleNamespace(register=confirm), scheduled=[],
+    )
+    bot.jail_expiry = types.SimpleNamespace(schedule=lambda gid, uid, at: bot.scheduled.append((gid, uid, at)))
+    bot.mod_stats = ModerationStats(bot)
+    return bot
+
+
+@pytest.fixture
+def bot(store):
+    return make_bot(store)
+
+
+@pytest.fixture
+def member():
+    return FakeMember(10, roles=[FakeRole(EVERYONE), FakeRole(MEMBER_ROLE)])
+
+
+@pytest.fixture
+def ctx(bot, member):
+    return FakeContext(bot, FakeGuild([member]), FakeMember(1))
+
+
+async def record_lines(bot, ctx, member):
+    await Records.urecord_all.callback(Records(bot), ctx, member)
+    return ctx.last.embed.description
+
+
+async def test_warn_is_recorded_and_listed(bot, ctx, member):
+    mod = Moderation(bot)
+    await Moderation.warn.callback(mod, ctx, member, reason="spamming links")
+    assert ctx.last.content.startswith(f"⚠️ {member.mention} warned | spamming links")
+    assert len(member.dms) == 1
+
+    await Records.record_warn.callback(Records(bot), ctx, member)
+    assert "spamming links" in ctx.last.embed.description and "<@1>" in ctx.last.embed.description
+    assert "01." in await record_lines(bot, ctx, member)
+
+
+async def test_r_all_is_cached_until_the_next_write(bot, ctx, member):
+    mod = Moderation(bot)
+    await Moderation.warn.callback(mod, ctx, member, reason="first")
+    first = await record_lines(bot, ctx, member)
+    assert "first" in first
+    # Served from the page cache: same embed object
+    await Records.urecord_all.callback(Records(bot), ctx, member)
+    assert ctx.replies[-1].embed is ctx.replies[-2].embed
+
+    await Moderation.warn.callback(mod, ctx, member, reason="second")
+    lines = await record_lines(bot, ctx, member)
+    assert "first" in lines and "second" in lines
+
+
+async def test_delete_record(bot, ctx, member):
+    mod = Moderation(bot)
+    await Moderation.warn.callback(mod, ctx, member, reason="mistake")
+    await Moderation.warn.callback(mod, ctx, member, reason="kept")
+
+    # The map is built by `r all`
+    await Records.delete_record.callback(Records(bot), ctx, 1, member)
+    assert ctx.last.content.startswith("❌ Invalid record number")
+
+    await record_lines(bot, ctx, member)
+    await Records.delete_record.callback(Records(bot), ctx, 1, member)
+    assert ctx.last.content.startswith("✅ Record #1 (Type: **warn**) deleted")
+    assert [d["reason"] for d in await bot.store.list_records("warn", GID, "10")] == ["kept"]
+    # Map reset after a delete: numbers must be looked up again
+    assert await bot.store.get_record_map_entry(GID, "10", 1) is None
+
+    lines = await record_lines(bot, ctx, member)
+    assert "mistake" not in lines
+    assert ctx.last.embed.footer.text.endswith("Deleted actions count: 1")
+
+
+async def test_edit_record(bot, ctx, member):
+    await Moderation.warn.callback(Moderation(bot), ctx, member, reason="typo")
+    await record_lines(bot, ctx, member)
+    await Records.edit_record.callback(Records(bot), ctx, 1, member, new_reason="spamming links")
+    assert ctx.last.content.startswith("✅ Record #1 (Type: **warn**) reason edited")
+
+    assert (await bot.store.list_records("warn", GID, "10"))[0]["reason"] == "` E ` spamming links"
+    assert "spamming links **(E)**" in await record_lines(bot, ctx, member)
+
+
+async def test_jail_rejects_too_long_duration(bot, ctx, member):
+    await bot.store.cfg_set(GID, "prisoner", str(PRISONER))
+    await Moderation.jail.callback(Moderation(bot), ctx, member, reason="9999w raid")
+    assert ctx.last.content.startswith("❌ Jail duration is too long")
+    assert await bot.store.count_jails(GID, "10") == 0
+
+
+@pytest.mark.mongo_server
+async def test_jail_and_free(bot, ctx, member):
+    mod = Moderation(bot)
+    await Moderation.jail.callback(mod, ctx, member, reason="raid")
+    assert ctx.last.content == "❌ Set prisoner role first."
+
+    await bot.store.cfg_set(GID, "prisoner", str(PRISONER))
+    await Moderation.jail.callback(mod, ctx, member, reason="12h raid")
+    assert "jailed for **1st** time until" in ctx.last.content and "The reason was raid" in ctx.last.content
+    assert [r.id for r in member.roles] == [PRISONER]
+    assert bot.jailed_users_cache[(GID, 10)] == [MEMBER_ROLE]
+    assert [(gid, uid) for gid, uid, _ in bot.scheduled] == [(GID, 10)]
+
+    await Moderation.jail.callback(mod, ctx, member, reason="again")
+    assert ctx.last.content == "❌ This member is already jailed."
+    assert await bot.store.count_jails(GID, "10") == 1
+
+    await Moderation.free.callback(mod, ctx, member, reason="served")
+    assert ctx.last.content == f"✅ I have set {member.mention} free."
+    assert [r.id for r in member.roles] == [MEMBER_ROLE]
+    assert (GID, 10) not in bot.jailed_users_cache
+    assert await bot.store.active_jails(GID) == []
+    await Moderation.free.callback(mod, ctx, member, reason="served")
+    assert ctx.last.content == "❌ Not jailed."
+
+    lines = await record_lines(bot, ctx, member)
+    assert "**Jail**" in lines and "**Free**" in lines and "served" in lines
+
+    await Moderation.jail.callback(mod, ctx, member, reason="raid again")
+    assert "jailed for **2nd** time" in ctx.last.content
+
+
+@pytest.mark.mongo_server
+async def test_deleting_a_jail_removes_its_free(bot, ctx, member):
+    mod = Moderation(bot)
+    await bot.store.cfg_set(GID, "prisoner", str(PRISONER))
+    await Moderation.jail.callback(mod, ctx, member, reason="raid")
+    await Moderation.free.callback(mod, ctx, member, reason="served")
+    await record_lines(bot, ctx, member)
+
+    # The free half shares the jail record and cannot be deleted on its own
+    await Records.delete_record.callback(Records(bot), ctx, 2, member)
+    assert ctx.last.content.startswith("❌ Cannot delete **free** actions directly")
+    await Records.delete_record.callback(Records(bot), ctx, 1, member)
+    assert ctx.last.content.startswith("✅ Record #1 (Type: **jail**) deleted")
+    assert await bot.store.list_records("jail", GID, "10") == []
+    assert bot.mod_stats.needs_refresh(GID)
+
+
+@pytest.mark.mongo_server
+async def test_r_search(bot, ctx):
+    search = Records.record_search.callback
+    for i in range(SEARCH_PAGE_SIZE + 1):
+        await bot.store.insert_record("warn", {"guild_id": GID, "user_id": str(20 + i), "mod_id": "1", "reason": f"scam link {i}", "time": f"2026-01-{i + 1:02d} 10:00:00"})
+    await bot.store.insert_record("warn", {"guild_id": GID, "user_id": "40", "mod_id": "1", "reason": "old scam", "time": "2020-01-01 10:00:00"})
+
+    await search(Records(bot), ctx, query="scam 2025-01-01")
+    embed = ctx.last.embed
+    assert embed.title == "🔎 Record Search – scam"
+    assert "old scam" not in embed.description
+    # A full page: the footer points at the next one, keeping the `since` filter
+    assert embed.footer.text == "Page 1 • Since 2025-01-01 • Next: ln.r search scam 2025-01-01 page:2"
+
+    await search(Records(bot), ctx, query="scam 2025-01-01 page:2")
+    assert ctx.last.embed.description.startswith(f"`{SEARCH_PAGE_SIZE + 1:02d}.`")
+    assert ctx.last.embed.footer.text == "Page 2 • Since 2025-01-01"
+    await search(Records(bot), ctx, query="scam 2025-01-01 page:3")
+    assert ctx.last.content == "No records matching **scam** on that page."
+
+    await search(Records(bot), ctx, query="scam")
+    assert "old scam" in ctx.last.embed.description
+    await search(Records(bot), ctx, query="phishing")
+    assert ctx.last.content == "No records matching **phishing**."
+
+
+async def test_r_search_usage(bot, ctx):
+    search = Records.record_search.callback
+    await search(Records(bot), ctx, query=None)
+    assert ctx.last.content.startswith("🔎 Usage: `ln.r search")
+    await search(Records(bot), ctx, query="?! page:2")
+    assert ctx.last.content.startswith("🔎 Usage: `ln.r search")
+    await search(Records(bot), ctx, query=f"scam {SEARCH_MAX_SINCE_DAYS + 1}d")
+    assert ctx.last.content.startswith(f"❌ `since` can go back at most {SEARCH_MAX_SINCE_DAYS} days.")
+
+
+async def test_delete_waits_for_the_confirmation_button(bot, ctx, member):
+    bot.confirmations = ConfirmationDispatcher()
+    await Moderation.warn.callback(Moderation(bot), ctx, member, reason="mistake")
+    await record_lines(bot, ctx, member)
+    delete = Records.delete_record.callback
+
+    task, message = await prompt(bot, ctx, delete, Records(bot), ctx, 1, member)
+    assert message.embed.title == "⚠️ CONFIRM DELETING RECORD" and "mistake" in message.embed.description
+    # Only the moderator who ran `d` can answer
+    other = press(message, 2, CONFIRM_YES_ID)
+    await bot.confirmations.dispatch(other)
+    assert other.response.sent and not task.done()
+    cancel = press(message, ctx.author.id, CONFIRM_NO_ID)
+    await bot.confirmations.dispatch(cancel)
+    await task
+    assert cancel.response.edited[0].footer.text == "❌ Action cancelled."
+    assert len(await bot.store.list_records("warn", GID, "10")) == 1
+
+    task, message = await prompt(bot, ctx, delete, Records(bot), ctx, 1, member)
+    await bot.confirmations.dispatch(press(message, ctx.author.id, CONFIRM_YES_ID))
+    await task
+    assert ctx.last.content.startswith("✅ Record #1 (Type: **warn**) deleted")
+    assert await bot.store.list_records("warn", GID, "10") == []
+
+
+async def test_unanswered_confirmation_times_out(bot, ctx, member):
+    bot.confirmations = ConfirmationDispatcher()
+    details = {"type": "warn", "mod": "1", "reason": "mistake", "time": "2026-01-01 10:00:00"}
+    assert await confirm_action(ctx, "delete", 1, member, details, timeout=0.01) is False
+    assert ctx.last.embed.footer.text == "⌛ Action timed out and cancelled."
+    assert not bot.confirmations.pending
+
+
+async def queue_joiners(bot, ctx, now, waits):
+    """Members who joined `waits` minutes ago, queued for verification and present in ctx.guild."""
+    members = []
+    for uid, minutes in waits.items():
+        member = FakeMember(uid, roles=[FakeRole(EVERYONE), FakeRole(TO_VERIFY)], joined_at=now - timedelta(minutes=minutes))
+        await bot.store.enqueue_verification(GID, str(uid), format_time(member.joined_at))
+        ctx.guild._members[uid] = member
+        members.append(member)
+    return members
+
+
+@pytest.fixture
+async def verify_roles(bot):
+    await bot.store.cfg_set(GID, "to_verify", str(TO_VERIFY))
+    await bot.store.cfg_set(GID, "normie", str(NORMIE))
+
+
+async def test_verify_bulk_approves_the_longest_waiting(bot, ctx, verify_roles, monkeypatch):
+    pauses = []
+
+    async def sleep(delay):
+        pauses.append(delay)
+    monkeypatch.setattr(cogs.verification, "asyncio", types.SimpleNamespace(sleep=sleep))
+    now = datetime.now(UTC)
+    oldest, second, newest = await queue_joiners(bot, ctx, now, {20: 90, 21: 60, 22: 5})
+    await bot.store.enqueue_verification(GID, "23", format_time(now - timedelta(hours=5)))  # left while the bot was offline
+
+    await Verification.verify_bulk.callback(Verification(bot), ctx, 3)
+    assert ctx.last.content == "✅ Verified **2** member(s).\n🧹 Removed 1 member(s) who already left."
+    # One role swap at a time, paced
+    assert pauses == [cogs.verification.VERIFY_SWAP_INTERVAL]
+    assert [r.id for r in oldest.roles] == [NORMIE] and [r.id for r in second.roles] == [NORMIE]
+    assert [r.id for r in newest.roles] == [EVERYONE, TO_VERIFY]
+    assert [p["user_id"] for p in await bot.store.pending_verifications(GID, 10)] == ["22"]
+
+    verified = {d["user_id"]: d for uid in ("20", "21") for d in await bot.store.list_records("verify", GID, uid)}
+    assert verified["20"]["wait_seconds"] == pytest.approx(90 * 60, abs=5)
+    assert verified["21"]["reason"] == "Verified (bulk)"
+
+
+async def test_failed_role_swap_stays_queued(bot, ctx, verify_roles):
+    now = datetime.now(UTC)
+    (member,) = await queue_joiners(bot, ctx, now, {20: 30})
+    member.fail_edit = True
+    await Verification.verify.callback(Verification(bot), ctx, member, reason="ok")
+    assert ctx.last.content.startswith(f"❌ Could not verify {member.mention}: 403 Forbidden")
+    assert await bot.store.pending_verifications(GID, 10) == [{"user_id": "20", "joined_at": format_time(member.joined_at)}]
+    assert await bot.store.list_records("verify", GID, "20") == []
+
+    member.fail_edit = False
+    await Verification.verify.callback(Verification(bot), ctx, member, reason="ok")
+    assert ctx.last.content == f"✅ {member.mention} verified."
+    assert await bot.store.count_pending_verifications(GID) == 0
+
+
+async def test_verify_needs_the_normie_role(bot, ctx):
+    now = datetime.now(UTC)
+    await queue_joiners(bot, ctx, now, {20: 30})
+    await Verification.verify_bulk.callback(Verification(bot), ctx, 5)
+    assert "normie role is not set" in ctx.last.content
+    assert await bot.store.count_pending_verifications(GID) == 1
+
+
+async def test_verify_queue_metrics(bot, ctx, verify_roles, monkeypatch):
+    monkeypatch.setattr(cogs.verification, "VERIFY_SWAP_INTERVAL", 0)
+    now = datetime.now(UTC)
+    await Verification.verify_bulk.callback(Verification(bot), ctx, 5)
+    assert ctx.last.content == "📭 The verification queue is empty."
+
+    await queue_joiners(bot, ctx, now, {20: 10, 21: 20, 22: 30, 23: 120})
+    await Verification.verify_bulk.callback(Verification(bot), ctx, 3)
+    await Verification.verify_queue.callback(Verification(bot), ctx)
+    fields = {f.name: f.value for f in ctx.last.embed.fields}
+    assert fields["Waiting"] == "1"
+    assert fields["Time to verify (7d)"] == "median 30m • p90 2h • n=3"
+    assert fields["Longest waiting"] == "<@20> — waiting 10m"
+
+    await Verification(bot).on_member_remove(types.SimpleNamespace(id=20, guild=ctx.guild))
+    assert await bot.store.count_pending_verifications(GID) == 0
+
+
+@pytest.mark.mongo_server
+async def test_concurrent_jails_open_one_record(bot, ctx, member):
+    await bot.store.cfg_set(GID, "prisoner", str(PRISONER))
+    # Same process: serialized by the member lock
+    other = FakeContext(bot, ctx.guild, FakeMember(2))
+    await asyncio.gather(Moderation.jail.callback(Moderation(bot), ctx, member, reason="raid"),
+                         Moderation.jail.callback(Moderation(bot), other, member, reason="raid"))
+    replies = sorted(c.last.content for c in (ctx, other))
+    assert replies[0] == "❌ This member is already jailed." and "jailed for **1st** time" in replies[1]
+    assert len(bot.member_locks) == 0
+
+    # Another bot process (its own cache and locks) loses on the storage constraint, before touching roles
+    member.roles = [FakeRole(EVERYONE), FakeRole(MEMBER_ROLE)]
+    elsewhere = make_bot(bot.store)
+    remote = FakeContext(elsewhere, ctx.guild, FakeMember(3))
+    await Moderation.jail.callback(Moderation(elsewhere), remote, member, reason="raid")
+    assert remote.last.content == "❌ This member is already jailed."
+    assert [r.id for r in member.roles] == [EVERYONE, MEMBER_ROLE]
+    assert elsewhere.jailed_users_cache == {}
+    assert await bot.store.count_jails(GID, "10") == 1
+
+
+@pytest.mark.mongo_server
+async def test_jail_record_taken_back_if_roles_fail(bot, ctx, member):
+    await bot.store.cfg_set(GID, "prisoner", str(PRISONER))
+    member.fail_edit = True
+    with pytest.raises(discord.HTTPException):
+        await Moderation.jail.callback(Moderation(bot), ctx, member, reason="raid")
+    assert await bot.store.count_jails(GID, "10") == 0
+    assert bot.jailed_users_cache == {}
+
+    member.fail_edit = False
+    await Moderation.jail.callback(Moderation(bot), ctx, member, reason="raid")
+    assert "jailed for **1st** time" in ctx.last.content
+
+
+@pytest.mark.mongo_server
+async def test_stats_live_updates_match_a_rebuild(bot, ctx, member):
+    await bot.store.cfg_set(GID, "prisoner", str(PRISONER))
+    await Reports.stats.callback(Reports(bot), ctx)
+    assert ctx.replies[-2].content == "⏳ Building stats for this server for the first time..."
+    assert ctx.last.embed.fields[0].value == "⚠️ 0 warns • 🔒 0 jails • ✅ 0 frees • ✅ 0 verifies"
+
+    mod = Moderation(bot)
+    other = FakeMember(11)
+    ctx.guild._members[11] = other
+    await Moderation.warn.callback(mod, ctx, member, reason="spam")
+    await Moderation.jail.callback(mod, ctx, member, reason="more spam")
+    await Moderation.free.callback(mod, ctx, member, reason="served")
+    await Moderation.warn.callback(mod, ctx, other, reason="rude")
+
+    live = bot.mod_stats.get(GID)
+    await Reports.stats.callback(Reports(bot), ctx)
+    fields = {f.name: f.value for f in ctx.last.embed.fields}
+    assert fields["Actions"] == "⚠️ 2 warns • 🔒 1 jails • ✅ 1 frees • ✅ 0 verifies"
+    assert fields["Repeat offenders"] == "50.0%\n1 of 2 users"
+    assert fields["Warn → jail"] == "50.0%\n1 of 2 warned users"
+    assert fields["Median jail"].endswith("1 closed • 0 open")
+
+    rebuilt = await bot.mod_stats.refresh(GID)
+    assert rebuilt is not live
+    assert (rebuilt.totals, rebuilt.by_hour, rebuilt.offences, rebuilt.escalated, rebuilt.open_jails) == \
+        (live.totals, live.by_hour, live.offences, live.escalated, live.open_jails)
+    assert rebuilt.jail_durations == pytest.approx(live.jail_durations, abs=1)
+
+    # Deletes cannot be subtracted: the guild is rebuilt
+    await record_lines(bot, ctx, other)
+    await Records.delete_record.callback(Records(bot), ctx, 1, other)
+    assert bot.mod_stats.needs_refresh(GID)
+    assert (await bot.mod_stats.refresh(GID, only_if_needed=True)).totals["warn"] == 1
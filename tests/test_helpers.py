@@ -0,0 +1,24 @@
+"""Parsing helpers shared by commands."""
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("discord")
+
+from helpers import parse_duration
+from settings import JAIL_MAX_DURATION
+
+
+def test_parse_duration():
+    assert parse_duration("30m") == timedelta(minutes=30)
+    assert parse_duration("1d12h") == timedelta(days=1, hours=12)
+    assert parse_duration("2W") == timedelta(weeks=2)
+    assert parse_duration("spam") is None
+    assert parse_duration("0m") is None
+    assert parse_duration(f"{JAIL_MAX_DURATION // 60}m") == timedelta(seconds=JAIL_MAX_DURATION)
+
+
+@pytest.mark.parametrize("token", ["366d", "999999999999d", "9" * 5000 + "d", "200d200d"])
+def test_parse_duration_rejects_too_long(token):
+    with pytest.raises(ValueError):
+        parse_duration(token)
@@ -0,0 +1,109 @@
+"""MongoStorage connection pools: interactive / analytics routing, client options and checkout wait metrics."""
+import types
+
+import pytest
+
+motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from storage import MongoStorage, PoolWaitStats, _pool_listener, create_storage
+
+GID = 1001
+
+
+class RecordingClient(mongomock_motor.AsyncMongoMockClient):
+    """mongomock-motor client that keeps the options each client was built with."""
+    created = []
+
+    def __init__(self, uri, **options):
+        RecordingClient.created.append(options)
+        super().__init__(uri, **{k: v for k, v in options.items() if k not in ("event_listeners", "maxStalenessSeconds", "compressors")})
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    RecordingClient.created = []
+    monkeypatch.setattr(motor_asyncio, "AsyncIOMotorClient", RecordingClient)
+    return RecordingClient.created
+
+
+def test_pool_wait_stats():
+    stats = PoolWaitStats(samples=3)
+    assert stats.percentile(99) == 0.0
+    for wait in (0.004, 0.001, 0.002, 0.003):
+        stats.checked_out(wait)
+    # Bounded history, but the max is kept
+    assert list(stats.waits) == [0.001, 0.002, 0.003]
+    assert stats.snapshot() == {
+        "wait_p50_ms": pytest.approx(2.0), "wait_p99_ms": pytest.approx(3.0), "wait_max_ms": pytest.approx(4.0),
+        "checkouts": 4, "failed": 0, "open": 0, "in_use": 4,
+    }
+
+
+def test_pool_listener_feeds_stats():
+    stats = PoolWaitStats()
+    listener = _pool_listener(stats)
+    listener.connection_created(None)
+    listener.connection_created(None)
+    listener.connection_checked_out(types.SimpleNamespace(duration=0.25))
+    # Driver versions without event.duration: timed from the checkout start
+    listener.connection_check_out_started(None)
+    listener.connection_checked_out(types.SimpleNamespace())
+    listener.connection_check_out_failed(None)
+    listener.connection_checked_in(None)
+    listener.connection_closed(None)
+
+    snapshot = stats.snapshot()
+    assert (snapshot["checkouts"], snapshot["failed"], snapshot["open"], snapshot["in_use"]) == (2, 1, 1, 1)
+    assert snapshot["wait_max_ms"] == pytest.approx(250)
+    assert stats.waits[1] < 0.25
+
+
+def test_client_options_per_pool(clients):
+    store = create_storage("mongo", mongo_uri="mongodb://localhost", breaker=False, mongo_options={
+        "pool_size": 20, "min_pool_size": 2, "analytics_pool_size": 4, "max_staleness": 90,
+        "compressors": "", "analytics_compressors": "zstd,zlib",
+    })
+    assert isinstance(store, MongoStorage)
+    interactive, analytics = clients
+    assert (interactive["maxPoolSize"], interactive["minPoolSize"], interactive["appname"]) == (20, 2, "ladynight")
+    assert "compressors" not in interactive and "readPreference" not in interactive
+    assert (analytics["maxPoolSize"], analytics["minPoolSize"], analytics["appname"]) == (4, 0, "ladynight-analytics")
+    assert (analytics["readPreference"], analytics["maxStalenessSeconds"], analytics["compressors"]) == ("secondaryPreferred", 90, "zstd,zlib")
+    assert set(store.pool_stats()) == {"interactive", "analytics"}
+
+    # Stats rebuilds use the analytics pool but read the primary
+    assert store.analytics_primary_db.client is store.analytics_client
+    assert store.analytics_primary_db.read_preference.mongos_mode == "primary"
+
+
+def test_shared_pool(clients):
+    store = MongoStorage("mongodb://localhost", analytics_pool_size=0)
+    assert len(clients) == 1
+    assert store.analytics_db is store.analytics_primary_db is store.db
+    assert set(store.pool_stats()) == {"interactive"}
+
+
+async def test_analytics_reads_are_routed(clients):
+    # Every mongomock client is its own in-memory server, so the data a read
+    # sees tells which pool served it
+    store = MongoStorage("mongodb://localhost", db_name="ladynight_routing")
+    await store.setup()
+    try:
+        verify = {"guild_id": GID, "user_id": "10", "mod_id": "1", "reason": "ok", "time": "2026-01-02 10:00:00", "wait_seconds": 30.0}
+        await store.insert_records("verify", [verify])
+        await store.insert_mod_actions([{"guild_id": GID, "entry_id": "1", "user_id": "10", "mod_id": "7", "action": "kick", "reason": None, "time": "2026-01-02 10:00:00"}])
+        # Interactive reads see the writes
+        assert len(await store.list_records("verify", GID, "10")) == 1
+        # Analytics reads go to the other pool
+        assert await store.verify_waits(GID, "2026-01-01 00:00:00") == []
+        assert await store.count_mod_actions(GID, "2026-01-01 00:00:00") == {}
+        await store.analytics_db.verifications.insert_one(dict(verify, wait_seconds=45.0))
+        assert await store.verify_waits(GID, "2026-01-01 00:00:00") == [45.0]
+
+        assert store._col("warn", analytics=True).database is store.analytics_db
+        assert store._col("warn").database is store.db
+        with pytest.raises(ValueError):
+            store._col("mood")
+    finally:
+        await store.close()
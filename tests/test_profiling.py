@@ -0,0 +1,75 @@
+"""LoopMonitor slow callback detection and the sampling profiler behind `ln.profile`."""
+import asyncio
+import os
+import threading
+import time
+
+from profiling import LoopMonitor, sample_profile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def block_the_loop(seconds):
+    time.sleep(seconds)
+
+
+async def handler():
+    block_the_loop(0.3)
+
+
+async def test_slow_callback_names_the_culprit():
+    events = []
+    monitor = LoopMonitor(asyncio.get_running_loop(), interval=0.02, slow_threshold=0.05, app_paths=(HERE,), on_slow=events.append)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.1)
+        await handler()
+        await asyncio.sleep(0.1)
+    finally:
+        monitor.stop()
+
+    assert monitor.slow_count == 1 and list(monitor.slow_callbacks) == events
+    event = events[0]
+    assert event.label == "test_slow_callback_names_the_culprit → handler → block_the_loop"
+    assert 0.25 <= event.duration < 1
+    assert "block_the_loop" in event.stack[-1]
+    # Lag samples include the idle ticks and the blocked one
+    assert len(monitor.lags) > 2
+    assert monitor.max_lag == event.duration
+    assert monitor.lag_percentile(50) < 0.05 <= monitor.lag_percentile(100)
+
+
+async def test_idle_loop_has_no_slow_callbacks():
+    monitor = LoopMonitor(asyncio.get_running_loop(), interval=0.01, slow_threshold=0.05, app_paths=(HERE,))
+    assert monitor.lag_percentile(99) == 0.0
+    monitor.start()
+    try:
+        await asyncio.sleep(0.1)
+    finally:
+        monitor.stop()
+    assert monitor.slow_count == 0 and monitor.lags
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+async def test_sample_profile_folds_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=spin, args=(stop,), name="spinner")
+    worker.start()
+    try:
+        folded, samples = await sample_profile(0.1, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert samples > 5
+    lines = folded.splitlines()
+    # "thread;outermost frame;...;innermost frame count", most sampled first
+    spinner = [line for line in lines if line.startswith("spinner;")]
+    assert spinner and all(";spin (test_profiling.py:" in line for line in spinner)
+    counts = [int(line.rsplit(" ", 1)[1]) for line in lines]
+    assert counts == sorted(counts, reverse=True)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in spinner) <= samples
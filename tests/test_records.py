@@ -0,0 +1,26 @@
+"""`r` command helpers: the `since` filter of `r search`."""
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+pytest.importorskip("discord")
+
+from cogs.records import parse_since
+from helpers import parse_time
+from settings import SEARCH_MAX_SINCE_DAYS
+
+
+def test_parse_since():
+    now = datetime.now(UTC)
+    assert abs(parse_time(parse_since("week")) - (now - timedelta(days=7))) < timedelta(seconds=5)
+    assert abs(parse_time(parse_since("90D")) - (now - timedelta(days=90))) < timedelta(seconds=5)
+    assert parse_since("2026-01-02") == "2026-01-02 00:00:00"
+    # Not a filter: left to the search terms
+    assert parse_since("raid") is None
+    assert parse_since("2026-13-40") is None
+
+
+@pytest.mark.parametrize("token", [f"{SEARCH_MAX_SINCE_DAYS + 1}d", "999999999999d", "9" * 5000 + "d"])
+def test_parse_since_rejects_too_far_back(token):
+    with pytest.raises(ValueError):
+        parse_since(token)
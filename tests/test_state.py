@@ -0,0 +1,476 @@
+"""Background job state: the jail expiry heap, jail drift sweeps, audit log ingestion, lease renewal and the `r all` page cache."""
+import asyncio
+import gc
+import types
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+pytest.importorskip("discord")
+
+import discord
+
+import state
+from helpers import EXTERNAL_BAN_REASON, format_time
+from settings import CONFIRM_NO_ID, CONFIRM_YES_ID
+from state import AuditLogIngester, ConfirmationDispatcher, JailExpiryScheduler, JailReconciler, KeyedLocks, LeaseManager, ModerationStats, RecordViewCache, UserSummaryCache
+from storage import CircuitBreakerStorage, FaultInjectingStorage
+
+GID = 1001
+
+
+def make_bot(store):
+    bot = types.SimpleNamespace(
+        store=store, shard_count=None, user=types.SimpleNamespace(id=1),
+        member_locks=KeyedLocks(), jailed_users_cache={},
+        record_views=RecordViewCache(), user_summaries=UserSummaryCache(),
+        leases=LeaseManager(store, "test"), lease_name=lambda job: job,
+        get_guild=lambda gid: None,
+    )
+    bot.mod_stats = ModerationStats(bot)
+    bot.leases.register("jail_expiry")
+    return bot
+
+
+async def open_timed_jail(store, uid, expires_at):
+    await store.open_jail({
+        "guild_id": GID, "user_id": str(uid), "jailer": "1", "reason": "raid", "roles": "[]",
+        "jailed_at": format_time(datetime.now(UTC)), "freed_at": None, "expires_at": format_time(expires_at),
+    })
+
+
+@pytest.fixture
+def faults(sqlite_store):
+    return FaultInjectingStorage(sqlite_store)
+
+
+@pytest.fixture
+def store(faults):
+    return CircuitBreakerStorage(faults)
+
+
+async def test_scheduler_releases_due_jails(store, sqlite_store):
+    now = datetime.now(UTC)
+    await open_timed_jail(store, 10, now - timedelta(minutes=1))
+    await open_timed_jail(store, 11, now + timedelta(hours=1))
+    bot = make_bot(store)
+    await bot.leases.renew_all()
+    scheduler = JailExpiryScheduler(bot)
+    scheduler.start()
+    try:
+        for _ in range(100):
+            if len(await sqlite_store.active_jails(GID)) == 1:
+                break
+            await asyncio.sleep(0.01)
+        assert [j["user_id"] for j in await sqlite_store.active_jails(GID)] == ["11"]
+        assert [uid for _, _, uid in scheduler._heap] == [11]
+
+        # A jail scheduled later wakes the scheduler up before the one it sleeps on
+        await open_timed_jail(store, 12, datetime.now(UTC))
+        scheduler.schedule(GID, 12, datetime.now(UTC))
+        for _ in range(100):
+            if len(await sqlite_store.active_jails(GID)) == 1:
+                break
+            await asyncio.sleep(0.01)
+        assert [j["user_id"] for j in await sqlite_store.active_jails(GID)] == ["11"]
+    finally:
+        scheduler._task.cancel()
+
+
+async def test_scheduler_only_releases_as_lease_holder(store, sqlite_store):
+    await open_timed_jail(store, 10, datetime.now(UTC) - timedelta(minutes=1))
+    await sqlite_store.acquire_lease("jail_expiry", "someone-else", ttl=60)
+    bot = make_bot(store)
+    await bot.leases.renew_all()
+    await JailExpiryScheduler(bot)._release_due(datetime.now(UTC))
+    assert len(await sqlite_store.active_jails(GID)) == 1
+
+
+async def test_scheduler_window_and_horizon(store, monkeypatch):
+    monkeypatch.setattr(state, "JAIL_EXPIRY_WINDOW", 2)
+    now = datetime.now(UTC).replace(microsecond=0)
+    for uid, hours in ((10, 3), (11, 1), (12, 2)):
+        await open_timed_jail(store, uid, now + timedelta(hours=hours))
+    scheduler = JailExpiryScheduler(make_bot(store))
+    await scheduler._load()
+    assert sorted(uid for _, _, uid in scheduler._heap) == [11, 12]
+    assert scheduler._horizon == now + timedelta(hours=2)
+    # Beyond the horizon: left for the next load
+    scheduler.schedule(GID, 13, now + timedelta(hours=5))
+    scheduler.schedule(GID, 14, now + timedelta(minutes=5))
+    assert sorted(uid for _, _, uid in scheduler._heap) == [11, 12, 14]
+
+
+async def test_lease_renewal_error_keeps_token(faults, sqlite_store):
+    leases = LeaseManager(faults, "a", ttl=30)
+    leases.register("jail_expiry")
+    await leases.renew_all()
+    token = leases.tokens["jail_expiry"]
+
+    faults.fail_rate = 1.0
+    await leases.renew_all()
+    assert leases.tokens["jail_expiry"] == token
+
+    faults.fail_rate = 0.0
+    await leases.renew_all()
+    assert leases.tokens["jail_expiry"] == token
+    assert leases.is_leader("jail_expiry")
+    assert await leases.fenced("jail_expiry")
+
+    # Refused outright (another holder took over): the token goes
+    await sqlite_store.release_lease("jail_expiry", "a", token)
+    await sqlite_store.acquire_lease("jail_expiry", "b", ttl=30)
+    await leases.renew_all()
+    assert "jail_expiry" not in leases.tokens and not leases.is_leader("jail_expiry")
+
+
+def test_record_view_pages_expire(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(state.time, "monotonic", lambda: clock[0])
+    cache = RecordViewCache(ttl=60)
+    cache.put(GID, "10", ["page 1", "page 2"], cache.generation)
+    assert cache.get(GID, "10", 2) == "page 2"
+
+    clock[0] += 61
+    assert cache.get(GID, "10", 1) is None
+    # The user's other pages went with it
+    assert cache.get(GID, "10", 2) is None
+    assert not cache._by_user
+
+
+async def test_claim_run_once_per_period_across_restarts(sqlite_store):
+    first = LeaseManager(sqlite_store, "a", ttl=30)
+    first.register("weekly_report")
+    await first.renew_all()
+    assert await first.claim_run("weekly_report", "2026-10-19")
+    await first.release_all()
+
+    # A new process takes over the same day: it must not post again
+    second = LeaseManager(sqlite_store, "b", ttl=30)
+    second.register("weekly_report")
+    await second.renew_all()
+    assert second.is_leader("weekly_report")
+    assert not await second.claim_run("weekly_report", "2026-10-19")
+    assert await second.claim_run("weekly_report", "2026-10-26")
+
+
+async def test_unregister_gives_the_lease_up(sqlite_store):
+    leases = LeaseManager(sqlite_store, "a", ttl=30)
+    leases.register("weekly_report")
+    await leases.renew_all()
+    await leases.unregister("weekly_report")
+    assert not leases.is_leader("weekly_report") and "weekly_report" not in leases.names
+    assert await sqlite_store.acquire_lease("weekly_report", "b", ttl=30) is not None
+    assert not await leases.claim_run("weekly_report", "2026-10-19")
+
+
+class FakeResponse:
+    def __init__(self, fail_edit=False):
+        self.fail_edit = fail_edit
+        self.sent, self.edited = [], []
+
+    async def send_message(self, content, **kwargs):
+        self.sent.append(content)
+
+    async def edit_message(self, **kwargs):
+        if self.fail_edit:
+            raise RuntimeError("Unknown Message")
+        self.edited.append(kwargs)
+
+
+def press(message_id, user_id, custom_id, fail_edit=False):
+    return types.SimpleNamespace(
+        data={"custom_id": custom_id}, message=types.SimpleNamespace(id=message_id, embeds=[]),
+        user=types.SimpleNamespace(id=user_id), response=FakeResponse(fail_edit),
+    )
+
+
+async def test_confirmation_dispatch():
+    confirmations = ConfirmationDispatcher()
+    future = confirmations.register(message_id=5, author_id=1, timeout=10)
+
+    other = press(5, 2, CONFIRM_YES_ID)
+    assert await confirmations.dispatch(other)
+    assert other.response.sent and not future.done()
+    assert not await confirmations.dispatch(press(5, 1, "something_else"))
+
+    answer = press(5, 1, CONFIRM_NO_ID)
+    assert await confirmations.dispatch(answer)
+    assert await future is False
+    assert answer.response.edited == [{"embed": None, "view": None}]
+
+    late = press(5, 1, CONFIRM_YES_ID)
+    assert await confirmations.dispatch(late)
+    assert late.response.sent == ["⌛ This confirmation has expired."]
+
+
+async def test_confirmation_resolved_even_if_edit_fails():
+    confirmations = ConfirmationDispatcher()
+    future = confirmations.register(message_id=5, author_id=1, timeout=10)
+    with pytest.raises(RuntimeError):
+        await confirmations.dispatch(press(5, 1, CONFIRM_YES_ID, fail_edit=True))
+    assert future.done() and future.result() is True
+
+
+async def test_confirmation_expires():
+    confirmations = ConfirmationDispatcher()
+    slow = confirmations.register(message_id=5, author_id=1, timeout=0.2)
+    fast = confirmations.register(message_id=6, author_id=1, timeout=0.01)
+    assert await asyncio.wait_for(fast, 1) is None
+    assert not slow.done()
+    assert await asyncio.wait_for(slow, 1) is None
+    assert not confirmations.pending
+
+
+def test_record_view_page_past_the_end_is_a_hit():
+    cache = RecordViewCache(maxsize=3)
+    cache.put(GID, "10", ["page 1", "page 2"], cache.generation)
+    assert cache.get(GID, "10", 9) == "page 2"
+    assert cache.get(GID, "10", 0) == "page 1"
+    assert (cache.hits, cache.misses) == (2, 0)
+
+    # Another user's pages push out page 2 (least recently read): past the end still means page 2
+    cache.put(GID, "11", ["a", "b"], cache.generation)
+    assert cache.get(GID, "10", 5) is None
+    assert cache.get(GID, "10", 1) == "page 1"
+    cache.invalidate(GID, "10")
+    assert cache.get(GID, "10", 5) is None and (GID, "10") not in cache._page_counts
+
+
+PRISONER = 50
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, embed=None):
+        self.sent.append(embed)
+
+
+def drift_guild(present, holders):
+    """A guild whose members are `present` and whose prisoner role is held by `holders`; log sends are kept."""
+    channel = FakeChannel()
+    role = types.SimpleNamespace(id=PRISONER, members=[types.SimpleNamespace(id=uid) for uid in holders])
+    guild = types.SimpleNamespace(
+        id=GID, sent=channel.sent,
+        get_role=lambda rid: role if rid == PRISONER else None,
+        get_member=lambda uid: types.SimpleNamespace(id=uid) if uid in present else None,
+        get_channel=lambda cid: channel if cid == 77 else None,
+    )
+    return guild
+
+
+async def test_reconciler_acts_on_the_second_pass(store):
+    bot = make_bot(store)
+    await store.cfg_set(GID, "prisoner", str(PRISONER))
+    await store.cfg_set(GID, "log-channel", "77")
+    for uid in (10, 11, 12, 13, 16):
+        await open_timed_jail(store, uid, datetime.now(UTC) + timedelta(days=1))
+    bot.jailed_users_cache.update({(GID, 11): [], (GID, 14): [5]})
+    # 10: record but not cached; 12: record but no prisoner role; 13: record, left the server
+    # 14: cached with no record; 15: prisoner role with no record; 16: jail still in flight
+    guild = drift_guild(present={10, 11, 12, 15, 16}, holders={10, 11, 15, 16})
+    reconciler = JailReconciler(bot)
+
+    acted = await reconciler.reconcile(guild)
+    assert not any(acted.values())
+    assert reconciler.current_drift[GID] == {"cache_missing": 4, "cache_stale": 1, "missing_role": 1, "untracked_prisoner": 1}
+    assert (GID, 14) in bot.jailed_users_cache and not guild.sent
+
+    # The in-flight jail finished caching between passes: left alone
+    bot.jailed_users_cache[(GID, 16)] = []
+    acted = await reconciler.reconcile(guild)
+    assert acted == {"cache_missing": {10, 12, 13}, "cache_stale": {14}, "missing_role": {12}, "untracked_prisoner": {15}}
+    assert bot.jailed_users_cache[(GID, 10)] == [] and (GID, 14) not in bot.jailed_users_cache
+    assert reconciler.repaired == {"cache_missing": 3, "cache_stale": 1}
+    assert reconciler.reported == {"missing_role": 1, "untracked_prisoner": 1}
+    assert guild.sent[0].description.splitlines() == [
+        "<@12> has an open jail record but not the prisoner role",
+        "<@15> has the prisoner role but no open jail record",
+    ]
+
+    # Cache drift is gone; role drift is left to moderators and stays visible
+    acted = await reconciler.reconcile(guild)
+    assert acted["cache_missing"] == acted["cache_stale"] == set()
+    assert reconciler.current_drift[GID]["cache_missing"] == 0
+
+
+async def test_reconciler_drift_that_clears_is_never_acted_on(store):
+    bot = make_bot(store)
+    await store.cfg_set(GID, "prisoner", str(PRISONER))
+    bot.jailed_users_cache[(GID, 14)] = []
+    guild = drift_guild(present={14}, holders={14})
+    reconciler = JailReconciler(bot)
+    await reconciler.reconcile(guild)
+    # Freed between passes
+    bot.jailed_users_cache.pop((GID, 14))
+    guild = drift_guild(present={14}, holders=set())
+    assert not any((await reconciler.reconcile(guild)).values())
+    assert reconciler.repaired == {"cache_missing": 0, "cache_stale": 0}
+
+    # Unconfirmed (manual) runs act on a single pass
+    bot.jailed_users_cache[(GID, 14)] = []
+    assert (await reconciler.reconcile(guild, confirm=False))["cache_stale"] == {14}
+    assert (GID, 14) not in bot.jailed_users_cache
+
+
+async def test_keyed_locks_are_shared_then_dropped():
+    locks = KeyedLocks()
+    order = []
+
+    async def hold(tag):
+        async with locks(GID, 10):
+            order.append(f"{tag} in")
+            await asyncio.sleep(0.01)
+            order.append(f"{tag} out")
+
+    await asyncio.gather(hold("a"), hold("b"))
+    # Same key: one after the other
+    assert order == ["a in", "a out", "b in", "b out"]
+    # Nothing holds or waits on the key any more
+    gc.collect()
+    assert len(locks) == 0
+
+    held = locks(GID, 10)
+    await held.acquire()
+    assert locks(GID, 10) is held and len(locks) == 1
+    held.release()
+
+
+MOD, BOT_ID = 7, 1
+
+
+def audit_entry(action, target, at, user=MOD, reason=None, removed_roles=()):
+    return types.SimpleNamespace(
+        id=discord.utils.time_snowflake(at), action=action, reason=reason, created_at=at,
+        user=types.SimpleNamespace(id=user, name=f"user{user}", mention=f"<@{user}>"),
+        target=types.SimpleNamespace(id=target),
+        before=types.SimpleNamespace(roles=[types.SimpleNamespace(id=r) for r in removed_roles]),
+    )
+
+
+class AuditGuild:
+    """A guild with an audit log; `audit_logs` honours `after` and `limit` like discord.py."""
+
+    def __init__(self, entries, members=(), can_read=True):
+        self.id = GID
+        self.entries = entries
+        self.members = {m.id: m for m in members}
+        self.me = types.SimpleNamespace(guild_permissions=types.SimpleNamespace(view_audit_log=can_read))
+        self.requests = 0
+
+    async def audit_logs(self, limit, after, oldest_first):
+        self.requests += 1
+        for entry in sorted((e for e in self.entries if e.id > after.id), key=lambda e: e.id)[:limit]:
+            yield entry
+
+    def get_member(self, uid):
+        return self.members.get(uid)
+
+    def get_channel(self, cid):
+        return None
+
+
+def audit_bot(store):
+    bot = make_bot(store)
+    channel = FakeChannel()
+    bot.get_channel = lambda cid: channel if cid == 99 else None
+    bot.reports = channel.sent
+    return bot
+
+
+async def test_audit_log_stores_external_actions_once(store):
+    bot = audit_bot(store)
+    now = datetime.now(UTC).replace(microsecond=0)
+    # The bot's own ban closed a jail with the placeholder reason; the audit log names the moderator
+    await open_timed_jail(store, 10, now + timedelta(days=1))
+    await store.close_active_jail(GID, "10", free_by=str(BOT_ID), free_reason=EXTERNAL_BAN_REASON, freed_at=format_time(now - timedelta(seconds=30)))
+    guild = AuditGuild([
+        audit_entry(discord.AuditLogAction.ban, 10, now - timedelta(seconds=29), reason="raid"),
+        audit_entry(discord.AuditLogAction.kick, 11, now - timedelta(seconds=20)),
+        audit_entry(discord.AuditLogAction.ban, 12, now - timedelta(seconds=10), user=BOT_ID),  # the bot's own
+    ])
+    ingester = AuditLogIngester(bot)
+
+    assert await ingester.ingest(guild) == 2
+    assert await store.count_mod_actions(GID, format_time(now - timedelta(hours=1))) == {str(MOD): {"ban": 1, "kick": 1}}
+    (record,) = await store.list_records("jail", GID, "10")
+    assert (record["free_by"], record["free_reason"]) == (str(MOD), "Banned: raid")
+    assert await store.cfg_get(GID, "audit_log_cursor") == str(guild.entries[-1].id)
+
+    # The next pass starts from the cursor: nothing is stored twice
+    assert await ingester.ingest(guild) == 0
+    # A ban event seen after its entry was read is matched from memory
+    ingester.expect(GID, 10, "ban")
+    await ingester.ingest(guild)
+    assert GID not in ingester._pending
+    guild.entries.append(audit_entry(discord.AuditLogAction.kick, 13, now))
+    assert await ingester.ingest(guild) == 1
+    assert await store.count_mod_actions(GID, format_time(now - timedelta(hours=1))) == {str(MOD): {"ban": 1, "kick": 2}}
+
+
+async def test_audit_log_reads_a_backlog_over_several_passes(store, monkeypatch):
+    monkeypatch.setattr(state, "AUDIT_LOG_MAX_ENTRIES", 2)
+    bot = audit_bot(store)
+    bot.get_guild = lambda gid: guild
+    now = datetime.now(UTC).replace(microsecond=0)
+    guild = AuditGuild([audit_entry(discord.AuditLogAction.kick, 20 + i, now - timedelta(seconds=10 - i)) for i in range(5)])
+    ingester = AuditLogIngester(bot)
+    ingester.mark(GID)
+    passes = 0
+    while GID in ingester._dirty | set(ingester._pending):
+        await ingester.run()
+        passes += 1
+    assert passes == 3
+    assert await store.count_mod_actions(GID, format_time(now - timedelta(hours=1))) == {str(MOD): {"kick": 5}}
+
+
+async def test_audit_log_prisoner_role_removed_by_hand(store):
+    bot = audit_bot(store)
+    await store.cfg_set(GID, "prisoner", "50")
+    now = datetime.now(UTC).replace(microsecond=0)
+    for uid in (10, 11):
+        await open_timed_jail(store, uid, now + timedelta(days=1))
+        bot.jailed_users_cache[(GID, uid)] = []
+    members = [types.SimpleNamespace(id=10, get_role=lambda rid: None), types.SimpleNamespace(id=11, get_role=lambda rid: object())]
+    guild = AuditGuild([
+        audit_entry(discord.AuditLogAction.member_role_update, 10, now - timedelta(seconds=5), reason="appeal", removed_roles=[50]),
+        # Role taken off and given back since: still jailed
+        audit_entry(discord.AuditLogAction.member_role_update, 11, now - timedelta(seconds=4), removed_roles=[50]),
+        audit_entry(discord.AuditLogAction.member_role_update, 11, now - timedelta(seconds=3), removed_roles=[51]),
+    ], members=members)
+
+    await AuditLogIngester(bot).ingest(guild)
+    (record,) = await store.list_records("jail", GID, "10")
+    assert (record["free_by"], record["free_reason"]) == (str(MOD), "Prisoner role removed by hand: appeal")
+    assert record["freed_at"] == format_time(now - timedelta(seconds=5))
+    assert (GID, 10) not in bot.jailed_users_cache
+    assert [j["user_id"] for j in await store.active_jails(GID)] == ["11"] and (GID, 11) in bot.jailed_users_cache
+
+
+async def test_audit_log_jailed_member_departures(store, monkeypatch):
+    monkeypatch.setattr(state, "AUTO_REPORT_CHANNEL_ID", 99)
+    bot = audit_bot(store)
+    now = datetime.now(UTC).replace(microsecond=0)
+    guild = AuditGuild([audit_entry(discord.AuditLogAction.kick, 10, now, reason="alt account")])
+    ingester = AuditLogIngester(bot)
+    ingester.expect(GID, 10, "leave")
+    ingester.expect(GID, 11, "leave")
+
+    await ingester.ingest(guild)
+    # The kick is explained; the other departure waits for its entry until AUDIT_LOG_SETTLE
+    assert [e.title for e in bot.reports] == ["👢 Prisoner Kicked"]
+    assert bot.reports[0].description == f"<@10> was kicked by <@{MOD}> while jailed. Reason: alt account"
+    assert set(ingester._pending[GID]) == {(11, "leave")}
+
+    monkeypatch.setattr(state, "AUDIT_LOG_SETTLE", 0)
+    await ingester.ingest(guild)
+    assert [e.title for e in bot.reports] == ["👢 Prisoner Kicked", "🚨 Prisoner Escaped!"]
+    assert GID not in ingester._pending
+
+    # Without audit log access pending events are settled right away, without reading the log
+    ingester.expect(GID, 12, "leave")
+    blind = AuditGuild([], can_read=False)
+    assert await ingester.ingest(blind) == 0
+    assert blind.requests == 0 and bot.reports[-1].title == "🚨 Prisoner Escaped!" and GID not in ingester._pending
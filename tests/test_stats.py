@@ -0,0 +1,99 @@
+"""`ln.stats` aggregates: GuildStats updates, rebuilds from guild_activity, and live actions during a rebuild."""
+import asyncio
+import types
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+pytest.importorskip("discord")
+
+from helpers import format_time
+from state import GuildStats, ModerationStats
+from storage import FaultInjectingStorage
+
+GID = 1001
+T0 = datetime(2026, 1, 5, 10, 0, tzinfo=UTC)
+
+
+def test_guild_stats_aggregates():
+    stats = GuildStats()
+    stats.add("warn", "1", T0)
+    stats.add("jail", "1", T0 + timedelta(hours=1))  # warned, then jailed: escalated, repeat offender
+    stats.add("free", "1", T0 + timedelta(hours=3))
+    stats.add("warn", "2", T0 + timedelta(hours=1))
+    stats.add("jail", "3", T0 + timedelta(hours=2))
+    stats.add("free", "3", T0 + timedelta(hours=3))
+    stats.add("verify", "4", T0)
+
+    assert stats.totals == {"warn": 2, "jail": 2, "free": 2, "verify": 1}
+    assert stats.by_hour[10] == 2 and stats.by_hour[11] == 2 and stats.by_hour[13] == 2
+    assert stats.repeat_offenders == 1 and stats.repeat_offender_rate == pytest.approx(1 / 3)
+    assert stats.escalation_rate == pytest.approx(1 / 2)
+    assert stats.median_jail_seconds == pytest.approx(1.5 * 3600)
+    assert GuildStats().median_jail_seconds is None and GuildStats().escalation_rate is None
+
+
+def test_from_activity_leaves_later_frees_to_add():
+    rows = [
+        {"kind": "jail", "user_id": "1", "time": "2026-01-05 10:00:00", "freed_at": "2026-01-05 11:00:00"},
+        {"kind": "jail", "user_id": "2", "time": "2026-01-05 10:00:00", "freed_at": "2026-01-05 13:00:00"},
+        {"kind": "warn", "user_id": 3, "time": "2026-01-05 09:00:00"},
+    ]
+    stats = GuildStats.from_activity(rows, before="2026-01-05 12:00:00")
+    assert stats.totals == {"jail": 2, "free": 1, "warn": 1}
+    assert stats.jail_durations == [3600.0]
+    assert set(stats.open_jails) == {"2"}
+
+
+@pytest.fixture
+def faults(sqlite_store):
+    return FaultInjectingStorage(sqlite_store)
+
+
+@pytest.fixture
+def mod_stats(faults):
+    return ModerationStats(types.SimpleNamespace(store=faults))
+
+
+async def write_warn(store, mod_stats, uid):
+    """What a command does: store the record, then report it with the time it stored."""
+    now = datetime.now(UTC)
+    await store.insert_record("warn", {"guild_id": GID, "user_id": uid, "mod_id": "1", "reason": "r", "time": format_time(now)})
+    mod_stats.record(GID, "warn", uid, now)
+
+
+async def test_refresh_counts_every_action_once(faults, mod_stats):
+    await faults.insert_record("warn", {"guild_id": GID, "user_id": "old", "mod_id": "1", "reason": "r", "time": "2026-01-01 00:00:00"})
+    # Recorded in the same second the rebuild starts, before it collects live actions
+    await write_warn(faults, mod_stats, "before")
+
+    async def during():
+        while GID not in mod_stats._rebuilding:
+            await asyncio.sleep(0)
+        await write_warn(faults, mod_stats, "collecting")
+        # Once the slow query is running, i.e. past the cutoff
+        await asyncio.sleep(1.1)
+        await write_warn(faults, mod_stats, "reading")
+
+    faults.delay = 0.6
+    writer = asyncio.create_task(during())
+    stats = await mod_stats.refresh(GID)
+    await writer
+    assert stats.totals["warn"] == 4
+    assert set(stats.offences) == {"old", "before", "collecting", "reading"}
+
+    # Built: later actions go straight onto the aggregates
+    faults.delay = 0
+    await write_warn(faults, mod_stats, "after")
+    assert mod_stats.get(GID).totals["warn"] == 5
+    assert not mod_stats.needs_refresh(GID)
+    mod_stats.mark_stale(GID)
+    assert mod_stats.needs_refresh(GID)
+    assert (await mod_stats.refresh(GID, only_if_needed=True)).totals["warn"] == 5
+
+
+async def test_failed_refresh_stays_stale(faults, mod_stats):
+    faults.fail_rate = 1.0
+    with pytest.raises(ConnectionError):
+        await mod_stats.refresh(GID)
+    assert mod_stats.needs_refresh(GID) and not mod_stats._rebuilding
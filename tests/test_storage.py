@@ -0,0 +1,316 @@
+"""Backend contract tests: every case runs on SQLite and MongoDB (see conftest.py)."""
+import time
+
+import pytest
+
+GID, OTHER_GID = 1001, 1002
+
+
+def warn(uid="10", mod="1", reason="spamming links", time="2026-01-01 10:00:00", gid=GID):
+    return {"guild_id": gid, "user_id": uid, "mod_id": mod, "reason": reason, "time": time}
+
+
+def jail(uid="10", jailed_at="2026-01-01 10:00:00", expires_at=None, gid=GID):
+    return {
+        "guild_id": gid, "user_id": uid, "jailer": "1", "reason": "raid", "roles": "[5, 6]",
+        "jailed_at": jailed_at, "freed_at": None, "expires_at": expires_at,
+    }
+
+
+async def test_cfg_roundtrip(store):
+    assert await store.cfg_get(GID, "prefix") is None
+    await store.cfg_set(GID, "prefix", "!")
+    await store.cfg_set(GID, "prefix", "?")
+    await store.cfg_set(OTHER_GID, "share_records", "on")
+    assert await store.cfg_get(GID, "prefix") == "?"
+    assert await store.cfg_get(OTHER_GID, "prefix") is None
+    assert await store.cfg_guilds("share_records", "on") == [OTHER_GID]
+
+
+async def test_record_crud(store):
+    first = await store.insert_record("warn", warn(time="2026-01-02 00:00:00"))
+    second = await store.insert_record("warn", warn(time="2026-01-01 00:00:00", reason="again"))
+    assert await store.insert_records("warn", [warn(uid="11"), warn(uid="12")]) == 2
+
+    doc = await store.get_record("warn", GID, first)
+    assert doc["_id"] == first and doc["reason"] == "spamming links"
+    assert await store.get_record("warn", OTHER_GID, first) is None
+    assert await store.get_record("warn", GID, "not-an-id") is None
+
+    listed = await store.list_records("warn", GID, "10", sort_field="time")
+    assert [d["_id"] for d in listed] == [second, first]
+
+    assert await store.update_record("warn", GID, first, {"reason": "edited"}) is True
+    # Nothing changes: not counted as modified on either backend
+    assert await store.update_record("warn", GID, first, {"reason": "edited"}) is False
+    assert (await store.get_record("warn", GID, first))["reason"] == "edited"
+
+    assert await store.delete_record("warn", GID, first) is True
+    assert await store.delete_record("warn", GID, first) is False
+    assert await store.count_by_mod("warn", GID, "time", "mod_id", "2026-01-01 00:00:00") == {"1": 3}
+
+
+async def test_unknown_record_field_rejected(store):
+    with pytest.raises(ValueError):
+        await store.insert_record("warn", dict(warn(), mood="grumpy"))
+    with pytest.raises(ValueError):
+        await store.insert_records("warn", [warn(), dict(warn(), mood="grumpy")])
+    with pytest.raises(ValueError):
+        await store.open_jail(dict(jail(), mood="grumpy"))
+    rid = await store.insert_record("warn", warn())
+    with pytest.raises(ValueError):
+        await store.update_record("warn", GID, rid, {"mood": "grumpy"})
+    with pytest.raises(ValueError):
+        await store.list_records("warn", GID, "10", sort_field="mood")
+    # Nothing from the rejected calls was written
+    assert len(await store.list_records("warn", GID, "10")) == 1
+
+
+@pytest.mark.mongo_server
+async def test_search_records(store):
+    await store.insert_record("warn", warn(reason="posting scam links"))
+    await store.insert_record("warn", warn(reason="being rude"))
+    await store.insert_record("warn", warn(reason="scam again", gid=OTHER_GID))
+    await store.open_jail(dict(jail(uid="11"), reason="scam bot"))
+
+    results = await store.search_records(GID, ["scam"])
+    assert sorted((r["kind"], r["reason"]) for r in results) == [("jail", "scam bot"), ("warn", "posting scam links")]
+    assert all("score" in r for r in results)
+    assert await store.search_records(GID, []) == []
+    assert await store.search_records(GID, ["scam"], since="2027-01-01 00:00:00") == []
+
+
+@pytest.mark.mongo_server
+async def test_open_jail_is_unique_per_user(store):
+    rid = await store.open_jail(jail())
+    assert rid
+    assert await store.open_jail(jail(jailed_at="2026-01-01 11:00:00")) is None
+    # Another user, or the same user in another guild, is independent
+    assert await store.open_jail(jail(uid="11"))
+    assert await store.open_jail(jail(gid=OTHER_GID))
+
+    assert await store.close_active_jail(GID, "10", free_by="1", free_reason="served", freed_at="2026-01-02 10:00:00")
+    assert not await store.close_active_jail(GID, "10", free_by="1", free_reason="served", freed_at="2026-01-02 10:00:00")
+    assert await store.open_jail(jail(jailed_at="2026-01-03 10:00:00"))
+    assert await store.count_jails(GID, "10") == 2
+    assert sorted(j["user_id"] for j in await store.active_jails(GID)) == ["10", "11"]
+    assert len(await store.active_jails()) == 3
+
+
+@pytest.mark.mongo_server
+async def test_jail_expiries(store):
+    await store.open_jail(jail(uid="10", expires_at="2026-01-01 12:00:00"))
+    await store.open_jail(jail(uid="11", expires_at="2026-01-01 11:00:00"))
+    await store.open_jail(jail(uid="12"))  # indefinite
+    await store.open_jail(jail(uid="13", expires_at="2026-01-01 10:30:00"))
+    await store.close_active_jail(GID, "13", free_by="1", free_reason="early", freed_at="2026-01-01 10:10:00")
+
+    due = await store.jail_expiries(limit=10)
+    assert [(d["user_id"], d["expires_at"]) for d in due] == [("11", "2026-01-01 11:00:00"), ("10", "2026-01-01 12:00:00")]
+    assert due[0]["roles"] == "[5, 6]" and due[0]["guild_id"] == GID
+    assert [d["user_id"] for d in await store.jail_expiries(limit=1)] == ["11"]
+    assert [d["user_id"] for d in await store.jail_expiries(limit=10, until="2026-01-01 11:00:00")] == ["11"]
+
+
+async def test_leases(store):
+    # Real clock readings: Mongo's TTL index drops leases that expired long ago
+    t = time.time()
+    token = await store.acquire_lease("jail_expiry", "a", ttl=30, now=t)
+    assert token is not None
+    assert await store.acquire_lease("jail_expiry", "b", ttl=30, now=t + 10) is None
+    # Renewing with the current token keeps it
+    assert await store.acquire_lease("jail_expiry", "a", ttl=30, token=token, now=t + 20) == token
+    info = await store.lease_info("jail_expiry")
+    assert info["holder"] == "a" and info["token"] == token and info["expires_at"] == pytest.approx(t + 50)
+
+    # Expired: another holder takes over with a new token, and the old holder is fenced out
+    taken = await store.acquire_lease("jail_expiry", "b", ttl=30, now=t + 51)
+    assert taken is not None and taken != token
+    assert await store.acquire_lease("jail_expiry", "a", ttl=30, token=token, now=t + 52) is None
+
+    await store.release_lease("jail_expiry", "a", token)
+    assert (await store.lease_info("jail_expiry"))["holder"] == "b"
+    await store.release_lease("jail_expiry", "b", taken)
+    assert await store.acquire_lease("jail_expiry", "a", ttl=30, now=t + 53) not in (None, taken)
+
+
+async def test_pending_verification_queue(store):
+    await store.enqueue_verification(GID, "20", "2026-01-01 10:00:02")
+    await store.enqueue_verification(GID, "21", "2026-01-01 10:00:01")
+    await store.enqueue_verification(GID, "20", "2026-01-01 10:00:09")  # already queued
+    await store.enqueue_verification(OTHER_GID, "22", "2026-01-01 10:00:00")
+
+    assert await store.count_pending_verifications(GID) == 2
+    pending = await store.pending_verifications(GID, limit=10)
+    assert [(p["user_id"], p["joined_at"]) for p in pending] == [("21", "2026-01-01 10:00:01"), ("20", "2026-01-01 10:00:02")]
+    assert [p["user_id"] for p in await store.pending_verifications(GID, limit=1)] == ["21"]
+
+    taken = await store.dequeue_verifications(GID, ["20", "99"])
+    assert [(t["user_id"], t["joined_at"]) for t in taken] == [("20", "2026-01-01 10:00:02")]
+    assert await store.count_pending_verifications(GID) == 1
+    assert await store.count_pending_verifications(OTHER_GID) == 1
+
+
+@pytest.mark.mongo_server
+async def test_user_history(store):
+    await store.insert_record("warn", warn(time="2026-01-01 10:00:00", mod="1"))
+    await store.insert_record("warn", warn(time="2026-01-03 10:00:00", mod="2", gid=OTHER_GID))
+    await store.insert_record("warn", warn(time="2026-01-04 10:00:00", gid=3003))  # not asked for
+    await store.insert_record("warn", warn(uid="11", time="2026-01-05 10:00:00"))  # someone else
+    await store.insert_records("verify", [{"guild_id": GID, "user_id": "10", "mod_id": "3", "reason": "ok", "time": "2026-01-02 10:00:00", "wait_seconds": 5.0}])
+    await store.open_jail(jail(jailed_at="2026-01-02 12:00:00"))
+
+    history = await store.user_history("10", [GID, OTHER_GID])
+    assert [(h["kind"], h["guild_id"], h["mod"], h["time"]) for h in history] == [
+        ("warn", OTHER_GID, "2", "2026-01-03 10:00:00"),
+        ("jail", GID, "1", "2026-01-02 12:00:00"),
+        ("verify", GID, "3", "2026-01-02 10:00:00"),
+        ("warn", GID, "1", "2026-01-01 10:00:00"),
+    ]
+    assert history[1]["freed_at"] is None
+    assert await store.user_history("10", []) == []
+
+
+async def test_claim_lease_run(store):
+    t = time.time()
+    token = await store.acquire_lease("weekly_report", "a", ttl=30, now=t)
+    assert await store.claim_lease_run("weekly_report", "a", token, "2026-10-19", now=t + 1)
+    # Same period again, e.g. after a restart: refused
+    assert not await store.claim_lease_run("weekly_report", "a", token, "2026-10-19", now=t + 2)
+    # Wrong holder, stale token or expired lease: refused
+    assert not await store.claim_lease_run("weekly_report", "b", token, "2026-10-26", now=t + 3)
+    assert not await store.claim_lease_run("weekly_report", "a", token - 1, "2026-10-26", now=t + 3)
+    assert not await store.claim_lease_run("weekly_report", "a", token, "2026-10-26", now=t + 31)
+
+    # A takeover keeps what was claimed: the new holder cannot run the same period again
+    taken = await store.acquire_lease("weekly_report", "b", ttl=30, now=t + 40)
+    assert not await store.claim_lease_run("weekly_report", "b", taken, "2026-10-19", now=t + 41)
+    assert await store.claim_lease_run("weekly_report", "b", taken, "2026-10-26", now=t + 41)
+    assert not await store.claim_lease_run("missing", "a", token, "2026-10-26", now=t + 41)
+
+
+@pytest.mark.mongo_server
+async def test_attribute_jail_release_updates_one_record(store):
+    placeholder = "Banned by external action (Bot closes record)"
+    for jailed_at, freed_at in (("2025-01-01 10:00:00", "2025-01-02 10:00:00"), ("2026-01-01 10:00:00", "2026-01-02 10:00:05")):
+        await store.open_jail(jail(jailed_at=jailed_at))
+        await store.close_active_jail(GID, "10", free_by="999", free_reason=placeholder, freed_at=freed_at)
+
+    assert await store.attribute_jail_release(
+        GID, "10", placeholder, "2026-01-02 09:58:00", "2026-01-02 10:02:00", free_by="7", free_reason="Banned: raid"
+    )
+    records = {r["jailed_at"]: r for r in await store.list_records("jail", GID, "10")}
+    assert (records["2026-01-01 10:00:00"]["free_by"], records["2026-01-01 10:00:00"]["free_reason"]) == ("7", "Banned: raid")
+    # Older history closed by another ban is left alone
+    assert (records["2025-01-01 10:00:00"]["free_by"], records["2025-01-01 10:00:00"]["free_reason"]) == ("999", placeholder)
+    # Already attributed: nothing left to match
+    assert not await store.attribute_jail_release(
+        GID, "10", placeholder, "2026-01-02 09:58:00", "2026-01-02 10:02:00", free_by="8", free_reason="Banned: again"
+    )
+
+
+@pytest.mark.mongo_server
+async def test_guild_activity(store):
+    await store.insert_record("warn", warn(time="2026-01-01 12:00:00"))
+    await store.insert_record("warn", warn(time="2026-01-05 00:00:00"))  # at `before`: left out
+    await store.insert_record("warn", warn(time="2026-01-01 09:00:00", gid=OTHER_GID))
+    await store.insert_records("verify", [{"guild_id": GID, "user_id": "11", "mod_id": "3", "reason": "ok", "time": "2026-01-01 11:00:00"}])
+    await store.open_jail(jail(uid="12", jailed_at="2026-01-01 10:00:00"))
+    await store.close_active_jail(GID, "12", free_by="1", free_reason="served", freed_at="2026-01-02 10:00:00")
+
+    activity = await store.guild_activity(GID, "2026-01-05 00:00:00")
+    assert [(a["kind"], a["user_id"], a["time"]) for a in activity] == [
+        ("jail", "12", "2026-01-01 10:00:00"),
+        ("verify", "11", "2026-01-01 11:00:00"),
+        ("warn", "10", "2026-01-01 12:00:00"),
+    ]
+    assert activity[0]["freed_at"] == "2026-01-02 10:00:00"
+
+
+async def test_deleted_count(store):
+    assert await store.get_deleted_count(GID, "10") == 0
+    await store.increment_deleted_count(GID, "10")
+    await store.increment_deleted_count(GID, "10")
+    await store.increment_deleted_count(OTHER_GID, "10")
+    assert await store.get_deleted_count(GID, "10") == 2
+    assert await store.get_deleted_count(OTHER_GID, "10") == 1
+    assert await store.get_deleted_count(GID, "11") == 0
+
+
+async def test_record_map(store):
+    await store.replace_record_map(GID, "10", [
+        {"id": 1, "action_type": "warn", "record_rowid": "a"},
+        {"id": 2, "action_type": "jail", "record_rowid": "b"},
+    ])
+    await store.replace_record_map(GID, "11", [{"id": 1, "action_type": "verify", "record_rowid": "c"}])
+    entry = await store.get_record_map_entry(GID, "10", 2)
+    assert (entry["action_type"], str(entry["record_rowid"])) == ("jail", "b")
+
+    # Replacing drops the old numbering
+    await store.replace_record_map(GID, "10", [{"id": 1, "action_type": "free", "record_rowid": "b"}])
+    assert await store.get_record_map_entry(GID, "10", 2) is None
+    assert (await store.get_record_map_entry(GID, "10", 1))["action_type"] == "free"
+
+    await store.clear_record_map(GID, "10")
+    assert await store.get_record_map_entry(GID, "10", 1) is None
+    assert (await store.get_record_map_entry(GID, "11", 1))["action_type"] == "verify"
+
+
+async def test_verify_waits(store):
+    def verify(uid, time, wait):
+        return {"guild_id": GID, "user_id": uid, "mod_id": "3", "reason": "ok", "time": time, "wait_seconds": wait}
+
+    await store.insert_records("verify", [
+        verify("10", "2026-01-01 10:00:00", 30.0),
+        verify("11", "2026-01-03 10:00:00", 60.0),
+        verify("12", "2026-01-04 10:00:00", None),  # verified before waits were recorded
+        verify("13", "2025-12-01 10:00:00", 5.0),   # before `since`
+        dict(verify("14", "2026-01-02 10:00:00", 90.0), guild_id=OTHER_GID),
+    ])
+    assert await store.verify_waits(GID, "2026-01-01 00:00:00") == [60.0, 30.0]
+    assert await store.verify_waits(GID, "2026-01-01 00:00:00", limit=1) == [60.0]
+
+
+async def test_mod_actions(store):
+    def action(entry_id, mod="7", kind="ban", time="2026-01-02 10:00:00", gid=GID):
+        return {"guild_id": gid, "entry_id": entry_id, "user_id": "10", "mod_id": mod, "action": kind, "reason": None, "time": time}
+
+    assert await store.insert_mod_actions([]) == 0
+    assert await store.insert_mod_actions([action("1"), action("2", kind="kick"), action("3", mod="8")]) == 3
+    # Audit log entries seen again on the next pass are skipped, new ones still go in
+    assert await store.insert_mod_actions([action("2", kind="kick"), action("4", time="2025-12-01 10:00:00"), action("5", gid=OTHER_GID)]) == 2
+
+    assert await store.count_mod_actions(GID, "2026-01-01 00:00:00") == {"7": {"ban": 1, "kick": 1}, "8": {"ban": 1}}
+    assert await store.count_mod_actions(OTHER_GID, "2026-01-01 00:00:00") == {"7": {"ban": 1}}
+
+
+@pytest.mark.mongo_server
+async def test_search_ranking_paging_and_reindex(store):
+    weak = await store.insert_record("warn", warn(reason="posted one scam link among a lot of other harmless chatter today"))
+    strong = await store.insert_record("warn", warn(reason="scam scam scam"))
+    await store.insert_record("warn", warn(reason="spamming", time="2025-06-01 10:00:00"))
+
+    ranked = await store.search_records(GID, ["scam"])
+    assert [r["_id"] for r in ranked] == [strong, weak]
+    assert ranked[0]["score"] > ranked[1]["score"]
+    # Pages slice the same ranking
+    assert [r["_id"] for r in await store.search_records(GID, ["scam"], limit=1)] == [strong]
+    assert [r["_id"] for r in await store.search_records(GID, ["scam"], limit=1, offset=1)] == [weak]
+    assert await store.search_records(GID, ["scam"], limit=1, offset=2) == []
+    # Stemmed: "spam" finds "spamming", and `since` drops it again
+    assert len(await store.search_records(GID, ["spam"])) == 1
+    assert await store.search_records(GID, ["spam"], since="2026-01-01 00:00:00") == []
+
+    # Edits and deletes are reflected in the index
+    await store.update_record("warn", GID, weak, {"reason": "` E ` raid"})
+    assert [r["_id"] for r in await store.search_records(GID, ["scam"])] == [strong]
+    assert [r["_id"] for r in await store.search_records(GID, ["raid"])] == [weak]
+    await store.delete_record("warn", GID, strong)
+    assert await store.search_records(GID, ["scam"]) == []
+
+    # A jail matches on its free reason too, and `since` applies to jailed_at
+    await store.open_jail(dict(jail(jailed_at="2026-02-01 10:00:00"), reason="raid"))
+    await store.close_active_jail(GID, "10", free_by="1", free_reason="appealed scam ban", freed_at="2026-02-02 10:00:00")
+    hits = await store.search_records(GID, ["appealed"], since="2026-02-01 00:00:00")
+    assert [(h["kind"], h["free_reason"]) for h in hits] == [("jail", "appealed scam ban")]
+    assert await store.search_records(GID, ["appealed"], since="2026-02-01 10:00:01") == []